@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+from benchmarks import strips, suite
+
+
+def main():
+    args = extract_args()
+    args.command(args)
+
+
+def extract_args():
+    parser = argparse.ArgumentParser(description="Times Comic Compiler on synthetic webtoon strips")
+    subparsers = parser.add_subparsers(dest="command_name", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Generate a synthetic strip and time compiling it")
+    run_parser.add_argument("-o", "--output", default="benchmark-results.json",
+                            help="The JSON file to save the results to")
+    run_parser.add_argument("--width", default=800, type=int, help="Width of the generated input images")
+    run_parser.add_argument("--image-count", default=40, type=int, help="Number of generated input images")
+    run_parser.add_argument("--image-height", default=2000, type=int, help="Height of each generated input image")
+    run_parser.add_argument("--gutter-spacing", default=1400, type=int,
+                            help="Average number of rows from the start of one gutter to the start of the next")
+    run_parser.add_argument("--gutter-height", default=120, type=int, help="Height of each gutter")
+    run_parser.add_argument("--noise", default=12, type=float,
+                            help="Standard deviation of the grain added to the panels")
+    run_parser.add_argument("--seed", default=0, type=int, help="Seed for the generated strip")
+    run_parser.add_argument("--backend", default="pillow", choices=["pillow", "magick"])
+    run_parser.add_argument("-j", "--jobs", default=1, type=int)
+    run_parser.add_argument("--repeat", default=3, type=int,
+                            help="How many times to run each case, the fastest run of each is kept")
+    run_parser.set_defaults(command=run)
+
+    compare_parser = subparsers.add_parser("compare", help="Compare results against a baseline and flag regressions")
+    compare_parser.add_argument("baseline", help="The JSON results to compare against")
+    compare_parser.add_argument("results", help="The JSON results to check")
+    compare_parser.add_argument("--tolerance", default=0.15, type=float,
+                                help="How much worse (as a fraction of the baseline) a figure can get before it is "
+                                     "flagged")
+    compare_parser.set_defaults(command=compare)
+
+    # Used by 'run' so that every case is measured in a fresh process
+    case_parser = subparsers.add_parser("case")
+    case_parser.add_argument("input_directory")
+    case_parser.add_argument("output_directory")
+    case_parser.add_argument("mode", choices=list(suite.breakpoint_modes.keys()))
+    case_parser.add_argument("result_file")
+    case_parser.add_argument("--backend", default="pillow")
+    case_parser.add_argument("--jobs", default=1, type=int)
+    case_parser.set_defaults(command=case)
+
+    return parser.parse_args()
+
+
+def run(args):
+    settings = strips.StripSettings(args.width, args.image_count, args.image_height, args.gutter_spacing,
+                                    args.gutter_height, args.noise, args.seed)
+    working_directory = tempfile.mkdtemp(prefix="comicom-benchmark")
+    try:
+        print("Generating strip: " + str(settings))
+        strips.generate(settings, working_directory + os.sep + "input")
+        results = suite.run_suite(working_directory + os.sep + "input", working_directory + os.sep + "output",
+                                  args.backend, args.jobs, args.repeat, settings.describe())
+    finally:
+        shutil.rmtree(working_directory, ignore_errors=True)
+
+    with open(args.output, 'w', encoding="utf-8") as file:
+        json.dump(results, file, indent=2)
+
+    for (case_name, result) in results["cases"].items():
+        print("")
+        print("{case}: {seconds:.2f}s, {pages} pages, {subprocesses} subprocesses, peak RSS {rss}"
+              .format(case=case_name, seconds=result["total_seconds"], pages=result["page_count"],
+                      subprocesses=result["subprocess_count"],
+                      rss="unknown" if result["peak_rss_mb"] is None else "{:.0f}MB".format(result["peak_rss_mb"])))
+        for (stage, seconds) in result["stages"].items():
+            print("  {stage:<10}{seconds:>8.3f}s".format(stage=stage, seconds=seconds))
+    print("")
+    print("Saved results to: " + args.output)
+
+
+def compare(args):
+    with open(args.baseline, 'r', encoding="utf-8") as file:
+        baseline = json.load(file)
+    with open(args.results, 'r', encoding="utf-8") as file:
+        results = json.load(file)
+
+    if baseline.get("settings") != results.get("settings"):
+        print("Warning: the baseline was run on a different strip, the comparison may not mean much")
+
+    regressions = suite.compare(baseline, results, args.tolerance)
+    for regression in regressions:
+        print("REGRESSION {case} {metric}: {baseline:.3f} -> {result:.3f}".format(**regression))
+    if len(regressions) == 0:
+        print("No regressions found (tolerance {:.0%})".format(args.tolerance))
+    sys.exit(1 if len(regressions) > 0 else 0)
+
+
+def case(args):
+    result = suite.run_case(args.input_directory, args.output_directory, args.mode, args.backend, args.jobs)
+    with open(args.result_file, 'w', encoding="utf-8") as file:
+        json.dump(result, file)
+
+
+if __name__ == '__main__':
+    main()
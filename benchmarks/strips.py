@@ -0,0 +1,67 @@
+import os
+
+import numpy
+
+from PIL import Image
+
+
+class StripSettings:
+    def __init__(self, width=800, image_count=40, image_height=2000, gutter_spacing=1400, gutter_height=120, noise=12,
+                 seed=0):
+        self.width = width
+        self.image_count = image_count
+        self.image_height = image_height
+        # The average number of rows between the start of one gutter and the start of the next
+        self.gutter_spacing = gutter_spacing
+        self.gutter_height = gutter_height
+        # Standard deviation of the grain added to panels, so they don't compress (or analyse) unrealistically well
+        self.noise = noise
+        self.seed = seed
+
+    def describe(self):
+        return dict(self.__dict__)
+
+    def __str__(self):
+        return "StripSettings{" + ", ".join(map(lambda item: "{} = {}".format(*item), self.__dict__.items())) + "}"
+
+
+def generate(settings, output_directory):
+    # A webtoon-like strip of panels separated by white gutters, cut into equally tall input files. Panels run
+    # straight across file boundaries, the same way scanlation sites cut up their chapters.
+    rng = numpy.random.default_rng(settings.seed)
+    total_height = settings.image_count * settings.image_height
+    strip = numpy.full((total_height, settings.width, 3), 255, dtype=numpy.uint8)
+
+    row = int(rng.integers(0, settings.gutter_spacing))
+    while row < total_height:
+        panel_height = max(1, int(rng.normal(settings.gutter_spacing, settings.gutter_spacing / 4))
+                           - settings.gutter_height)
+        _draw_panel(strip, rng, row, min(total_height, row + panel_height), settings.noise)
+        row += panel_height + settings.gutter_height
+
+    os.makedirs(output_directory, exist_ok=True)
+    paths = []
+    for index in range(settings.image_count):
+        path = os.path.join(output_directory, "strip{index:04d}.jpg".format(index=index))
+        image_rows = strip[index * settings.image_height:(index + 1) * settings.image_height]
+        Image.fromarray(image_rows).save(path, quality=90)
+        paths.append(path)
+    return paths
+
+
+def _draw_panel(strip, rng, top, bottom, noise):
+    width = strip.shape[1]
+    border = max(1, width // 40)
+    # A flat background with a few blocks of 'art' on it, then grain over the whole panel
+    panel = numpy.empty((bottom - top, width - 2 * border, 3), dtype=numpy.float32)
+    panel[:] = rng.integers(40, 220, size=3)
+    for _ in range(int(rng.integers(2, 6))):
+        block_top = int(rng.integers(0, max(1, panel.shape[0] - 10)))
+        block_left = int(rng.integers(0, max(1, panel.shape[1] - 10)))
+        block_bottom = min(panel.shape[0], block_top + int(rng.integers(10, max(11, panel.shape[0] // 2))))
+        block_right = min(panel.shape[1], block_left + int(rng.integers(10, max(11, panel.shape[1] // 2))))
+        panel[block_top:block_bottom, block_left:block_right] = rng.integers(0, 256, size=3)
+    if noise > 0:
+        panel += rng.normal(0, noise, size=panel.shape).astype(numpy.float32)
+    strip[top:bottom, :] = 0
+    strip[top:bottom, border:width - border] = numpy.clip(panel, 0, 255).astype(numpy.uint8)
@@ -0,0 +1,166 @@
+import collections
+import functools
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from unittest import mock
+
+from comiccompiler import arguments
+from comiccompiler import compiler
+from comiccompiler import version
+
+
+# The compiler steps timed on their own, in the order they run
+stages = [
+    ("load", "_get_input_images"),
+    ("normalise", "_ensure_consistent_width"),
+    ("analyse", "_analyse_images"),
+    ("predict", "_predict_appropriate_breakpoint_mode"),
+    ("plan", "_combine_images"),
+    ("orphan", "_handle_potential_orphan_page"),
+    ("render", "_render_pages")
+]
+breakpoint_modes = {"static": 0, "dynamic": 1}
+# Timings that change by less than this are noise, however large a percentage they are
+min_regression_seconds = 0.05
+
+
+def run_case(input_directory, output_directory, mode, backend="pillow", jobs=1):
+    # Runs one compilation in this process and measures it, the caller is expected to give every case a fresh process
+    # so peak memory use isn't carried over from the one before
+    timings = collections.OrderedDict((name, 0.0) for (name, function_name) in stages)
+    subprocess_count = [0]
+
+    def timed(name, function):
+        @functools.wraps(function)
+        def run(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                timings[name] += time.perf_counter() - start
+        return run
+
+    def predict_then_force_mode(*args, **kwargs):
+        # Always time the prediction, but compile with the mode being benchmarked
+        original_predict(*args, **kwargs)
+        return breakpoint_modes[mode]
+
+    class CountingPopen(subprocess.Popen):
+        def __init__(self, *args, **kwargs):
+            subprocess_count[0] += 1
+            super().__init__(*args, **kwargs)
+
+    original_predict = timed("predict", compiler._predict_appropriate_breakpoint_mode)
+    patches = [mock.patch.object(compiler, function_name, timed(name, getattr(compiler, function_name)))
+               for (name, function_name) in stages if name != "predict"]
+    patches.append(mock.patch.object(compiler, "_predict_appropriate_breakpoint_mode", predict_then_force_mode))
+    patches.append(mock.patch.object(subprocess, "Popen", CountingPopen))
+
+    args = arguments.parse(["-f", input_directory + os.sep + "*.jpg", "-od", output_directory + os.sep, "--clean",
+                            "--rebuild", "--no-cache", "--error", "-b", "-1", "--backend", backend,
+                            "--jobs", str(jobs)])
+    start = time.perf_counter()
+    for patch in patches:
+        patch.start()
+    try:
+        compiler.run(args)
+    finally:
+        for patch in patches:
+            patch.stop()
+    total_seconds = time.perf_counter() - start
+
+    return {
+        "total_seconds": total_seconds,
+        "stages": timings,
+        "page_count": len([name for name in os.listdir(output_directory) if name.endswith(args.extension)]),
+        "subprocess_count": subprocess_count[0],
+        "peak_rss_mb": _get_peak_rss_mb()
+    }
+
+
+def run_suite(input_directory, output_directory, backend="pillow", jobs=1, repeat=3, settings=None):
+    cases = collections.OrderedDict()
+    for mode in breakpoint_modes:
+        runs = []
+        for _ in range(repeat):
+            runs.append(_run_case_in_new_process(input_directory, output_directory, mode, backend, jobs))
+        cases[mode] = _summarise_runs(runs)
+
+    return {
+        "comicom_version": version.full,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "backend": backend,
+        "jobs": jobs,
+        "repeat": repeat,
+        "settings": settings,
+        "cases": cases
+    }
+
+
+def compare(baseline, results, tolerance):
+    # Every timing or memory figure that got worse by more than the tolerance (as a fraction of the baseline)
+    regressions = []
+    for (case_name, case) in results["cases"].items():
+        baseline_case = baseline["cases"].get(case_name)
+        if baseline_case is None:
+            continue
+        metrics = [("total_seconds", baseline_case["total_seconds"], case["total_seconds"], min_regression_seconds)]
+        for (stage_name, seconds) in case["stages"].items():
+            if stage_name in baseline_case["stages"]:
+                metrics.append(("stages." + stage_name, baseline_case["stages"][stage_name], seconds,
+                                min_regression_seconds))
+        for metric in ["peak_rss_mb", "subprocess_count"]:
+            if baseline_case.get(metric) is not None and case.get(metric) is not None:
+                metrics.append((metric, baseline_case[metric], case[metric], 0))
+
+        for (metric, before, after, min_change) in metrics:
+            if after - before > max(before * tolerance, min_change):
+                regressions.append({"case": case_name, "metric": metric, "baseline": before, "result": after})
+    return regressions
+
+
+def _run_case_in_new_process(input_directory, output_directory, mode, backend, jobs):
+    result_file = output_directory + "-result.json"
+    command = [sys.executable, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                            "benchmark.py"),
+               "case", input_directory, output_directory, mode, result_file, "--backend", backend, "--jobs", str(jobs)]
+    subprocess.run(command, check=True)
+    try:
+        with open(result_file, 'r', encoding="utf-8") as file:
+            return json.load(file)
+    finally:
+        os.remove(result_file)
+
+
+def _summarise_runs(runs):
+    # Fastest of each timing (the others only measure how busy the machine was), but the most memory any run needed
+    summary = {
+        "total_seconds": min(map(lambda run: run["total_seconds"], runs)),
+        "stages": collections.OrderedDict((name, min(map(lambda run: run["stages"][name], runs)))
+                                          for (name, function_name) in stages),
+        "page_count": runs[0]["page_count"],
+        "subprocess_count": max(map(lambda run: run["subprocess_count"], runs)),
+        "peak_rss_mb": None
+    }
+    if all(run["peak_rss_mb"] is not None for run in runs):
+        summary["peak_rss_mb"] = max(map(lambda run: run["peak_rss_mb"], runs))
+    return summary
+
+
+def _get_peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        # Not available on Windows
+        return None
+    # This process plus the largest of its children (page writers or ImageMagick), so an upper bound of the true peak
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss + resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # Reported in kilobytes on Linux, but bytes on macOS
+    if sys.platform == "darwin":
+        return peak / (1024 * 1024)
+    return peak / 1024
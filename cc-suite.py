@@ -7,37 +7,51 @@ import os
 import re
 import shutil
 import subprocess
-import tempfile
-from timeit import default_timer
 
-from PIL import Image
+import natsort
 
-from comiccompiler import localfiles, waifu, imgmag, logger, downloader, arguments, compiler
+from comiccompiler import localfiles, waifu, waifucache, logger, downloader, arguments, compiler, pipeline, adindex
 
 
 def main():
     args = extract_args()
     logger.info("Processing series [{series}] chapter(s) {chapter}".format(series=args.series, chapter=args.chapters))
 
-    for chapter in args.chapters:
-        series_config = load_config(args.series)
-        folders = Directories(series_config.working_directory, series_config.folder_name)
-        logger.info("")
-        logger.info("Processing series [{series}] chapter {chapter}".format(series=args.series, chapter=chapter))
+    suite_config = load_config(args.series)
+    chapters = list(map(lambda chapter: _prepare_chapter(args.series, chapter), args.chapters))
 
-        split_on_decimal = chapter.split(".")
-        folders.chapter_folder_name = "ch" + str(split_on_decimal[0]).zfill(3)
-        if len(split_on_decimal) > 1:
-            folders.chapter_folder_name += "." + split_on_decimal[1]
-        folders.input_chapter = folders.input + folders.chapter_folder_name + "/"
-        folders.compiled_chapter = folders.compiled + folders.chapter_folder_name + "/"
+    # Chapters move through the stages one after another, so the next chapter can be downloading or waifu'ing while
+    # the previous one is compiling
+    chapter_pipeline = pipeline.Pipeline([
+        pipeline.Stage("download", lambda chapter: _ensure_input_images(chapter.series_config, chapter.folders,
+                                                                        chapter.number, args.skip_download),
+                       suite_config.download_workers),
+        pipeline.Stage("ads", lambda chapter: _remove_ads(chapter.series_config, chapter.folders),
+                       suite_config.ads_workers),
+        pipeline.Stage("waifu", lambda chapter: _waifu_input(chapter.series_config, chapter.folders),
+                       suite_config.waifu_workers),
+        pipeline.Stage("compile", lambda chapter: _compile_input(chapter.series_config, chapter.folders, args.series),
+                       suite_config.compile_workers)
+    ], suite_config.queue_size)
+    chapter_pipeline.run(chapters)
 
-        if not _ensure_input_images(series_config, folders, chapter, args.skip_download):
-            continue
+    logger.info("")
+    logger.info("Processed {chapter_count} chapter(s) of series [{series}]:\n{summary}"
+                .format(chapter_count=len(chapters), series=args.series, summary=chapter_pipeline.get_summary()))
 
-        _remove_ads(series_config, folders)
-        _waifu_input(series_config, folders)
-        _compile_input(series_config, folders, args.series)
+
+def _prepare_chapter(series, chapter):
+    series_config = load_config(series)
+    folders = Directories(series_config.working_directory, series_config.folder_name)
+
+    split_on_decimal = chapter.split(".")
+    folders.chapter_folder_name = "ch" + str(split_on_decimal[0]).zfill(3)
+    if len(split_on_decimal) > 1:
+        folders.chapter_folder_name += "." + split_on_decimal[1]
+    folders.input_chapter = folders.input + folders.chapter_folder_name + "/"
+    folders.compiled_chapter = folders.compiled + folders.chapter_folder_name + "/"
+
+    return Chapter(series, chapter, series_config, folders)
 
 
 def extract_args():
@@ -78,64 +92,56 @@ def _ensure_input_images(series_config, directories, chapter, skip_download):
 def _remove_ads(series_config, folders):
     if len(series_config.ads_folder) > 0:
         logger.info("Checking folder for ads to remove: " + series_config.ads_folder)
-        ads = glob.glob(series_config.ads_folder + "*.*")
-        input_files = glob.glob(folders.input_chapter + "*.jp*g")
+        ads = adindex.load(series_config.ads_folder)
+        # In the same order the pages get compiled in, so walking in from either end finds the first/last pages
+        input_files = natsort.natsorted(glob.glob(folders.input_chapter + "*.jp*g"))
         if len(ads) == 0 or len(input_files) == 0:
             return
 
-        logger.info("Checking for any input images that roughly match these ad files: " + str(ads))
-        i = len(input_files) - 1
-        while any(imgmag.almost_matches(input_files[i], ad) for ad in ads):
-            logger.info("Removing ad: " + input_files[i])
-            os.remove(input_files[i])
-            i -= 1
+        logger.info("Checking for any input images that roughly match the {ad_count} indexed ad files"
+                    .format(ad_count=len(ads)))
+        last = len(input_files) - 1
+        while last >= 0 and _remove_if_ad(ads, input_files[last]):
+            last -= 1
 
-        i = 0
-        while any(imgmag.almost_matches(input_files[i], ad) for ad in ads):
-            logger.info("Removing ad: " + input_files[i])
-            os.remove(input_files[i])
-            i += 1
+        first = 0
+        while first < last and _remove_if_ad(ads, input_files[first]):
+            first += 1
+
+
+def _remove_if_ad(ads, input_file):
+    matching_ad = ads.find_match(input_file)
+    if matching_ad is None:
+        return False
+    logger.info("Removing ad: " + input_file + " (matches " + matching_ad + ")")
+    os.remove(input_file)
+    return True
 
 
 def _waifu_input(series_config, folders):
     if len(series_config.waifu_key) > 0:
         logger.info("Detected waifu key")
         if len(glob.glob(folders.input_chapter + "*waifud.*")) == 0:
-            input_files = glob.glob(folders.input_chapter + "*.*")
-
-            temp_directory = tempfile.mkdtemp(prefix="prewaifu") + "/"
-            logger.info("Processing with waifu using temp directory: " + temp_directory)
-            for input_file in input_files:
-                split_to_temp(input_file, temp_directory)
-
-            starttime = default_timer()
-            results = waifu.waifu(series_config.waifu_key, temp_directory + "*.*", folders.input_chapter)
-            elapsed = default_timer() - starttime
-
-            logger.info("Waifu'd " + str(len(results)) + " files in {:5.2f}s".format(elapsed))
-            shutil.rmtree(temp_directory, ignore_errors=True)
+            # Images too tall for one upload are tiled (and put back together) in memory, so every input image ends
+            # up as exactly one waifu'd image
+            waifu.waifu(series_config.waifu_key, folders.input_chapter + "*.*", folders.input_chapter,
+                        series_config.waifu_concurrency, cache=_get_waifu_cache(series_config))
 
         if len(series_config.arguments) > 0:
             series_config.arguments += " "
         series_config.arguments += "-f " + folders.input_chapter + "*-waifud.jp*g"
 
 
-def split_to_temp(filepath, temp_directory):
+def _get_waifu_cache(series_config):
+    if series_config.waifu_cache_megabytes <= 0:
+        return None
+    cache_directory = localfiles.get_cache_directory() + os.sep + "waifu"
     try:
-        image = Image.open(filepath)
-        # Create temp folder and copy files over (if <=800px high)
-        if image.height <= 800:
-            shutil.copy(filepath, temp_directory)
-        else:
-            # If >800px then waifu will return a file that isn't 2x width
-            # (which will cause issues for compilation)
-            print("Image was too tall to send to waifu (>800px), splitting before waifu: " + filepath)
-            path, filename = os.path.split(filepath)
-            filename_noext, extension = filename.split('.')
-            imgmag.split(filepath, 800, temp_directory + filename_noext, extension)
-        image.close()
-    except IOError:
-        pass
+        return waifucache.WaifuCache(cache_directory, series_config.waifu_cache_megabytes * 1024 * 1024)
+    except OSError as error:
+        logger.warn("Could not use the waifu cache in {directory}, continuing without it: {error}"
+                    .format(directory=cache_directory, error=error))
+        return None
 
 
 def _compile_input(series_config, folders, series):
@@ -222,6 +228,18 @@ class DecimalOrIntRange(argparse.Action):
         return re.fullmatch(r"\d+(.\d+)?", param)
 
 
+class Chapter:
+
+    def __init__(self, series, number, series_config, folders):
+        self.series = series
+        self.number = number
+        self.series_config = series_config
+        self.folders = folders
+
+    def __str__(self):
+        return "[{series}] chapter {number}".format(series=self.series, number=self.number)
+
+
 class SeriesConfig:
     working_directory = None
     folder_name = None
@@ -230,6 +248,13 @@ class SeriesConfig:
     ads_folder = None
     waifu_key = None
     arguments = ""
+    download_workers = 1
+    ads_workers = 1
+    waifu_workers = 1
+    waifu_concurrency = 10
+    waifu_cache_megabytes = 1000
+    compile_workers = 1
+    queue_size = 1
 
     def __init__(self, config_dict):
         self.load(config_dict)
@@ -247,6 +272,25 @@ class SeriesConfig:
             self.ads_folder = source_dict["ads_folder"]
         if "waifu_key" in source_dict:
             self.waifu_key = source_dict["waifu_key"]
+        if "download_workers" in source_dict:
+            self.download_workers = int(source_dict["download_workers"])
+        if "ads_workers" in source_dict:
+            self.ads_workers = int(source_dict["ads_workers"])
+        if "waifu_workers" in source_dict:
+            self.waifu_workers = int(source_dict["waifu_workers"])
+        if "waifu_concurrency" in source_dict:
+            self.waifu_concurrency = int(source_dict["waifu_concurrency"])
+        if "waifu_cache_megabytes" in source_dict:
+            self.waifu_cache_megabytes = int(source_dict["waifu_cache_megabytes"])
+        if "compile_workers" in source_dict:
+            self.compile_workers = int(source_dict["compile_workers"])
+            # Each compilation sets the logging level and profiler for the whole process, so two at once would
+            # overwrite each other's
+            if self.compile_workers > 1:
+                logger.warn("compile_workers can only be 1, ignoring compile_workers=" + str(self.compile_workers))
+                self.compile_workers = 1
+        if "queue_size" in source_dict:
+            self.queue_size = int(source_dict["queue_size"])
         if "arguments" in source_dict:
             if self.arguments is not None and len(self.arguments) > 0:
                 self.arguments += " "
@@ -1,5 +1,6 @@
 #!/usr/bin/env python
 
+import multiprocessing
 import tkinter
 
 from comiccompiler import comgui
@@ -8,6 +9,8 @@ from comiccompiler import arguments
 
 # execute only if run as a script
 if __name__ == "__main__":
+    # Pages are written by worker processes with -j, which a frozen (PyInstaller) build starts as copies of itself
+    multiprocessing.freeze_support()
     # Trigger the args parsing before launching in order to catch things like help and version
     arguments.parse()
 
@@ -0,0 +1,154 @@
+import glob
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy
+
+from PIL import Image
+
+from . import localfiles
+from . import logger
+
+
+index_version = 1
+# Out of the 64 bits in a difference hash, re-encoded or slightly shifted copies of the same image stay well inside this
+max_hamming_distance = 10
+# Same threshold as imgmag.almost_matches, which accepts a normalised error of "0.0..." or "0.1..."
+max_normalised_error = 0.2
+
+
+class AdIndex:
+    # Difference hashes of every image in the ads folder, grouped by size, so a candidate only needs decoding if an ad
+    # has its exact dimensions and only needs comparing pixel by pixel if their hashes are close
+    def __init__(self, entries):
+        self.entries = entries
+        self.confirm_count = 0
+        self._entries_by_size = {}
+        for entry in entries:
+            self._entries_by_size.setdefault((entry["width"], entry["height"]), []).append(entry)
+
+    def find_match(self, path):
+        try:
+            with Image.open(path) as image:
+                size = (image.width, image.height)
+                if size not in self._entries_by_size:
+                    return None
+                image_hash = difference_hash(image)
+        except IOError:
+            return None
+
+        near_hits = sorted(filter(lambda entry: hamming_distance(entry["hash"], image_hash) <= max_hamming_distance,
+                                  self._entries_by_size[size]),
+                           key=lambda entry: hamming_distance(entry["hash"], image_hash))
+        for entry in near_hits:
+            self.confirm_count += 1
+            if pixels_match(path, entry["path"]):
+                return entry["path"]
+        return None
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def load(ads_folder, index_path=None):
+    # Re-uses the saved index when nothing in the folder has changed, and only hashes new or modified ads otherwise
+    if index_path is None:
+        index_path = _get_index_path(ads_folder)
+
+    files = _get_ad_files(ads_folder)
+    signature = _get_signature(files)
+    saved_index = _load_saved_index(index_path)
+    if saved_index is not None and saved_index["signature"] == signature:
+        logger.debug("Using saved ad index: " + index_path)
+        return AdIndex(saved_index["entries"])
+
+    logger.info("Ads folder has changed, updating ad index: " + index_path)
+    saved_entries = {}
+    if saved_index is not None:
+        saved_entries = dict(map(lambda entry: (entry["path"], entry), saved_index["entries"]))
+
+    entries = []
+    for (path, size, modified) in files:
+        saved_entry = saved_entries.get(path)
+        if saved_entry is not None and saved_entry["size"] == size and saved_entry["modified"] == modified:
+            entries.append(saved_entry)
+            continue
+        try:
+            with Image.open(path) as image:
+                entries.append({"path": path, "size": size, "modified": modified, "width": image.width,
+                                "height": image.height, "hash": difference_hash(image)})
+        except IOError:
+            logger.warn("Found file in the ads folder that was not an image, skipping: " + path)
+
+    _save_index(index_path, {"version": index_version, "signature": signature, "entries": entries})
+    return AdIndex(entries)
+
+
+def difference_hash(image):
+    # 64 bits, one per pair of horizontally neighbouring pixels in a 9x8 thumbnail: set when the left one is brighter
+    image.draft("L", (9, 8))
+    thumbnail = numpy.asarray(image.convert("L").resize((9, 8), Image.BOX), dtype=numpy.int16)
+    bits = (thumbnail[:, :-1] > thumbnail[:, 1:]).flatten()
+    return int("".join("1" if bit else "0" for bit in bits), 2)
+
+
+def hamming_distance(first_hash, second_hash):
+    return bin(first_hash ^ second_hash).count("1")
+
+
+def pixels_match(first_path, second_path):
+    with Image.open(first_path) as first_image, Image.open(second_path) as second_image:
+        if first_image.size != second_image.size:
+            return False
+        first_pixels = numpy.asarray(first_image.convert("RGB"), dtype=numpy.float64)
+        second_pixels = numpy.asarray(second_image.convert("RGB"), dtype=numpy.float64)
+    normalised_error = numpy.sqrt(numpy.mean(numpy.square(first_pixels - second_pixels))) / 255
+    logger.verbose("Ad comparison error for {first} and {second}: {error}"
+                   .format(first=first_path, second=second_path, error=normalised_error))
+    return normalised_error < max_normalised_error
+
+
+def _get_ad_files(ads_folder):
+    files = []
+    for path in sorted(glob.glob(ads_folder + "*.*")):
+        stat = os.stat(path)
+        files.append((path, stat.st_size, stat.st_mtime_ns))
+    return files
+
+
+def _get_signature(files):
+    signature = hashlib.blake2b(str(index_version).encode("utf-8"), digest_size=16)
+    for (path, size, modified) in files:
+        signature.update("{path}:{size}:{modified}\n".format(path=path, size=size, modified=modified).encode("utf-8"))
+    return signature.hexdigest()
+
+
+def _get_index_path(ads_folder):
+    folder_hash = hashlib.blake2b(os.path.abspath(ads_folder).encode("utf-8"), digest_size=8).hexdigest()
+    return os.path.join(localfiles.get_cache_directory(), "ad-index-" + folder_hash + ".json")
+
+
+def _load_saved_index(index_path):
+    if not os.path.exists(index_path):
+        return None
+    try:
+        with open(index_path, 'r', encoding="utf-8") as file:
+            saved_index = json.load(file)
+    except (OSError, ValueError) as error:
+        logger.debug("Could not read saved ad index, rebuilding it: " + str(error))
+        return None
+    if saved_index.get("version") != index_version:
+        return None
+    return saved_index
+
+
+def _save_index(index_path, index):
+    # Written to a temp file first so a run that's reading the index at the same time never sees half of it
+    index_directory = os.path.dirname(index_path)
+    os.makedirs(index_directory, exist_ok=True)
+    (file_descriptor, temp_path) = tempfile.mkstemp(suffix=".tmp", dir=index_directory)
+    with os.fdopen(file_descriptor, 'w', encoding="utf-8") as file:
+        json.dump(index, file)
+    os.replace(temp_path, index_path)
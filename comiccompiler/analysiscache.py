@@ -0,0 +1,45 @@
+import hashlib
+
+import numpy
+
+from . import diskcache
+from . import rowstats
+
+
+# Bump whenever the row profile calculation changes, so older entries stop matching instead of being trusted
+analysis_version = 1
+entry_extension = ".npz"
+
+
+class AnalysisCache(diskcache.DiskCache):
+    # Row profiles keyed by the content of the input file (plus whatever changes the decoded pixels)
+    def __init__(self, directory, max_bytes):
+        super().__init__(directory, max_bytes, entry_extension, "analysis")
+
+    def get_key(self, content_hash, width, resample_filter):
+        parameters = "{version}:{width}:{resample_filter}".format(version=analysis_version, width=width,
+                                                                  resample_filter=resample_filter)
+        return content_hash + "-" + hashlib.blake2b(parameters.encode("utf-8"), digest_size=4).hexdigest()
+
+    def load(self, key):
+        return self._read_entry(key, _read_profile)
+
+    def store(self, key, profile):
+        self._write_entry(key, lambda file: _write_profile(file, profile))
+
+
+def _read_profile(path):
+    with numpy.load(path) as entry:
+        return rowstats.RowProfile(entry["mean"].astype(numpy.float64),
+                                   entry["standard_deviation"].astype(numpy.float64),
+                                   entry["minimum"].astype(numpy.float64),
+                                   entry["maximum"].astype(numpy.float64),
+                                   entry["first_row"], entry["last_row"])
+
+
+def _write_profile(file, profile):
+    # Statistics are whole numbers on ImageMagick's 0-65535 scale, so they fit losslessly in 16 bits
+    numpy.savez(file, mean=profile.mean.astype(numpy.uint16),
+                standard_deviation=profile.standard_deviation.astype(numpy.uint16),
+                minimum=profile.minimum.astype(numpy.uint16), maximum=profile.maximum.astype(numpy.uint16),
+                first_row=profile.first_row, last_row=profile.last_row)
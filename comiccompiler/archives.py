@@ -0,0 +1,106 @@
+import fnmatch
+import glob
+import hashlib
+import io
+import os
+import re
+import tempfile
+import zipfile
+
+import natsort
+
+
+# Images inside an archive are referred to as 'path/to/chapter.cbz/member/name.jpg'
+archive_pattern = re.compile(r"^(.*?\.(?:zip|cbz))(?:[/\\](.*))?$", re.IGNORECASE)
+
+
+def is_archive(path):
+    match = archive_pattern.match(path)
+    return match is not None and not match.group(2)
+
+
+def split_member_path(path):
+    # The (archive, member) an image path refers to, or (None, path) for a normal file
+    match = archive_pattern.match(path)
+    if match is None or not match.group(2) or not os.path.isfile(match.group(1)):
+        return None, path
+    return match.group(1), match.group(2).replace("\\", "/")
+
+
+def is_member(path):
+    return split_member_path(path)[0] is not None
+
+
+def glob_files(pattern):
+    # Like glob.glob, except 'chapter.cbz' (or 'chapter.cbz/*.jpg' to only take some of them) matches the files inside
+    # the archive, in natural order, without extracting any of them
+    match = archive_pattern.match(pattern)
+    if match is None:
+        return glob.glob(pattern)
+
+    member_pattern = match.group(2) or "*"
+    paths = []
+    for archive_path in natsort.natsorted(glob.glob(match.group(1))):
+        if not os.path.isfile(archive_path):
+            continue
+        with zipfile.ZipFile(archive_path) as archive:
+            names = [info.filename for info in archive.infolist() if not info.is_dir()]
+        names = natsort.natsorted(filter(lambda name: fnmatch.fnmatch(name, member_pattern), names))
+        paths += list(map(lambda name: archive_path + "/" + name, names))
+    return paths
+
+
+def get_file(path):
+    # Something Pillow can open: the path itself, or the bytes of an archive member read into memory
+    (archive_path, member) = split_member_path(path)
+    if archive_path is None:
+        return path
+    with zipfile.ZipFile(archive_path) as archive:
+        return io.BytesIO(archive.read(member))
+
+
+def extract(path, directory):
+    # For tools that can only read real files (ImageMagick), each member gets its own folder so names can't clash
+    (archive_path, member) = split_member_path(path)
+    with zipfile.ZipFile(archive_path) as archive:
+        return archive.extract(member, tempfile.mkdtemp(dir=directory))
+
+
+class ArchiveWriter:
+    # Pages are stored as they are (they're already compressed) into a temporary archive next to the final one, which
+    # only replaces it once every page has been written
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        (handle, self.temp_path) = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        os.close(handle)
+        self._archive = zipfile.ZipFile(self.temp_path, 'w', zipfile.ZIP_STORED)
+        # Same hashes as localfiles.hash_file would give the pages if they'd been written as files
+        self.checksums = {}
+
+    def write(self, name, data):
+        self._archive.writestr(name, data)
+        self.checksums[name] = hashlib.blake2b(data, digest_size=16).hexdigest()
+
+    def close(self):
+        self._archive.close()
+        # mkstemp only lets the owner read the file, the archive should end up like any other file the user writes
+        os.chmod(self.temp_path, file_mode)
+        os.replace(self.temp_path, self.path)
+
+    def discard(self):
+        self._archive.close()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+
+def _get_file_mode():
+    # The umask can only be read by setting it, so it's put straight back
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+# Read once on import, before any worker threads could be creating files while the umask is briefly 0
+file_mode = _get_file_mode()
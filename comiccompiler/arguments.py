@@ -23,9 +23,26 @@ def parse(input=None):
                              "Will only combine images that start with this text")
     parser.add_argument("-f", "--input-files", default=["image*.jpg"], type=str, nargs="+",
                         help="Will only combine files whose names match the given list of exact names or "
-                             "regex patterns")
+                             "regex patterns. A .zip or .cbz archive combines the images inside it without extracting "
+                             "them, optionally narrowed down with a pattern after it (e.g. chapter.cbz/*.jpg).")
     parser.add_argument("-e", "--extension", default=".jpg", type=str,
                         help="The file extension of your output page files.")
+    parser.add_argument("--tall-pages", default="split", type=str, choices=["split", "png"],
+                        help="What to do with pages taller than the output format allows (65500px for JPEG, 16383px "
+                             "for WebP). 'split' cuts them at the flattest rows that keep each part under the limit, "
+                             "'png' writes just those pages as PNG instead.")
+    parser.add_argument("--quality", default=None, type=int, choices=range(1, 101), metavar="[1-100]",
+                        help="The quality lossy output pages are encoded with. Defaults to 92 for JPEG, 90 for WebP "
+                             "and 75 for AVIF.")
+    parser.add_argument("--effort", default=None, type=int, choices=range(0, 10), metavar="[0-9]",
+                        help="How hard the encoder works to make pages smaller, from 0 (fastest) to 9 (smallest). "
+                             "Defaults to 0 for JPEG (which optimises its Huffman tables from 5 up), 6 for PNG and "
+                             "WebP and 4 for AVIF.")
+    parser.add_argument("--subsampling", default=None, type=str, choices=["4:4:4", "4:2:2", "4:2:0"],
+                        help="The chroma subsampling of JPEG and AVIF pages. Defaults to 4:4:4 for JPEG and 4:2:0 for "
+                             "AVIF, WebP is always 4:2:0.")
+    parser.add_argument("--progressive", action="store_true",
+                        help="If set, JPEG pages are written as progressive JPEGs.")
     parser.add_argument("-o", "--output-file-prefix", default="page", type=str,
                         help="The text that will go at the start of each output page name prior to the 3 digit zero "
                              "padded page number.")
@@ -38,7 +55,8 @@ def parse(input=None):
                         help="[DEPRECATED] Include your directory path in the -f parameter instead; "
                              "The path to the directory you want to collect image files from.")
     parser.add_argument("-od", "--output-directory", default="./Compiled/", type=str,
-                        help="The path to the directory you want to put the new page files in.")
+                        help="The path to the directory you want to put the new page files in. A path ending in .cbz "
+                             "or .zip writes the pages straight into that archive instead.")
     parser.add_argument("-b", "--breakpoint-detection-mode", default=-1, type=int,
                         help="The 'mode' that the script uses to detect where to split up pages. Mode 0 will split pages "
                              "when an input image ends in a breakpoint colour. Mode 1 will scan through out the input "
@@ -46,12 +64,18 @@ def parse(input=None):
     parser.add_argument("-bb", "--breakpoint-buffer", default="20px", type=breakpoint_buffer_formats,
                         help="When in Breakpoint Detection Mode #1 this value controls how much space to try to leave "
                              "between the last known non-breakpoint area and the actual breakpoint itself.")
+    parser.add_argument("-bs", "--breakpoint-scan", default="sampled", type=str, choices=["sampled", "exact"],
+                        help="When in Breakpoint Detection Mode #1 this value controls how rows are scanned. 'sampled' "
+                             "tests rows using the Breakpoint Increment/Multiplier, 'exact' tests every row of every "
+                             "image once and can also break on gutters that run from one image into the next (requires "
+                             "the pillow backend).")
     parser.add_argument("-bi", "--break-points-increment", default=10, type=int,
                         help="When in Breakpoint Detection Mode #1 this value controls how often the script tests a line "
-                             "in an image file for a breakpoint.")
+                             "in an image file for a breakpoint. Not used by the exact breakpoint scan.")
     parser.add_argument("-bm", "--break-points-multiplier", default=20, type=int,
                         help="When in Breakpoint Detection Mode #1 this value controls how large of a vertical area is "
-                             "pre-tested for a breakpoint before iterating over rows via Breakpoint Row Check Increments.")
+                             "pre-tested for a breakpoint before iterating over rows via Breakpoint Row Check Increments. "
+                             "Not used by the exact breakpoint scan.")
     parser.add_argument("-c", "--split-on-colour", default=[0, 65535], type=int, nargs="+",
                         help="The list of decimal notation colours you want to split on. Use 65535 for white, 0 for black, "
                              "or any number in that range for your intended colour.")
@@ -63,16 +87,58 @@ def parse(input=None):
                              "breakpoint colour")
     parser.add_argument("-csd", "--colour-standard-deviation", default=0, type=int,
                         help="The maximum allowed standard deviation in colour values when testing for a breakpoint.")
+    parser.add_argument("--backend", default="pillow", type=str, choices=["pillow", "magick"],
+                        help="The image backend used to analyse input images for breakpoints. 'pillow' decodes each "
+                             "image once and calculates row colours in-process, 'magick' runs an ImageMagick command "
+                             "for every sampled row.")
+    parser.add_argument("-j", "--jobs", default=1, type=int,
+                        help="The number of input images to decode/analyse and output pages to write in parallel. Pages "
+                             "are identical to the ones written one at a time.")
+    parser.add_argument("--resize-filter", default="lanczos",
+                        choices=["lanczos", "bicubic", "hamming", "bilinear", "box", "nearest"],
+                        help="The resampling filter used when resizing input images to the output width. Only used by "
+                             "the pillow backend, the magick backend always resizes with ImageMagick's adaptive resize.")
+    parser.add_argument("--max-decoded-megapixels", default=150, type=int,
+                        help="The most decoded input image pixels (in millions) to keep in memory at once. Inputs that "
+                             "no longer fit are decoded again if they are needed later.")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="If set, input images are always analysed from scratch instead of reusing (and saving) "
+                             "the row analysis of previous runs.")
+    parser.add_argument("--cache-dir", default=None, type=str,
+                        help="The directory to keep the analysis cache in. Defaults to 'comicom_cache' next to the "
+                             "saved profiles.")
+    parser.add_argument("--max-cache-megabytes", default=500, type=int,
+                        help="The most disk space the analysis cache can use before the least recently used entries "
+                             "are removed.")
     parser.add_argument("--exit", action="store_true",
                         help="If set, when the program finishes compiling it will prompt you to press enter before "
                              "terminating itself.")
     parser.add_argument("--clean", action="store_true",
-                        help="If set, before the new pages are compiled the program will delete the configured output "
-                             "directory.")
+                        help="If set, before the new pages are compiled the program will delete everything in the "
+                             "configured output directory except the pages that are unchanged since the last "
+                             "compilation.")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="If set, every page is written again, even the ones the compilation manifest of the "
+                             "previous run says are unchanged.")
     parser.add_argument("--open", action="store_true",
                         help="If set, after the new pages are compiled the program will open the directory it was working "
                              "in via windows explorer.")
 
+    parser.add_argument("--dry-run", action="store_true",
+                        help="If set, the pages will be planned but not written. The page plan is printed as JSON "
+                             "unless SAVE_PLAN is given.")
+    parser.add_argument("--save-plan", default=None, type=str,
+                        help="The path of a JSON file to save the page plan (input images, crops and heights of each "
+                             "page) to.")
+    parser.add_argument("--load-plan", default=None, type=str,
+                        help="The path of a previously saved (and possibly hand edited) page plan JSON file to render "
+                             "instead of searching the input files for breakpoints.")
+
+    parser.add_argument("--profile", action="store_true",
+                        help="If set, the time, CPU, external processes, bytes read/written and peak memory of each "
+                             "stage are printed as a table at the end and saved to compilation-profile.json in the "
+                             "output directory.")
+
     parser.add_argument("-l", "--logging-level", default=2, type=int, help="Sets logging level")
     parser.add_argument("--error", action="store_true", help="Turns on error level logging")
     parser.add_argument("--info", action="store_true", help="Turns on info level logging")
@@ -86,6 +152,10 @@ def parse(input=None):
     parser.add_argument("--enable-stitch-check", action="store_true",
                         help="Prevent the input list from being scanned and checked for images that do not appear to "
                              "have matching connections.")
+    parser.add_argument("--stitch-threshold", default=0.2, type=float,
+                        help="The seam score (the normalised root mean squared error between the last row of one input "
+                             "image and the first row of the next, from 0 to 1) at which the stitch check decides the "
+                             "two images don't connect.")
 
     if input is None:
         args = parser.parse_args()
@@ -1,10 +1,12 @@
 import tkinter as tk
 import sys
 import os
+import queue
 import webbrowser
 
 from tkinter import filedialog, simpledialog
 from tkinter import font
+from tkinter import ttk
 from concurrent import futures
 
 from . import localfiles
@@ -14,6 +16,10 @@ from . import logger
 from . import version
 
 REDIRECT_LOGS = True
+# How often the log is brought up to date with what the compiler has written, and how much of it is kept
+LOG_DRAIN_INTERVAL_MS = 50
+MAX_LOG_ITEMS_PER_DRAIN = 2000
+MAX_LOG_LINES = 5000
 
 thread_pool_executor = futures.ThreadPoolExecutor(max_workers=1)
 
@@ -102,7 +108,9 @@ class MainWindow(tk.Frame):
     def _run_on_thread(self):
         if self.current_thread is None or self.current_thread.done():
             self.current_thread = thread_pool_executor.submit(self._run)
-            self.current_thread.add_done_callback(self.run_frame.finished_running)
+            # Done callbacks run on the compiler thread, so the button is only changed once the log gets to it
+            self.current_thread.add_done_callback(
+                lambda future: self.logging_frame.post_call(self.run_frame.finished_running))
             self.run_frame.started_running()
         else:
             # This doesn't actually cancel.... 
@@ -466,18 +474,58 @@ class LoggingFrame(tk.Frame):
         tk.Frame.__init__(self, master)
         # show the program output when run
         self.grid_rowconfigure(0, weight=1)
+        self.grid_columnconfigure(0, weight=1)
         self.output_terminal = tk.Text(self, width=60)
-        self.output_terminal.grid(sticky="nesw", pady=3, padx=3)
+        self.output_terminal.grid(row=0, sticky="nesw", pady=3, padx=3)
         self.output_terminal.configure(state='disabled')
+        self.progress_text = tk.StringVar()
+        tk.Label(self, textvariable=self.progress_text, anchor="w").grid(row=1, sticky="we", padx=3)
+        self.progress_bar = ttk.Progressbar(self, mode="determinate")
+        self.progress_bar.grid(row=2, sticky="we", pady=3, padx=3)
+
+        # Tk widgets can only be used from the thread running the main loop, so the compiler thread only ever adds
+        # to this queue and the main loop takes everything waiting in it at once on a timer
+        self.pending = queue.Queue()
         if REDIRECT_LOGS:
-            sys.stdout = StdoutRedirector(self.output_terminal)
-            sys.stderr = StdoutRedirector(self.output_terminal)
+            sys.stdout = StdoutRedirector(self.pending)
+            sys.stderr = StdoutRedirector(self.pending)
+            logger.progress_listener = self.post_progress
+        self.after(LOG_DRAIN_INTERVAL_MS, self.drain)
         pass
 
+    def post_progress(self, stage, done, total):
+        self.pending.put(("progress", (stage, done, total)))
+
+    def post_call(self, function):
+        self.pending.put(("call", function))
+
     def clear_log(self):
+        self.post_call(self._clear)
+
+    def drain(self):
+        try:
+            (steps, progress) = take_pending(self.pending)
+            for (kind, value) in steps:
+                if kind == "text":
+                    write_log(self.output_terminal, value)
+                else:
+                    value()
+            if progress is not None:
+                self._show_progress(*progress)
+        finally:
+            # Scheduled even when a call fails, otherwise nothing would be shown again for the rest of the session
+            self.after(LOG_DRAIN_INTERVAL_MS, self.drain)
+
+    def _show_progress(self, stage, done, total):
+        self.progress_bar.configure(maximum=max(1, total), value=min(done, total))
+        self.progress_text.set("{stage}: {done}/{total}".format(stage=stage, done=done, total=total))
+
+    def _clear(self):
         self.output_terminal.configure(state='normal')
         self.output_terminal.delete('1.0', tk.END)
         self.output_terminal.configure(state='disabled')
+        self.progress_bar.configure(value=0)
+        self.progress_text.set("")
 
 
 class WikiIcon(tk.Label):
@@ -487,17 +535,56 @@ class WikiIcon(tk.Label):
 
 
 class StdoutRedirector(object):
-    def __init__(self, text_widget):
-        self.text_space = text_widget
+    # Safe to write to from any thread, the logging frame shows what was written the next time it drains the queue
+    def __init__(self, pending):
+        self.pending = pending
 
     def write(self, string):
-        self.text_space.configure(state='normal')
-        self.text_space.insert('end', string.replace(logger.delete_line_string, "\n"))
-        self.text_space.see('end')
-        self.text_space.configure(state='disabled')
+        self.pending.put(("text", string))
 
     def flush(self):
-        self.text_space.update_idletasks()
+        pass
+
+
+def take_pending(pending, max_items=MAX_LOG_ITEMS_PER_DRAIN):
+    # What's waiting in the queue as (kind, value) steps in order, with text in between calls joined into one write,
+    # and the latest progress (the only one worth drawing)
+    steps = []
+    texts = []
+    progress = None
+    try:
+        for _ in range(max_items):
+            (kind, value) = pending.get_nowait()
+            if kind == "text":
+                texts.append(value)
+            elif kind == "progress":
+                progress = value
+            else:
+                # Calls happen in order with the text around them
+                if len(texts) > 0:
+                    steps.append(("text", "".join(texts)))
+                    texts = []
+                steps.append(("call", value))
+    except queue.Empty:
+        pass
+    if len(texts) > 0:
+        steps.append(("text", "".join(texts)))
+    return steps, progress
+
+
+def write_log(terminal, text):
+    terminal.configure(state='normal')
+    parts = text.split(logger.delete_line_string)
+    terminal.insert('end', parts[0])
+    for part in parts[1:]:
+        # Inline messages replace the last line, the same as they do in a terminal
+        terminal.delete('end-1c linestart', 'end-1c')
+        terminal.insert('end', part)
+    line_count = int(terminal.index('end-1c').split(".")[0])
+    if line_count > MAX_LOG_LINES:
+        terminal.delete('1.0', "{line}.0".format(line=line_count - MAX_LOG_LINES + 1))
+    terminal.see('end')
+    terminal.configure(state='disabled')
 
 
 def trim_and_quote(item):
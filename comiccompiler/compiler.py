@@ -1,21 +1,36 @@
+import math
 import os
 import tempfile
 import time
 import shutil
-import glob
 import natsort
 import re
 import collections
+import functools
+from concurrent import futures
 
+import numpy
 from PIL import Image
 
-from . import version
 from . import imgmag
 from . import arguments
+from . import encoders
 from . import entities
+from . import gutters
 from . import logger
+from . import rowstats
+from . import render
+from . import plans
+from . import imagepool
+from . import analysiscache
+from . import archives
+from . import localfiles
+from . import manifest
+from . import profiler
 
 
+profile_file = "compilation-profile.json"
+
 image_magick_error = "Couldn't find ImageMagick via the 'magick' command.\n" \
                      "ImageMagick version 7+ can be installed from: \n" \
                      "https://imagemagick.org/script/download.php \n\n" \
@@ -25,8 +40,7 @@ image_magick_error = "Couldn't find ImageMagick via the 'magick' command.\n" \
 def run(args):
     logger.logging_level = args.logging_level
 
-    if shutil.which("magick") is None:
-        logger.info(image_magick_error)
+    if not _requirements_available(args):
         return
 
     logger.debug("Running with args: %s" % args)
@@ -34,66 +48,248 @@ def run(args):
 
     logger.info("Starting compilation...")
     start = time.time()
+    if args.profile:
+        profiler.enable()
+
+    images = []
+    image_pool = imagepool.ImagePool(args.max_decoded_megapixels * 1000000, args.resize_filter)
+    temp_directory = tempfile.mkdtemp(prefix="comicom")
+
+    try:
+        if args.load_plan is not None:
+            with profiler.span("load plan"):
+                (images, pages) = _open_plan(plans.load(args.load_plan), temp_directory, args)
+        else:
+            # Get the images we need (based on args)
+            with profiler.span("load"):
+                images = _get_input_images(args.input_files, not args.disable_input_sort)
+
+            if len(images) == 0:
+                logger.info("Couldn't find any images to combine")
+                return
+
+            pages = _plan_pages(images, image_pool, temp_directory, args)
+
+        if pages is None:
+            return
+
+        if args.save_plan is not None:
+            plans.save(args.save_plan, pages)
+            logger.info("Saved page plan to: " + args.save_plan)
+
+        if args.dry_run:
+            if args.save_plan is None:
+                logger.output(plans.to_json(pages))
+            return
+
+        _render_pages(pages, images, image_pool, args)
+    finally:
+        _cleanup(image_pool, temp_directory)
+        if profiler.enabled:
+            _report_profile(args.output_directory)
+
+    end = time.time()
+    total_time = end - start
+    logger.info("")
+    logger.info("Comic Compilation - Complete! (time: %ds)" % total_time)
+
+    if args.exit:
+        input("Press enter to exit")
+        logger.info("")
+    pass
+
+
+def plan(args):
+    logger.logging_level = args.logging_level
+    if not _requirements_available(args):
+        return []
 
-    # Get the images we need (based on args)
     images = _get_input_images(args.input_files, not args.disable_input_sort)
+    image_pool = imagepool.ImagePool(args.max_decoded_megapixels * 1000000, args.resize_filter)
+    temp_directory = tempfile.mkdtemp(prefix="comicom")
+    try:
+        pages = _plan_pages(images, image_pool, temp_directory, args) if len(images) > 0 else None
+    finally:
+        _cleanup(image_pool, temp_directory)
+    return pages if pages is not None else []
+
 
-    if len(images) == 0:
-        logger.info("Couldn't find any images to combine")
+def render_plan(args, pages):
+    logger.logging_level = args.logging_level
+    if not _requirements_available(args):
         return
 
+    image_pool = imagepool.ImagePool(args.max_decoded_megapixels * 1000000, args.resize_filter)
     temp_directory = tempfile.mkdtemp(prefix="comicom")
-
     try:
-        if not _pre_process_images(images, temp_directory, args.enable_stitch_check, args.output_file_width):
-            _cleanup(images, temp_directory)
-            return
+        (images, pages) = _open_plan(plans.describe(pages), temp_directory, args)
+        if pages is not None:
+            _render_pages(pages, images, image_pool, args)
+    finally:
+        _cleanup(image_pool, temp_directory)
 
-        _ensure_directory(args.output_directory, args.clean)
 
-        min_pixel_height_per_page = _recalculate_height_relative_to_images(str(args.min_height_per_page), images)
-        min_pixel_height_last_page = _recalculate_height_relative_to_images(str(args.min_height_last_page), images)
+def _plan_pages(images, image_pool, temp_directory, args):
+    if not _pre_process_images(images, image_pool, _get_analysis_cache(args), temp_directory,
+                               args.enable_stitch_check, args.stitch_threshold, args.output_file_width, args.backend,
+                               args.jobs):
+        return None
 
-        if args.breakpoint_detection_mode < 0:
+    min_pixel_height_per_page = _recalculate_height_relative_to_images(str(args.min_height_per_page), images)
+    min_pixel_height_last_page = _recalculate_height_relative_to_images(str(args.min_height_last_page), images)
+
+    if args.breakpoint_detection_mode < 0:
+        with profiler.span("predict mode"):
             args.breakpoint_detection_mode = _predict_appropriate_breakpoint_mode(images,
                                                                                   min_pixel_height_per_page,
                                                                                   args.split_on_colour,
                                                                                   args.colour_error_tolerance,
                                                                                   args.colour_standard_deviation)
 
-        pages = _combine_images(images, args.output_directory, args.output_file_prefix,
-                                args.output_file_starting_number, args.extension, min_pixel_height_per_page,
-                                args.output_file_width, args.breakpoint_detection_mode, args.breakpoint_buffer,
-                                args.break_points_increment, args.break_points_multiplier, args.split_on_colour,
-                                args.colour_error_tolerance, args.colour_standard_deviation)
+    with profiler.span("combine"):
+        pages = _combine_images(images, args.output_file_prefix, args.output_file_starting_number, args.extension,
+                                min_pixel_height_per_page, args.breakpoint_detection_mode, args.breakpoint_buffer,
+                                args.breakpoint_scan, args.break_points_increment, args.break_points_multiplier,
+                                args.split_on_colour, args.colour_error_tolerance, args.colour_standard_deviation)
 
+    with profiler.span("orphan"):
         _post_process_pages(pages, min_pixel_height_per_page)
-        _handle_potential_orphan_page(pages, args.output_directory, min_pixel_height_last_page)
+        _handle_potential_orphan_page(pages, min_pixel_height_last_page)
 
-        _add_info_file(args.output_directory, args, images, pages)
+    with profiler.span("tall pages"):
+        pages = _handle_tall_pages(pages, args.output_file_prefix, args.output_file_starting_number, args.extension,
+                                   args.tall_pages)
+    return pages
 
-        if args.open:
-            if args.output_directory.startswith("./"):
-                os.startfile(os.path.dirname(os.path.realpath('__file__')) + args.output_directory[1:])
-            else:
-                os.startfile(args.output_directory)
-    finally:
-        _cleanup(images, temp_directory)
 
-    end = time.time()
-    total_time = end - start
-    logger.info("")
-    logger.info("Comic Compilation - Complete! (time: %ds)" % total_time)
+def _render_pages(pages, images, image_pool, args):
+    if archives.is_archive(args.output_directory):
+        _render_pages_to_archive(pages, images, image_pool, args)
+        return
 
-    if args.exit:
-        input("Press enter to exit")
-        logger.info("")
-    pass
+    with profiler.span("find unchanged pages"):
+        page_keys = manifest.get_page_keys(pages, manifest.get_render_parameters(args))
+        previous_manifest = manifest.load(args.output_directory) if not args.rebuild else None
+        checksums = manifest.find_unchanged_pages(previous_manifest, args.output_directory, page_keys)
+        _ensure_directory(args.output_directory, args.clean, list(checksums.keys()))
+
+    pages_to_write = list(filter(lambda page: page.name not in checksums, pages))
+    if len(checksums) > 0:
+        logger.info("{unchanged_count} pages are unchanged since the last compilation, writing the other {page_count}"
+                    .format(unchanged_count=len(checksums), page_count=len(pages_to_write)))
+    encodings = manifest.get_previous_encodings(previous_manifest, checksums.keys())
+    with profiler.span("write pages"):
+        encodings.update(_write_pages(pages_to_write, args.output_directory, args.backend, args.jobs, image_pool,
+                                      encoders.get_options(args)))
+    with profiler.span("manifest"):
+        for page in pages_to_write:
+            checksums[page.name] = localfiles.hash_file(args.output_directory + page.name)
+        manifest.save(args.output_directory, args, images, pages, page_keys, checksums, encodings)
+
+    if args.open:
+        _open_output(args.output_directory)
+
+
+def _render_pages_to_archive(pages, images, image_pool, args):
+    # Pages go straight from the encoders into the archive, with the manifest stored alongside them. Every page is
+    # written each time, since reusing one would mean reading it back out of the previous archive anyway.
+    archive_path = args.output_directory.rstrip("/\\")
+    page_keys = manifest.get_page_keys(pages, manifest.get_render_parameters(args))
+    archive = archives.ArchiveWriter(archive_path)
+    try:
+        with profiler.span("write pages"):
+            encodings = _write_pages(pages, None, args.backend, args.jobs, image_pool, encoders.get_options(args),
+                                     archive)
+        with profiler.span("manifest"):
+            description = manifest.describe(args, images, pages, page_keys, archive.checksums, encodings)
+            archive.write(manifest.manifest_file, manifest.to_json(description).encode("utf-8"))
+            archive.close()
+    except BaseException:
+        archive.discard()
+        raise
+    logger.info("Saved pages to: " + archive_path)
+
+    if args.open:
+        _open_output(archive_path)
+
+
+def _open_output(output_path):
+    if output_path.startswith("./"):
+        os.startfile(os.path.dirname(os.path.realpath('__file__')) + output_path[1:])
+    else:
+        os.startfile(output_path)
 
 
-def _cleanup(images, temp_directory):
-    for image in images:
-        image.close()
+def _open_plan(description, temp_directory, args):
+    logger.info("Loading page plan with {page_count} pages".format(page_count=len(description["pages"])))
+    images = []
+    for image_description in description["images"]:
+        image = _read_input_image(image_description["path"], image_description["batch_index"])
+        if image is None:
+            logger.error("Input image in the page plan could not be read: " + image_description["path"])
+            return images, None
+        images.append(image)
+
+    target_width = max(map(lambda image_description: image_description["width"], description["images"]))
+    if not _ensure_consistent_width(target_width, images, temp_directory, args.backend):
+        return images, None
+
+    for (image, image_description) in zip(images, description["images"]):
+        if image.height != image_description["height"]:
+            logger.error("Input image no longer matches the page plan, it will need to be planned again: "
+                         + image_description["path"])
+            return images, None
+
+    pages = []
+    for page_description in description["pages"]:
+        page = entities.Page()
+        page.name = page_description["name"]
+        for index in page_description["images"]:
+            page.add_image(images[index])
+        page.crop_from_top = page_description["crop_from_top"]
+        page.crop_from_bottom = page_description["crop_from_bottom"]
+        if page.calculate_cropped_height() <= 0:
+            logger.error("Page '{name}' in the page plan is cropped to nothing".format(name=page.name))
+            return images, None
+        pages.append(page)
+
+    # The plan may have been edited (or planned for a different extension) into pages too tall for the encoder
+    pages = _handle_tall_pages(pages, args.output_file_prefix, args.output_file_starting_number, args.extension,
+                               args.tall_pages)
+    return images, pages
+
+
+def _requirements_available(args):
+    if args.backend == "magick" and not _image_magick_available():
+        return False
+    return encoders.is_available(args.extension)
+
+
+def _image_magick_available():
+    if shutil.which("magick") is None:
+        logger.info(image_magick_error)
+        return False
+    return True
+
+
+def _report_profile(output_directory):
+    # Pages written by worker processes only show up in the 'write pages' span as a whole, not per page
+    description = profiler.describe()
+    profiler.disable()
+    logger.output("")
+    logger.output(profiler.format_table(description))
+    if archives.is_archive(output_directory):
+        # Saved next to the archive, named after it so chapters compiled into the same folder don't overwrite each other
+        profile_path = os.path.splitext(output_directory.rstrip("/\\"))[0] + "-" + profile_file
+    else:
+        profile_path = output_directory + profile_file
+    if os.path.isdir(os.path.dirname(os.path.abspath(profile_path))):
+        profiler.save(profile_path, description)
+        logger.info("Saved profile to: " + profile_path)
+
+
+def _cleanup(image_pool, temp_directory):
+    image_pool.clear()
     if os.path.exists(temp_directory):
         shutil.rmtree(temp_directory)
 
@@ -104,7 +300,7 @@ def _get_input_images(input_file_patterns, enable_input_sort):
     logger.inline("Loading images")
     image_paths = []
     for input_file_pattern in input_file_patterns:
-        image_paths += glob.glob(input_file_pattern)
+        image_paths += archives.glob_files(input_file_pattern)
     if enable_input_sort:
         image_paths = natsort.natsorted(image_paths)
     logger.verbose("Image paths: " + str(image_paths))
@@ -114,31 +310,44 @@ def _get_input_images(input_file_patterns, enable_input_sort):
         if i % 5 == 0:
             logger.inline_progress()
 
-        try:
-            image = Image.open(image_paths[i])
-            image.info["batch_index"] = i
-            image.info["path"] = image_paths[i]
-            images.append(image)
-        except IOError:
+        image = _read_input_image(image_paths[i], i)
+        logger.progress("Loading images", i + 1, len(image_paths))
+        if image is None:
             logger.warn("Found input file that was not an image, skipping: " + image_paths[i])
             continue
+        images.append(image)
 
-    logger.verbose("Found images: " + " ".join(map(lambda image: image.info["path"], images)))
+    logger.verbose("Found images: " + " ".join(map(lambda image: image.path, images)))
     logger.inline("Loaded {img_count} images.".format(img_count=len(images)))
     logger.info("")
     return images
 
 
-def _pre_process_images(images, temp_directory, enable_stitch_check, output_file_width):
+def _read_input_image(path, batch_index):
+    # Only the header is read here, the pixels are decoded on demand through the image pool
+    try:
+        with Image.open(archives.get_file(path)) as image:
+            return entities.InputImage(path, image.width, image.height, batch_index)
+    except IOError:
+        return None
+
+
+def _pre_process_images(images, image_pool, analysis_cache, temp_directory, enable_stitch_check, stitch_threshold,
+                        output_file_width, backend, jobs):
     succeeded = True
 
-    _ensure_consistent_width(output_file_width, images, temp_directory)
+    with profiler.span("normalise"):
+        if not _ensure_consistent_width(output_file_width, images, temp_directory, backend):
+            return False
+
+    if backend == "pillow":
+        with profiler.span("analyse"):
+            _analyse_images(images, image_pool, analysis_cache, jobs)
 
     if enable_stitch_check:
         logger.info("Checking to make sure input image connections match...")
-        for index in range(0, len(images)-1):
-            if check_stitch_connections_match(images[index], images[index + 1]):
-                succeeded = False
+        with profiler.span("stitch check"):
+            succeeded = check_stitch_connections(images, stitch_threshold, jobs)
 
     return succeeded
 
@@ -149,7 +358,7 @@ def _copy_to_temp(path, temp_directory):
     return shutil.copy2(path, temp_directory)
 
 
-def _ensure_consistent_width(target_width, images, temp_directory):
+def _ensure_consistent_width(target_width, images, temp_directory, backend):
     if target_width == 0:
         logger.debug("No given width, extracting highest frequency width...")
         image_widths = [image.width for image in images]
@@ -157,21 +366,92 @@ def _ensure_consistent_width(target_width, images, temp_directory):
 
     logger.info("Checking input images are target width: " + str(target_width))
 
-    for i in range(0, len(images)):
-        image = images[i]
+    if backend == "pillow":
+        # The pixels are resized in memory whenever the image is decoded, so only the expected size changes here
+        for image in images:
+            if image.width != target_width:
+                logger.warn("File {file} not target width {target_width}, current width {current_width}, resizing..."
+                            .format(file=image.path, target_width=target_width, current_width=image.width))
+                image.height = imagepool.get_resized_height(image.width, image.height, target_width)
+                image.width = target_width
+        return True
+
+    if any(image.width != target_width for image in images) and not _image_magick_available():
+        return False
+
+    # ImageMagick can only read real files, so images inside archives are extracted for it
+    for image in images:
+        if archives.is_member(image.path):
+            image.path = archives.extract(image.path, temp_directory)
+
+    for image in images:
         if image.width != target_width:
             logger.warn("File {file} not target width {target_width}, current width {current_width}, resizing..."
-                        .format(file=image.info["path"], target_width=target_width, current_width=image.width))
-            old_image_info = image.info.copy()
-            image.close()
-            new_path = _copy_to_temp(image.info["path"], temp_directory)
+                        .format(file=image.path, target_width=target_width, current_width=image.width))
+            new_path = _copy_to_temp(image.path, temp_directory)
             imgmag.resize_width(target_width, new_path)
-            images[i] = Image.open(new_path)
-            images[i].info = old_image_info
-            images[i].info["path"] = new_path
-            logger.debug("Resized file: " + images[i].info["path"])
+            with Image.open(new_path) as resized_image:
+                image.width = resized_image.width
+                image.height = resized_image.height
+            image.path = new_path
+            logger.debug("Resized file: " + image.path)
 
-    pass
+    return True
+
+
+def _get_analysis_cache(args):
+    if args.no_cache or args.backend != "pillow":
+        return None
+    cache_directory = args.cache_dir if args.cache_dir is not None else localfiles.get_cache_directory()
+    try:
+        return analysiscache.AnalysisCache(cache_directory, args.max_cache_megabytes * 1024 * 1024)
+    except OSError as error:
+        logger.warn("Could not use the analysis cache in {directory}, continuing without it: {error}"
+                    .format(directory=cache_directory, error=error))
+        return None
+
+
+def _analyse_images(images, image_pool, analysis_cache, jobs):
+    logger.inline("Analysing images")
+    # Decoding and resizing release the GIL, so threads keep the cores busy without copying pixels between processes.
+    # Images are handed out a few at a time so the decoded pixels waiting to be pooled stay bounded.
+    chunk_size = max(1, jobs) * 2
+    with futures.ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        for chunk_start in range(0, len(images), chunk_size):
+            logger.inline_progress()
+            chunk = images[chunk_start:chunk_start + chunk_size]
+            decode = functools.partial(_decode_and_analyse_image, resample_filter=image_pool.resample_filter,
+                                       analysis_cache=analysis_cache)
+            for (image, (pixels, profile)) in zip(chunk, executor.map(decode, chunk)):
+                image.row_profile = profile
+                # Pooling the pixels keeps the most recent ones around for writing the pages later
+                if pixels is not None:
+                    image_pool.add(image.path, image.width, pixels)
+            logger.progress("Analysing images", chunk_start + len(chunk), len(images))
+    logger.inline("Analysed {img_count} images.".format(img_count=len(images)))
+    logger.info("")
+
+    if analysis_cache is not None:
+        logger.debug("Analysis cache hits: {hits}, misses: {misses}"
+                     .format(hits=analysis_cache.hits, misses=analysis_cache.misses))
+        if analysis_cache.misses > 0:
+            analysis_cache.evict()
+
+
+def _decode_and_analyse_image(image, resample_filter, analysis_cache):
+    # A cached profile means the image doesn't need decoding until its page is written
+    cache_key = None
+    if analysis_cache is not None:
+        cache_key = analysis_cache.get_key(manifest.get_content_hash(image), image.width, resample_filter)
+        profile = analysis_cache.load(cache_key)
+        if profile is not None and profile.height() == image.height:
+            return None, profile
+
+    pixels = imagepool.open_image(image.path, image.width, resample_filter)
+    profile = rowstats.from_image(pixels)
+    if cache_key is not None:
+        analysis_cache.store(cache_key, profile)
+    return pixels, profile
 
 
 def _predict_appropriate_breakpoint_mode(images, min_height_per_page, split_on_colour, colour_error_tolerance,
@@ -182,9 +462,9 @@ def _predict_appropriate_breakpoint_mode(images, min_height_per_page, split_on_c
         heights_between_file_end_breakpoints[-1] += image.height
         if imgmag.image_bottom_row_is_colour(image, split_on_colour, colour_error_tolerance, colour_standard_deviation):
             heights_between_file_end_breakpoints += [0]
-            image.info["ends in breakpoint"] = True
+            image.ends_in_breakpoint = True
         else:
-            image.info["ends in breakpoint"] = False
+            image.ends_in_breakpoint = False
 
     avg_height_per_page = sum(heights_between_file_end_breakpoints) / len(heights_between_file_end_breakpoints)
     logger.verbose("total list: " + str(heights_between_file_end_breakpoints))
@@ -224,21 +504,51 @@ def _recalculate_height_relative_to_images(min_height_per_page, images):
     return int(total_image_height * percent_of_total_height)
 
 
-def check_stitch_connections_match(prev_image, next_image):
-    prev_image_sample = imgmag.get_file_sample_string(prev_image.info["path"], width=prev_image.width, y_offset=prev_image.height-1)
-    next_image_sample = imgmag.get_file_sample_string(next_image.info["path"], width=next_image.width)
-    if not imgmag.almost_matches(prev_image_sample, next_image_sample):
-        logger.error("Two consecutive images do not appear to end/start with the same colours/pattern, "
-                     "check to make sure you're not missing an image or are including title/credit pages\n"
-                     "First image: {}\n"
-                     "Second image: {}"
-                     .format(prev_image.info["path"], next_image.info["path"]))
-        return True
-    return False
+def _get_seam_scores(images, jobs):
+    if all(image.row_profile is not None for image in images):
+        # The boundary rows were kept from analysis, so every seam is scored in one go without touching the files
+        return rowstats.seam_scores(list(map(lambda image: image.row_profile.last_row, images[:-1])),
+                                    list(map(lambda image: image.row_profile.first_row, images[1:])))
+
+    def compare_seam(image_pair):
+        (prev_image, next_image) = image_pair
+        prev_image_sample = imgmag.get_file_sample_string(prev_image.path, width=prev_image.width,
+                                                          y_offset=prev_image.height-1)
+        next_image_sample = imgmag.get_file_sample_string(next_image.path, width=next_image.width)
+        return imgmag.get_compare_score(prev_image_sample, next_image_sample)
+
+    with futures.ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        return list(executor.map(compare_seam, zip(images[:-1], images[1:])))
+
+
+def check_stitch_connections(images, stitch_threshold, jobs=1):
+    succeeded = True
+    for (prev_image, next_image, seam_score) in zip(images, images[1:], _get_seam_scores(images, jobs)):
+        next_image.seam_score = float(seam_score)
+        logger.verbose("Seam score between {} and {}: {}".format(prev_image.path, next_image.path, seam_score))
+        if seam_score >= stitch_threshold:
+            logger.error("Two consecutive images do not appear to end/start with the same colours/pattern, "
+                         "check to make sure you're not missing an image or are including title/credit pages\n"
+                         "First image: {}\n"
+                         "Second image: {}\n"
+                         "Seam score: {:.4f} (threshold {})"
+                         .format(prev_image.path, next_image.path, seam_score, stitch_threshold))
+            succeeded = False
+    return succeeded
 
 
-def _ensure_directory(output_directory, clean):
-    if clean and os.path.exists(output_directory):
+def _ensure_directory(output_directory, clean, files_to_keep):
+    if clean and os.path.exists(output_directory) and len(files_to_keep) > 0:
+        # Only clear out what the new compilation won't reuse
+        for name in os.listdir(output_directory):
+            if name in files_to_keep or name == manifest.manifest_file:
+                continue
+            path = os.path.join(output_directory, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+    elif clean and os.path.exists(output_directory):
         shutil.rmtree(output_directory)
         # We have to wait for rmtree to properly finish before trying to mkdir again
         while os.path.exists(output_directory):
@@ -251,7 +561,7 @@ def _ensure_directory(output_directory, clean):
     pass
 
 
-def _find_breakpoint(page, image, min_height_per_page, breakpoint_buffer, break_points_increment,
+def _find_breakpoint(page, image, min_height_per_page, breakpoint_buffer, breakpoint_scan, break_points_increment,
                      break_points_multiplier, split_on_colour, colour_error_tolerance, colour_standard_deviation):
     excess_height = page.calculate_uncropped_height() - page.crop_from_top - min_height_per_page
     offset = int(image.height - excess_height)
@@ -262,9 +572,13 @@ def _find_breakpoint(page, image, min_height_per_page, breakpoint_buffer, break_
     else:
         max_range = int(breakpoint_buffer.strip("px"))
 
-    (start, end) = imgmag.find_consecutive_rows_of_colour(image, max(0, offset), batch_sample_size,
-                                                          break_points_increment, max_range, split_on_colour,
-                                                          colour_error_tolerance, colour_standard_deviation)
+    if breakpoint_scan == "exact" and image.row_profile is not None:
+        (start, end) = imgmag.find_exact_rows_of_colour(image, max(0, offset), max_range, split_on_colour,
+                                                        colour_error_tolerance, colour_standard_deviation)
+    else:
+        (start, end) = imgmag.find_consecutive_rows_of_colour(image, max(0, offset), batch_sample_size,
+                                                              break_points_increment, max_range, split_on_colour,
+                                                              colour_error_tolerance, colour_standard_deviation)
 
     if "%" in breakpoint_buffer:
         buffer_percent = int(breakpoint_buffer.strip("%")) / 100.0
@@ -274,19 +588,19 @@ def _find_breakpoint(page, image, min_height_per_page, breakpoint_buffer, break_
         return min(start + buffer_pixel, end)
 
 
-def _define_page(page, images, min_height_per_page, breakpoint_detection_mode, breakpoint_buffer, split_on_colour,
-                 colour_error_tolerance, colour_standard_deviation, break_points_increment,
+def _define_page(page, images, min_height_per_page, breakpoint_detection_mode, breakpoint_buffer, breakpoint_scan,
+                 split_on_colour, colour_error_tolerance, colour_standard_deviation, break_points_increment,
                  break_points_multiplier):
     logger.inline("Finding images to combine into '{0}'".format(page.name))
 
     for image in images:
         logger.inline_progress()
-        logger.verbose("Current image : " + image.info["path"])
+        logger.verbose("Current image : " + image.path)
 
         page.add_image(image)
 
         # should probably look at having this be the area for 'orphan adoption'
-        if image.info["path"] == images[len(images) - 1].info["path"]:
+        if image.path == images[len(images) - 1].path:
             continue
 
         # Check if totalHeight + thisImagesHeight > minRequiredHeight
@@ -300,18 +614,19 @@ def _define_page(page, images, min_height_per_page, breakpoint_detection_mode, b
             continue
 
         logger.debug("Reached min page height {min_height}, checking for breakpoint in {image}"
-                     .format(min_height=min_height_per_page, image=image.info["path"]))
+                     .format(min_height=min_height_per_page, image=image.path))
         if breakpoint_detection_mode == 1:
-            logger.inline("Searching for breakpoint in '{0}'".format(image.info["path"]))
-            breakpoint_row = _find_breakpoint(page, image, min_height_per_page, breakpoint_buffer,
-                                              break_points_increment, break_points_multiplier, split_on_colour,
-                                              colour_error_tolerance, colour_standard_deviation)
+            logger.inline("Searching for breakpoint in '{0}'".format(image.path))
+            with profiler.span("find breakpoint"):
+                breakpoint_row = _find_breakpoint(page, image, min_height_per_page, breakpoint_buffer,
+                                                  breakpoint_scan, break_points_increment, break_points_multiplier,
+                                                  split_on_colour, colour_error_tolerance, colour_standard_deviation)
             if breakpoint_row >= 0:
                 page.crop_from_bottom = image.height - breakpoint_row
                 return
         else:
-            if "ends in breakpoint" in image.info:
-                ends_in_breakpoint = image.info["ends in breakpoint"]
+            if image.ends_in_breakpoint is not None:
+                ends_in_breakpoint = image.ends_in_breakpoint
                 logger.verbose("'File ends breakpoint' already known: " + str(ends_in_breakpoint))
                 if ends_in_breakpoint:
                     return
@@ -321,37 +636,24 @@ def _define_page(page, images, min_height_per_page, breakpoint_detection_mode, b
     pass
 
 
-def _get_image_paths(images):
-    return list(map(lambda image: image.info["path"], images))
-
-
-def _stitch_page(page, output_directory):
-    logger.verbose("Stitching page: " + str(page))
-
-    imgmag.combine_vertically(_get_image_paths(page.images), output_directory + page.name)
-
-    logger.inline("Combined {image_count} images into '{page_name}': {image_start} - {image_end}"
-                  .format(image_count=page.image_count(), page_name=page.name, image_start=page.get_first_image_index(),
-                          image_end=page.get_last_image_index()))
+def _write_pages(pages, output_directory, backend, jobs, image_pool, encoder_options, archive=None):
+    # Log an empty line to allow the 'inline logging' to have a clean new line anchor
     logger.info("")
-    pass
-
-
-def _crop_page(page, output_file_width, output_directory):
-    if page.crop_from_bottom == 0 and page.crop_from_top == 0:
-        logger.verbose("No cropping occurred for " + page.name)
-        return
 
-    logger.verbose("Cropping page: " + str(page))
+    return render.write_pages(pages, output_directory, backend, jobs, image_pool, encoder_options, archive)
 
-    imgmag.crop_in_place(output_directory + page.name, output_file_width, page.calculate_cropped_height(),
-                         page.crop_from_top)
 
+def _combine_images(images, output_file_prefix, output_file_starting_number, extension, min_height_per_page,
+                    breakpoint_detection_mode, breakpoint_buffer, breakpoint_scan, break_points_increment,
+                    break_points_multiplier, split_on_colour, colour_error_tolerance, colour_standard_deviation):
+    if breakpoint_detection_mode == 1 and breakpoint_scan == "exact":
+        with profiler.span("gutter index"):
+            gutter_index = gutters.build(images, split_on_colour, colour_error_tolerance, colour_standard_deviation)
+        if gutter_index is not None:
+            return _combine_images_with_gutter_index(images, gutter_index, output_file_prefix,
+                                                     output_file_starting_number, extension, min_height_per_page,
+                                                     breakpoint_buffer)
 
-def _combine_images(images, output_directory, output_file_prefix, output_file_starting_number, extension,
-                    min_height_per_page, output_file_width, breakpoint_detection_mode, breakpoint_buffer,
-                    break_points_increment, break_points_multiplier, split_on_colour, colour_error_tolerance,
-                    colour_standard_deviation):
     image_index = 0
     total_image_count = len(images)
     pages = []
@@ -372,21 +674,113 @@ def _combine_images(images, output_directory, output_file_prefix, output_file_st
         pages.append(page)
 
         _define_page(page, images[image_index:], min_height_per_page, breakpoint_detection_mode, breakpoint_buffer,
-                     split_on_colour, colour_error_tolerance, colour_standard_deviation, break_points_increment,
-                     break_points_multiplier)
-        _stitch_page(page, output_directory)
-        _crop_page(page, output_file_width, output_directory)
+                     breakpoint_scan, split_on_colour, colour_error_tolerance, colour_standard_deviation,
+                     break_points_increment, break_points_multiplier)
 
         image_index += page.image_count()
 
         if page.crop_from_bottom > 0:
             image_index -= 1
+        logger.progress("Planning pages", image_index, total_image_count)
 
         logger.debug("")
 
     return pages
 
 
+def _combine_images_with_gutter_index(images, gutter_index, output_file_prefix, output_file_starting_number,
+                                      extension, min_height_per_page, breakpoint_buffer):
+    # The same pages as searching image by image would give, except every page is found with a couple of lookups
+    # instead of a scan, and gutters that carry on from one image into the next can be broken on
+    logger.info("")
+    logger.debug("Indexed {count} gutters across {height}px of input images"
+                 .format(count=len(gutter_index), height=gutter_index.height))
+    # Like the image by image search, pages aren't broken inside the last image (they'd only be orphans)
+    last_image_top = gutter_index.image_tops[-1]
+    pages = []
+    page_top = 0
+    while page_top < gutter_index.height:
+        page_bottom = gutter_index.height
+        # Ratio heights are fractional, and pages can only break on whole rows
+        gutter = gutter_index.next_gutter(int(math.ceil(page_top + max(1, min_height_per_page))))
+        if gutter is not None and gutter[0] < last_image_top:
+            with profiler.span("find breakpoint"):
+                page_bottom = _get_gutter_breakpoint(gutter, breakpoint_buffer)
+
+        page = _create_page(images, gutter_index, page_top, page_bottom)
+        page.name = "{prefix}{number:03d}{extension}".format(prefix=output_file_prefix,
+                                                             number=output_file_starting_number + len(pages),
+                                                             extension=extension)
+        logger.debug("Page '{name}' covers rows {top}-{bottom}".format(name=page.name, top=page_top,
+                                                                       bottom=page_bottom))
+        pages.append(page)
+        page_top = page_bottom
+        logger.progress("Planning pages", page_top, gutter_index.height)
+    return pages
+
+
+def _get_gutter_breakpoint(gutter, breakpoint_buffer):
+    (start, end) = gutter
+    if "%" in breakpoint_buffer:
+        buffer_percent = int(breakpoint_buffer.strip("%")) / 100.0
+        return int(start + (end - start) * buffer_percent)
+    return int(min(start + int(breakpoint_buffer.strip("px")), end))
+
+
+def _create_page(images, gutter_index, top, bottom):
+    # The page showing rows top (inclusive) to bottom (exclusive) of the stacked input images
+    first_index = gutter_index.find_image(top)
+    last_index = gutter_index.find_image(bottom - 1)
+    page = entities.Page()
+    page.images = images[first_index:last_index + 1]
+    page.crop_from_top = top - gutter_index.image_tops[first_index]
+    page.crop_from_bottom = gutter_index.image_tops[last_index] + images[last_index].height - bottom
+    return page
+
+
+def _handle_tall_pages(pages, output_file_prefix, output_file_starting_number, extension, tall_pages):
+    max_page_height = render.get_max_page_height(extension)
+    if max_page_height is None or all(page.calculate_cropped_height() <= max_page_height for page in pages):
+        return pages
+
+    if tall_pages == "png":
+        for page in pages:
+            if page.calculate_cropped_height() > max_page_height:
+                logger.info("Page '{name}' is too tall for {extension}, writing it as PNG instead"
+                            .format(name=page.name, extension=extension))
+                page.name = os.path.splitext(page.name)[0] + ".png"
+        return pages
+
+    split_pages = []
+    for page in pages:
+        while page.calculate_cropped_height() > max_page_height:
+            split_row = _find_split_row(page, max_page_height)
+            logger.info("Page '{name}' is too tall for {extension}, splitting it at row {row}"
+                        .format(name=page.name, extension=extension, row=split_row))
+            split_pages.append(page)
+            page = page.split(split_row)
+        split_pages.append(page)
+
+    # Every page after the first split one moves up a number
+    for (index, page) in enumerate(split_pages):
+        page.name = "{prefix}{number:03d}{extension}".format(prefix=output_file_prefix,
+                                                             number=output_file_starting_number + index,
+                                                             extension=extension)
+    return split_pages
+
+
+def _find_split_row(page, max_page_height):
+    # The flattest row in the bottom half of what fits, and the lowest of those, so the parts stay as tall as they can
+    slices = render.get_visible_slices(page)
+    if any(image.row_profile is None for (image, top, bottom) in slices):
+        return max_page_height
+    standard_deviations = numpy.concatenate(list(map(
+        lambda visible_slice: visible_slice[0].row_profile.standard_deviation[visible_slice[1]:visible_slice[2]],
+        slices)))
+    candidates = standard_deviations[max_page_height // 2:max_page_height + 1]
+    return max_page_height - int(numpy.argmin(candidates[::-1]))
+
+
 def _post_process_pages(pages, expected_min_height):
     trigger_warning = False
     max_height_to_warn = expected_min_height * 1.8
@@ -399,18 +793,9 @@ def _post_process_pages(pages, expected_min_height):
                     "https://github.com/bajuwa/ComicCompiler/wiki/Tutorial:-FAQ#troubleshooting-compiled-pages")
 
 
-def _handle_potential_orphan_page(pages, output_directory, expected_min_height_last_page):
+def _handle_potential_orphan_page(pages, expected_min_height_last_page):
+    # Merged before anything is written so the combined page only needs to be encoded once
     if len(pages) > 1 and pages[-1].calculate_cropped_height() < expected_min_height_last_page:
         logger.info("Last page was too short, combining in to the previous page.")
-        image_paths = list(map(lambda page: output_directory + page.name, pages[-2:]))
-        imgmag.combine_vertically(image_paths, image_paths[-2])
-        os.remove(image_paths[-1])
-
-
-def _add_info_file(output_directory, args_used, images, pages):
-    with open(output_directory + "compilation.txt", 'w', encoding="utf-8") as file:
-        file.write("Compiled using Comicom v" + version.full + "\n\n")
-        file.write("Arguments: " + str(args_used) + "\n\n")
-        file.write("Input images: \n" + str(list(map(lambda image: str(image) + "\n", images))) + "\n\n")
-        file.write("Output pages: \n" + str(list(map(lambda page: str(page) + "\n", pages))) + "\n\n")
-        file.close()
+        orphan_page = pages.pop()
+        pages[-1].adopt(orphan_page)
@@ -0,0 +1,98 @@
+import os
+import tempfile
+import threading
+import time
+
+from . import logger
+
+
+# Temp files this old are left over from a run that was killed part way through writing them
+abandoned_temp_file_seconds = 60 * 60
+
+
+class DiskCache:
+    # Entries kept on disk between runs, one file per key. Every entry is written to a temp file and renamed into
+    # place, so parallel runs only ever see complete entries, and the least recently used entries are removed once the
+    # cache is over its size limit. What an entry holds (and how it's read and written) is up to the cache using it.
+    def __init__(self, directory, max_bytes, entry_extension, name):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.entry_extension = entry_extension
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self._counter_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue
+            if name.endswith(self.entry_extension):
+                entries.append((stat.st_mtime, stat.st_size, name))
+            elif name.endswith(".tmp") and time.time() - stat.st_mtime > abandoned_temp_file_seconds:
+                _remove_file(os.path.join(self.directory, name))
+
+        total_bytes = sum(map(lambda entry: entry[1], entries))
+        for (modified, size, name) in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            logger.verbose("Evicting {cache} cache entry: {entry}".format(cache=self.name, entry=name))
+            _remove_file(os.path.join(self.directory, name))
+            total_bytes -= size
+        pass
+
+    def _read_entry(self, key, read):
+        # The value read() returns for the entry's path, or None when there's no (readable) entry
+        entry_path = self._get_entry_path(key)
+        try:
+            value = read(entry_path)
+            # Touching the entry is what marks it as recently used
+            os.utime(entry_path)
+        except FileNotFoundError:
+            self._count(False)
+            return None
+        except (OSError, ValueError, KeyError) as error:
+            logger.debug("Discarding unreadable {cache} cache entry {path}: {error}"
+                         .format(cache=self.name, path=entry_path, error=error))
+            _remove_file(entry_path)
+            self._count(False)
+            return None
+
+        self._count(True)
+        return value
+
+    def _write_entry(self, key, write):
+        # write() is given the open temp file
+        (file_descriptor, temp_path) = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+        try:
+            with os.fdopen(file_descriptor, 'wb') as file:
+                write(file)
+            os.replace(temp_path, self._get_entry_path(key))
+        except OSError as error:
+            logger.debug("Could not write {cache} cache entry: {error}".format(cache=self.name, error=error))
+            _remove_file(temp_path)
+            return
+        pass
+
+    def _count(self, hit):
+        # Entries are looked up from several threads at once
+        with self._counter_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def _get_entry_path(self, key):
+        return os.path.join(self.directory, key + self.entry_extension)
+
+
+def _remove_file(path):
+    # Another run may have already removed (or replaced) the same file
+    try:
+        os.remove(path)
+    except OSError:
+        pass
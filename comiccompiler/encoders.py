@@ -0,0 +1,105 @@
+import os
+import time
+
+from PIL import Image
+from PIL import features
+
+from . import logger
+
+
+# What each output format is written with unless the command line says otherwise. Effort runs from 0 (fastest) to 9
+# (smallest files), the JPEG defaults match what ImageMagick used to write.
+defaults = {
+    "jpeg": {"quality": 92, "effort": 0, "subsampling": "4:4:4", "progressive": False},
+    "png": {"quality": None, "effort": 6, "subsampling": None, "progressive": None},
+    "webp": {"quality": 90, "effort": 6, "subsampling": None, "progressive": None},
+    "avif": {"quality": 75, "effort": 4, "subsampling": "4:2:0", "progressive": None}
+}
+extensions = {".jpg": "jpeg", ".jpeg": "jpeg", ".png": "png", ".webp": "webp", ".avif": "avif"}
+
+
+def get_options(args):
+    # Only what was given explicitly, the rest is filled in per page once its format is known
+    return {
+        "quality": args.quality,
+        "effort": args.effort,
+        "subsampling": args.subsampling,
+        "progressive": args.progressive
+    }
+
+
+def get_format(path):
+    return extensions.get(os.path.splitext(path)[1].lower())
+
+
+def get_settings(path, options):
+    output_format = get_format(path)
+    if output_format is None:
+        # Written with whatever Pillow (or ImageMagick) does by default for the extension
+        return {"format": Image.registered_extensions().get(os.path.splitext(path)[1].lower())}
+    settings = dict(defaults[output_format])
+    for (name, value) in options.items():
+        if value is not None and value is not False and settings.get(name) is not None:
+            settings[name] = value
+    settings["format"] = output_format
+    return settings
+
+
+def is_available(extension):
+    output_format = get_format(extension)
+    if output_format in ["webp", "avif"] and not features.check(output_format):
+        logger.error("This install of Pillow can't write {format} files, try upgrading it with: "
+                     "pip install --upgrade pillow".format(format=output_format.upper()))
+        return False
+    return True
+
+
+def encode(image, output, settings):
+    # Returns how long encoding (and writing) the page took, and how big it ended up. The output is either a path or a
+    # file object, which is why the format is always given instead of letting Pillow guess it from the extension.
+    start = time.perf_counter()
+    image.save(output, format=settings.get("format"), **get_save_options(settings))
+    return time.perf_counter() - start, get_size(output)
+
+
+def get_size(output):
+    if isinstance(output, str):
+        return os.path.getsize(output)
+    return output.tell()
+
+
+def get_save_options(settings):
+    output_format = settings.get("format")
+    if output_format == "jpeg":
+        return {"quality": settings["quality"], "subsampling": settings["subsampling"],
+                "progressive": settings["progressive"], "optimize": settings["effort"] >= 5}
+    if output_format == "png":
+        return {"compress_level": settings["effort"], "optimize": settings["effort"] >= 9}
+    if output_format == "webp":
+        return {"quality": settings["quality"], "method": round(settings["effort"] * 6 / 9)}
+    if output_format == "avif":
+        return {"quality": settings["quality"], "subsampling": settings["subsampling"],
+                "speed": 10 - round(settings["effort"] * 10 / 9)}
+    return {}
+
+
+def get_magick_options(path, options):
+    # Only what was given explicitly, so ImageMagick keeps writing its own defaults (and the same pages it always has)
+    output_format = get_format(path)
+    if output_format is None:
+        return []
+    explicit = dict(filter(lambda option: option[1] is not None and option[1] is not False
+                           and defaults[output_format].get(option[0]) is not None, options.items()))
+    magick_options = []
+    if "quality" in explicit:
+        magick_options += ["-quality", str(explicit["quality"])]
+    if "subsampling" in explicit:
+        magick_options += ["-sampling-factor", explicit["subsampling"]]
+    if "progressive" in explicit:
+        magick_options += ["-interlace", "JPEG"]
+    if "effort" in explicit and output_format == "png":
+        # ImageMagick's PNG quality is the zlib level in the tens and the filter in the units, 5 being adaptive
+        magick_options += ["-quality", str(explicit["effort"] * 10 + 5)]
+    if "effort" in explicit and output_format == "webp":
+        magick_options += ["-define", "webp:method=" + str(round(explicit["effort"] * 6 / 9))]
+    return magick_options
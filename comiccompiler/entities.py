@@ -1,4 +1,28 @@
-from PIL import Image
+class InputImage:
+    __slots__ = ("path", "source_path", "content_hash", "width", "height", "batch_index", "ends_in_breakpoint",
+                 "row_profile", "seam_score")
+
+    def __init__(self, path, width, height, batch_index):
+        self.path = path
+        # Where the image originally came from, in case it had to be replaced by a resized copy
+        self.source_path = path
+        # Hash of the original file's contents, only worked out once something needs it
+        self.content_hash = None
+        self.width = width
+        self.height = height
+        self.batch_index = batch_index
+        self.ends_in_breakpoint = None
+        self.row_profile = None
+        # How well the top of this image carries on from the bottom of the previous one, if the stitch check ran
+        self.seam_score = None
+
+    def __str__(self):
+        return "InputImage{" \
+               "path = " + self.path + \
+               ", width = " + str(self.width) + \
+               ", height = " + str(self.height) + \
+               ", batch_index = " + str(self.batch_index) + \
+               "}"
 
 
 class Page:
@@ -8,7 +32,7 @@ class Page:
         self.crop_from_top = 0
         self.crop_from_bottom = 0
 
-    def add_image(self, image: Image):
+    def add_image(self, image: InputImage):
         self.images.append(image)
         pass
 
@@ -22,14 +46,45 @@ class Page:
 
     def get_first_image_index(self):
         if self.image_count() > 0:
-            return self.images[0].info["batch_index"]
+            return self.images[0].batch_index
         return None
 
     def get_last_image_index(self):
         if self.image_count() > 0:
-            return self.images[self.image_count()-1].info["batch_index"]
+            return self.images[self.image_count()-1].batch_index
         return None
 
+    def adopt(self, next_page):
+        # When this page was cut part way through an image, the next page starts with that same image
+        shared_image = self.crop_from_bottom > 0 and next_page.image_count() > 0 \
+            and next_page.images[0] is self.get_last_image()
+        self.images += next_page.images[1:] if shared_image else next_page.images
+        self.crop_from_bottom = next_page.crop_from_bottom
+        pass
+
+    def split(self, row):
+        # Cuts the page below its (cropped) row, this page keeps everything above and the returned page the rest
+        cut = self.crop_from_top + row
+        index = 0
+        image_top = 0
+        while image_top + self.images[index].height < cut:
+            image_top += self.images[index].height
+            index += 1
+
+        next_page = Page()
+        next_page.crop_from_bottom = self.crop_from_bottom
+        rows_kept = cut - image_top
+        if rows_kept == self.images[index].height:
+            next_page.images = self.images[index + 1:]
+            self.crop_from_bottom = 0
+        else:
+            # Both pages share the image that is cut, the same way breakpoints cut pages
+            next_page.images = self.images[index:]
+            next_page.crop_from_top = rows_kept
+            self.crop_from_bottom = self.images[index].height - rows_kept
+        self.images = self.images[:index + 1]
+        return next_page
+
     def calculate_uncropped_height(self):
         return sum(map(lambda image: image.height, self.images))
 
@@ -0,0 +1,55 @@
+import bisect
+
+import numpy
+
+
+class GutterIndex:
+    # Every gutter in the chapter as one sorted list of (first row, last row) runs, in the coordinates of the input
+    # images stacked on top of each other. A gutter that runs off the bottom of one image and carries on at the top of
+    # the next is a single run, so it can be used as a breakpoint like any other.
+    def __init__(self, image_tops, height, starts, ends):
+        self.image_tops = image_tops
+        self.height = height
+        self.starts = starts
+        self.ends = ends
+
+    def next_gutter(self, row):
+        # The (first row, last row) of the gutter at or after the row, starting no earlier than the row itself
+        run_index = bisect.bisect_left(self.ends, row)
+        if run_index == len(self.ends):
+            return None
+        return int(max(self.starts[run_index], row)), self.ends[run_index]
+
+    def find_image(self, row):
+        # The index of the image the row is in
+        return bisect.bisect_right(self.image_tops, row) - 1
+
+    def __len__(self):
+        return len(self.starts)
+
+
+def build(images, split_on_colour, colour_error_tolerance, colour_standard_deviation):
+    # Only possible once every image has a row profile, which the magick backend doesn't calculate
+    if len(images) == 0 or any(map(lambda image: image.row_profile is None, images)):
+        return None
+
+    image_tops = []
+    all_starts = []
+    all_ends = []
+    top = 0
+    for image in images:
+        (starts, ends) = image.row_profile.gutter_runs(split_on_colour, colour_error_tolerance,
+                                                       colour_standard_deviation)
+        image_tops.append(top)
+        all_starts.append(starts + top)
+        all_ends.append(ends + top)
+        top += image.height
+
+    starts = numpy.concatenate(all_starts).astype(numpy.int64)
+    ends = numpy.concatenate(all_ends).astype(numpy.int64)
+    if len(starts) == 0:
+        return GutterIndex(image_tops, top, [], [])
+    # Runs that touch (the last row of one image and the first of the next) are merged
+    separate = numpy.concatenate(([True], starts[1:] != ends[:-1] + 1))
+    merged_ends = numpy.concatenate((ends[numpy.flatnonzero(separate)[1:] - 1], ends[-1:]))
+    return GutterIndex(image_tops, top, starts[separate].tolist(), merged_ends.tolist())
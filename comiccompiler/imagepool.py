@@ -0,0 +1,84 @@
+import collections
+
+from PIL import Image
+
+from . import archives
+from . import logger
+
+
+# Long strip inputs easily pass Pillow's decompression bomb limit (about 90 megapixels), so it's raised to fit a
+# 2000px wide strip 250000 rows tall. The pool already bounds decoded memory, but a corrupt or malicious header
+# claiming billions of pixels is still refused.
+Image.MAX_IMAGE_PIXELS = 2000 * 250000
+
+resample_filters = {
+    "lanczos": Image.LANCZOS,
+    "bicubic": Image.BICUBIC,
+    "hamming": Image.HAMMING,
+    "bilinear": Image.BILINEAR,
+    "box": Image.BOX,
+    "nearest": Image.NEAREST
+}
+
+
+class ImagePool:
+    # Keeps the most recently used decoded images in memory, up to a total number of pixels, so that
+    # analysing and writing pages doesn't need to decode every input again (or keep all of them open)
+    def __init__(self, max_pixels, resample_filter="lanczos"):
+        self.max_pixels = max_pixels
+        self.resample_filter = resample_filter
+        self.pixel_count = 0
+        self.decode_count = 0
+        self._images = collections.OrderedDict()
+
+    def get(self, path, width=None):
+        key = (path, width)
+        if key in self._images:
+            self._images.move_to_end(key)
+            return self._images[key]
+
+        image = open_image(path, width, self.resample_filter)
+        self.add(path, width, image)
+        return image
+
+    def add(self, path, width, image):
+        key = (path, width)
+        if key in self._images:
+            return
+        logger.verbose("Decoded image: " + path)
+        self.decode_count += 1
+        self._images[key] = image
+        self.pixel_count += image.width * image.height
+        self._evict()
+
+    def _evict(self):
+        while self.pixel_count > self.max_pixels and len(self._images) > 1:
+            ((path, width), image) = self._images.popitem(last=False)
+            self.pixel_count -= image.width * image.height
+            logger.verbose("Released decoded image: " + path)
+
+    def clear(self):
+        self._images.clear()
+        self.pixel_count = 0
+
+
+def get_resized_height(width, height, target_width):
+    # Same rounding as ImageMagick's '-resize {width}x' geometry, which keeps the aspect ratio
+    return max(1, int(round(height * target_width / width)))
+
+
+def open_image(path, width=None, resample_filter="lanczos"):
+    image = Image.open(archives.get_file(path))
+    if width is None or image.width == width:
+        # Loading a single frame image also closes its file, so only the decoded pixels are held on to
+        image.load()
+        return image
+
+    target_size = (width, get_resized_height(image.width, image.height, width))
+    # JPEGs can be decoded straight to 1/2, 1/4 or 1/8 scale while still at least the target size, which is
+    # much quicker than decoding every pixel just to throw most of them away again
+    image.draft(None, target_size)
+    with image:
+        # Pillow falls back to nearest neighbour for palette images, so give the filter real colours to work with
+        source = image.convert("RGB") if image.mode in ("1", "P") else image
+        return source.resize(target_size, resample_filters[resample_filter])
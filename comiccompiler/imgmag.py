@@ -1,83 +1,128 @@
+import bisect
+import os
+import shutil
 import subprocess
 import re
+import tempfile
 
 from . import logger
+from . import profiler
 
 
-# Try to avoid calling command other than imgmag ones in order to prevent cross-os problems
-def _command(command):
-    # print("Running command: " + command)
-    # For whatever reason, close_fds=True causes the program to run reeaaally slowly. Like 2x as slow.
-    process = subprocess.Popen(command, shell=True, close_fds=False,
-                               stdin=subprocess.PIPE, stderr=subprocess.STDOUT, stdout=subprocess.PIPE)
-    out, err = process.communicate()
-    return out.decode('utf-8')
+# Windows limits a whole command line to 32767 characters, so stay well under it on every platform
+max_command_length = 30000
+# Lossless and quick to read back, for the partial pages of appends too long for a single command
+intermediate_format = "miff"
 
 
-def _identify(params):
-    return _command("magick identify " + params)
+# Try to avoid calling command other than imgmag ones in order to prevent cross-os problems
+def _command(arguments):
+    # Arguments go straight to ImageMagick without a shell in between, so paths never need quoting and nothing is
+    # shared between calls, which lets any number of threads run commands at once
+    # print("Running command: " + " ".join(arguments))
+    with profiler.span(" ".join(arguments[:2])):
+        profiler.count_process()
+        # For whatever reason, close_fds=True causes the program to run reeaaally slowly. Like 2x as slow.
+        process = subprocess.Popen(arguments, close_fds=False,
+                                   stdin=subprocess.DEVNULL, stderr=subprocess.STDOUT, stdout=subprocess.PIPE)
+        out, err = process.communicate()
+    return out.decode('utf-8')
 
 
-def _convert(params):
-    return _command("magick convert " + params)
+def _identify(*params):
+    return _command(["magick", "identify"] + list(params))
 
 
-def _compare(params):
-    return _command("magick compare " + params)
+def _convert(*params):
+    return _command(["magick", "convert"] + list(params))
 
 
-def _ensure_quotes(path):
-    if path.startswith('"'):
-        return path
+def _compare(*params):
+    return _command(["magick", "compare"] + list(params))
 
-    sample_regex = re.search(r"^(.+)([.+])$", path)
-    if sample_regex is not None:
-        return '"' + sample_regex.group(1) + '"' + sample_regex.group(2)
 
-    return '"' + path + '"'
+def _chunk_arguments(arguments):
+    # Consecutive runs of arguments that fit on one command line (along with a few short options), at least one each
+    chunks = [[]]
+    length = 0
+    for argument in arguments:
+        if len(chunks[-1]) > 0 and length + len(argument) + 1 > max_command_length:
+            chunks.append([])
+            length = 0
+        chunks[-1].append(argument)
+        length += len(argument) + 1
+    return chunks
 
 
 def get_image_width(image_path):
-    return int(_identify('-format "%w" ' + _ensure_quotes(image_path)))
+    return int(_identify("-format", "%w", image_path))
 
 
 def get_image_height(image_path):
-    return int(_identify('-format "%h" ' + _ensure_quotes(image_path)))
+    return int(_identify("-format", "%h", image_path))
 
 
 def get_image_gray_min(image_path):
-    return round(float(_identify('-format %[min] ' + _ensure_quotes(image_path))))
+    return round(float(_identify("-format", "%[min]", image_path)))
 
 
 def get_image_gray_mean(image_path):
-    return round(float(_identify('-format %[mean] ' + _ensure_quotes(image_path))))
+    return round(float(_identify("-format", "%[mean]", image_path)))
 
 
 def get_image_gray_max(image_path):
-    return round(float(_identify('-format %[max] ' + _ensure_quotes(image_path))))
+    return round(float(_identify("-format", "%[max]", image_path)))
 
 
 def get_image_standard_deviation(image_path):
-    return round(float(_identify('-format %[standard-deviation] ' + _ensure_quotes(image_path))))
+    return round(float(_identify("-format", "%[standard-deviation]", image_path)))
 
 
-def resize_width(target_width, image_path):
-    _convert('{file} -adaptive-resize {width}x {file}'.format(file=_ensure_quotes(image_path), width=target_width))
-    pass
+class IdentifyBatch:
+    # Collects statistics queries for many file samples so they can be answered by a single 'magick identify'
+    max_samples_per_command = 100
+
+    def __init__(self, statistics):
+        self.statistics = statistics
+        self.file_samples = []
+
+    def add(self, file_sample):
+        self.file_samples.append(file_sample)
+        return len(self.file_samples) - 1
+
+    def run(self):
+        # Every sample is printed on its own line, with the requested statistics separated by spaces
+        # (ImageMagick turns the escaped newline into a real one itself)
+        sample_format = " ".join(map(lambda statistic: "%[" + statistic + "]", self.statistics)) + "\\n"
+        results = []
+        for i in range(0, len(self.file_samples), self.max_samples_per_command):
+            for file_samples in _chunk_arguments(self.file_samples[i:i + self.max_samples_per_command]):
+                results += self._identify_samples(sample_format, file_samples)
+        return results
+
+    def _identify_samples(self, sample_format, file_samples):
+        output = _identify("-format", sample_format, *file_samples)
+        lines = list(filter(lambda line: len(line.strip()) > 0, output.splitlines()))
+        if len(lines) != len(file_samples):
+            raise ValueError("Unexpected output from ImageMagick: " + output)
+        return list(map(lambda line: dict(zip(self.statistics, map(lambda value: round(float(value)), line.split()))),
+                        lines))
 
 
-def split(image_path, max_height, file_path_prefix, extension):
-    _convert('{file} -crop x{height} {file_path_prefix}-%02d.{extension}'
-             .format(file=_ensure_quotes(image_path), height=max_height,
-                     file_path_prefix=file_path_prefix, extension=extension))
-    return None
+def get_image_statistics(image_path, statistics):
+    batch = IdentifyBatch(statistics)
+    batch.add(image_path)
+    return batch.run()[0]
+
+
+def resize_width(target_width, image_path):
+    _convert(image_path, "-adaptive-resize", "{width}x".format(width=target_width), image_path)
+    pass
 
 
 def _compare_files(one, two):
-    sample_one = _ensure_quotes(one)
-    sample_two = _ensure_quotes(two)
-    result = _compare('-metric rmse {} {} null: 2>&1'.format(sample_one, sample_two))
-    logger.verbose("Compared {} and {} to get result: {}".format(sample_one, sample_two, result))
+    result = _compare("-metric", "rmse", one, two, "null:")
+    logger.verbose("Compared {} and {} to get result: {}".format(one, two, result))
     return result
 
 
@@ -85,36 +130,81 @@ def matches(file_one, file_two):
     return _compare_files(file_one, file_two) == "0 (0)"
 
 
+def get_compare_score(file_one, file_two):
+    # The normalised error in brackets after the absolute one, e.g. "1234.5 (0.0188)"
+    result = _compare_files(file_one, file_two)
+    match = re.search(r"\(([0-9.e+-]+)\)", result)
+    if match is None:
+        return float("inf")
+    return float(match.group(1))
+
+
 def almost_matches(file_one, file_two):
     result = _compare_files(file_one, file_two)
     logger.verbose("File sample comparison result: " + result)
     return result == "0 (0)" or " (0.0" in result or " (0.1" in result
 
 
-def combine_vertically(input_image_paths, output_image_path):
+def combine_vertically(input_image_paths, output_image_path, crop_width=None, crop_height=None, crop_top_offset=0,
+                       output_options=()):
     # -append           : will stitch together the images vertically
     # -colorspace sRGB  : prevents a single white/black image from making the whole page black/white
+    # -crop             : trims the stitched images in the same command so the output is only encoded once
     logger.debug("Combining images into output file: " + output_image_path)
-    _convert('-append {images} -colorspace sRGB {output_page_name}'.format(
-        images=" ".join(map(lambda image_path: _ensure_quotes(str(image_path)), input_image_paths)),
-        output_page_name=_ensure_quotes(output_image_path))
-    )
+    crop = []
+    if crop_height is not None:
+        crop = ["-crop", "{width}x{height}+0+{top_offset}".format(width=crop_width, height=crop_height,
+                                                                top_offset=crop_top_offset), "+repage"]
+
+    input_image_paths = list(map(str, input_image_paths))
+    temp_directory = None
+    try:
+        # Pages made of more inputs than fit on one command line are appended a chunk at a time into lossless
+        # partial pages, then those are appended instead, as many levels deep as it takes
+        while len(_chunk_arguments(input_image_paths)) > 1:
+            if temp_directory is None:
+                temp_directory = tempfile.mkdtemp(prefix="comicom-append")
+            input_image_paths = _append_chunks(input_image_paths, temp_directory)
+        _convert("-append", *input_image_paths, "-colorspace", "sRGB", *crop, *output_options, output_image_path)
+    finally:
+        if temp_directory is not None:
+            shutil.rmtree(temp_directory, ignore_errors=True)
     pass
 
 
+def _append_chunks(input_image_paths, temp_directory):
+    chunks = _chunk_arguments(input_image_paths)
+    logger.debug("Appending {count} inputs in {chunk_count} chunks".format(count=len(input_image_paths),
+                                                                            chunk_count=len(chunks)))
+    partial_paths = []
+    for chunk in chunks:
+        # Short names, so the next level fits far more of them on each command line
+        partial_path = os.path.join(temp_directory, "{index}.{extension}".format(index=len(os.listdir(temp_directory)),
+                                                                                 extension=intermediate_format))
+        # Partial pages need the same colour handling, a chunk starting with a white/black image would otherwise be
+        # written (and appended) as gray
+        _convert("-append", *chunk, "-colorspace", "sRGB", partial_path)
+        partial_paths.append(partial_path)
+    return partial_paths
+
+
 def crop_in_place(file, width, height, top_offset):
     crop_sample_range = "{width}x{height}+0+{top_offset}".format(
         width=width, height=height, top_offset=top_offset
     )
     logger.debug("Cropping: {file}[{sample}]".format(file=file, sample=crop_sample_range))
-    _convert('-crop {sample} {file} {file}'.format(sample=crop_sample_range, file=_ensure_quotes(file)))
+    _convert("-crop", crop_sample_range, file, file)
     pass
 
 
 def sample_is_colour(file_sample, split_on_colour, colour_error_tolerance, colour_standard_deviation):
-    gray_mean_value = get_image_gray_mean(file_sample)
-    standard_deviation = get_image_standard_deviation(file_sample)
+    values = get_image_statistics(file_sample, ["mean", "standard-deviation"])
+    return _values_are_colour(file_sample, values["mean"], values["standard-deviation"], split_on_colour,
+                              colour_error_tolerance, colour_standard_deviation)
+
 
+def _values_are_colour(file_sample, gray_mean_value, standard_deviation, split_on_colour, colour_error_tolerance,
+                       colour_standard_deviation):
     for colour in split_on_colour:
         colour_difference = int(gray_mean_value) - int(colour)
         if abs(colour_difference) <= colour_error_tolerance \
@@ -132,12 +222,15 @@ def sample_is_colour(file_sample, split_on_colour, colour_error_tolerance, colou
 
 
 def sample_contains_colour(file_sample, split_on_colour, colour_error_tolerance):
+    values = get_image_statistics(file_sample, ["min", "max"])
+    return _range_contains_colour(file_sample, values["min"], values["max"], split_on_colour,
+                                  colour_error_tolerance)
+
+
+def _range_contains_colour(file_sample, gray_min_value, gray_max_value, split_on_colour, colour_error_tolerance):
     for colour in split_on_colour:
         logger.debug("Checking for colour {colour} using sampling: {file_sample}"
                      .format(colour=colour, file_sample=file_sample))
-
-        gray_min_value = get_image_gray_min(file_sample)
-        gray_max_value = get_image_gray_max(file_sample)
         logger.verbose("File colour range: {min}-{max}".format(min=gray_min_value, max=gray_max_value))
 
         if colour + colour_error_tolerance >= gray_min_value \
@@ -150,23 +243,54 @@ def sample_contains_colour(file_sample, split_on_colour, colour_error_tolerance)
     return False
 
 
+def _get_row_profile(image):
+    return image.row_profile
+
+
+def _get_row_description(image, index):
+    return "{path}[row {row}]".format(path=image.path, row=index)
+
+
+def _get_row_values(image, rows):
+    profile = _get_row_profile(image)
+    if profile is not None:
+        return dict(map(lambda row: (row, {
+            "mean": profile.mean[row],
+            "standard-deviation": profile.standard_deviation[row],
+            "min": profile.minimum[row],
+            "max": profile.maximum[row]
+        }), rows))
+
+    # Without a profile, all of the rows are sampled by one ImageMagick call instead of one (or two) per row
+    batch = IdentifyBatch(["mean", "standard-deviation", "min", "max"])
+    for row in rows:
+        batch.add(get_file_sample_string(image.path, width=image.width, y_offset=row))
+    return dict(zip(rows, batch.run()))
+
+
 def image_bottom_row_is_colour(image, split_on_colour, colour_error_tolerance, colour_standard_deviation):
-    file_sample = get_file_sample_string(image.info["path"], width=image.width, y_offset=image.height-1)
-    return sample_is_colour(file_sample, split_on_colour, colour_error_tolerance, colour_standard_deviation)
+    row = image.height - 1
+    values = _get_row_values(image, [row])[row]
+    return _values_are_colour(_get_row_description(image, row), values["mean"], values["standard-deviation"],
+                              split_on_colour, colour_error_tolerance, colour_standard_deviation)
+
 
+def _row_contains_colour(image, index, values, split_on_colour, colour_error_tolerance):
+    return _range_contains_colour(_get_row_description(image, index), values["min"], values["max"],
+                                  split_on_colour, colour_error_tolerance)
 
-def _is_row_colour(image, index, split_on_colour, colour_error_tolerance, colour_standard_deviation):
-    file_sampling = get_file_sample_string(image.info["path"], width=image.width, y_offset=index)
-    gray_mean_value = get_image_gray_mean(file_sampling)
+
+def _is_row_colour(image, index, values, split_on_colour, colour_error_tolerance, colour_standard_deviation):
+    gray_mean_value = values["mean"]
     for colour in split_on_colour:
         logger.verbose("Checking row {i} for breakpoint colour {colour}".format(i=index, colour=colour))
         colour_difference = gray_mean_value - colour
 
         if abs(colour_difference) <= colour_error_tolerance:
-            standard_deviation = get_image_standard_deviation(file_sampling)
+            standard_deviation = values["standard-deviation"]
             if standard_deviation <= colour_standard_deviation:
                 logger.debug("Found a breakpoint colour {colour} in {image_name} at row {row}"
-                             .format(colour=colour, image_name=image.info["path"], row=index))
+                             .format(colour=colour, image_name=image.path, row=index))
                 return True
             else:
                 logger.verbose("Colour value {gray_mean} was within tolerance {colour} "
@@ -179,7 +303,7 @@ def _is_row_colour(image, index, split_on_colour, colour_error_tolerance, colour
 
 def find_consecutive_rows_of_colour(image, offset, batch_size, row_check_increment, max_range,
                                     split_on_colour, colour_error_tolerance, colour_standard_deviation):
-    logger.debug("Scanning file " + image.info["path"] + " for breakpoint with offset " + str(offset))
+    logger.debug("Scanning file " + image.path + " for breakpoint with offset " + str(offset))
     breakpoint_rows = [-1, -1]
 
     batch_end = offset
@@ -187,26 +311,34 @@ def find_consecutive_rows_of_colour(image, offset, batch_size, row_check_increme
         logger.inline_progress()
         batch_start = batch_end
         batch_end = min(batch_start + batch_size, image.height - 1)
-        batch_file_sample = get_file_sample_string(image.info["path"], width=image.width, y_offset=batch_start)
         logger.verbose("Checking batch for possible breakpoint colours {colours}: {start}-{end}"
                        .format(colours=split_on_colour, start=batch_start, end=batch_end))
+        rows = list(range(batch_start, batch_end, row_check_increment))
 
         if breakpoint_rows[0] < 0:
-            if not sample_contains_colour(batch_file_sample, split_on_colour, colour_error_tolerance):
+            # Only the first row is needed to rule the batch out, ImageMagick decodes the file again for every row
+            start_values = _get_row_values(image, [batch_start])
+            if not _row_contains_colour(image, batch_start, start_values[batch_start], split_on_colour,
+                                        colour_error_tolerance):
                 logger.debug("Colours not found in sample batch {start}-{end}, skipping to next batch"
                              .format(start=batch_start, end=batch_end))
                 continue
             else:
                 logger.verbose("Colours found in sample batch {start}-{end}, checking rows for breakpoint"
                                .format(start=batch_start, end=batch_end))
+            row_values = _get_row_values(image, rows[1:])
+            row_values[batch_start] = start_values[batch_start]
+        else:
+            row_values = _get_row_values(image, rows)
 
-        for index in range(batch_start, batch_end, row_check_increment):
+        for index in rows:
             if breakpoint_rows[0] >= 0 and index - breakpoint_rows[0] > max_range:
                 breakpoint_rows[1] = breakpoint_rows[0] + max_range
                 logger.debug("Reached max range allowed for breakpoint range: " + str(breakpoint_rows[1]))
                 return breakpoint_rows
 
-            if _is_row_colour(image, index, split_on_colour, colour_error_tolerance, colour_standard_deviation):
+            if _is_row_colour(image, index, row_values[index], split_on_colour, colour_error_tolerance,
+                              colour_standard_deviation):
                 if breakpoint_rows[0] < 0:
                     breakpoint_rows[0] = index
                     logger.debug("Found first positive breakpoint location: " + str(breakpoint_rows[0]))
@@ -220,11 +352,29 @@ def find_consecutive_rows_of_colour(image, offset, batch_size, row_check_increme
         logger.verbose("Found breakpoints all the way to end of file")
         breakpoint_rows[1] = image.height - 1
     else:
-        logger.verbose("Could not find a breakpoint in: " + image.info["path"])
+        logger.verbose("Could not find a breakpoint in: " + image.path)
 
     return breakpoint_rows
 
 
+def find_exact_rows_of_colour(image, offset, max_range, split_on_colour, colour_error_tolerance,
+                              colour_standard_deviation):
+    logger.debug("Scanning every row of " + image.path + " for breakpoint with offset " + str(offset))
+    (starts, ends) = _get_row_profile(image).gutter_runs(split_on_colour, colour_error_tolerance,
+                                                         colour_standard_deviation)
+
+    # Runs are sorted, so the first one that finishes at or after the offset is the next breakpoint
+    run_index = bisect.bisect_left(ends, offset)
+    if run_index == len(ends):
+        logger.verbose("Could not find a breakpoint in: " + image.path)
+        return [-1, -1]
+
+    start = max(int(starts[run_index]), offset)
+    end = min(int(ends[run_index]), start + max_range)
+    logger.debug("Found breakpoint rows {start}-{end}".format(start=start, end=end))
+    return [start, end]
+
+
 def get_file_sample_string(path, width=1, height=1, x_offset=0, y_offset=0):
-    return '"{path}"[{width}x{height}+{x_offset}+{y_offset}]' \
+    return '{path}[{width}x{height}+{x_offset}+{y_offset}]' \
         .format(path=path, width=width-1, height=height, x_offset=x_offset, y_offset=y_offset)
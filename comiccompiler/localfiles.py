@@ -1,8 +1,12 @@
 import glob
+import hashlib
 import os
 
+from . import archives
+
 
 comicom_profiles_directory = "comicom_profiles"
+comicom_cache_directory = "comicom_cache"
 cc_suite_config_directory = "cc_suite_config"
 cc_suite_config_file = "cc-suite-config.ini"
 
@@ -63,6 +67,15 @@ def _ensure_profile_directory():
             file.close()
 
 
+def hash_file(path):
+    file_hash = hashlib.blake2b(digest_size=16)
+    source = archives.get_file(path)
+    with open(source, 'rb') if isinstance(source, str) else source as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
 def ensure_directory(directory):
     if not os.path.exists(directory):
         os.mkdir(directory)
@@ -86,12 +99,16 @@ def _get_profile_directory():
     return _get_appdata_directory() + comicom_profiles_directory
 
 
+def get_cache_directory():
+    return _get_appdata_directory() + comicom_cache_directory
+
+
 def _get_config_directory():
     return _get_appdata_directory() + cc_suite_config_directory
 
 
 def _get_appdata_directory():
-    return os.getenv('APPDATA') + os.sep
+    return os.getenv('APPDATA', os.path.expanduser("~")) + os.sep
 
 
 cc_suite_config_file_contents = """
@@ -117,8 +134,22 @@ ads_folder=
 # If no key is provided, the input images will not be waifu'd and the program will continue with compilation
 # You will need to create an account and check your dashboard for your api key: https://deepai.org/dashboard/profile
 waifu_key=
+# How many images of a chapter can be uploading to Waifu2x at the same time (failed uploads are retried with a backoff)
+waifu_concurrency=10
+# The most disk space kept for upscaled images, so images that were already waifu'd (e.g. when re-running a chapter)
+# are reused instead of uploaded again; 0 turns the cache off
+waifu_cache_megabytes=1000
 # Any additional arguments you want comicom.py to use (no need to set input/output values)
 arguments=--info --open -m 1:10 -M 1:3 -bb 50%
+# When processing several chapters, how many chapters each step can work on at the same time
+# (e.g. raise waifu_workers so more chapters are upscaling while another one compiles)
+# Only one chapter can compile at a time, so compile_workers is always 1 (use -j in the arguments to compile faster)
+download_workers=1
+ads_workers=1
+waifu_workers=1
+compile_workers=1
+# How many chapters can be waiting for the next step before the previous step stops to let it catch up
+queue_size=1
 
 # Example config format.... 
 # Any arguments input here will override those found in [default]
@@ -3,6 +3,9 @@ import sys
 
 logging_level = 2
 delete_line_string = "\r%b\033[2K"
+# Set by front ends that show progress themselves (like the GUI's progress bar), it's called with the stage, how much of
+# it is done and the total, and takes the place of the progress dots
+progress_listener = None
 
 
 def _supports_inline_logging():
@@ -19,6 +22,10 @@ def _log_level(level, message):
         _log(message)
 
 
+def output(message):
+    _log(message)
+
+
 def error(message):
     _log_level(0, "[ERROR] " + message)
 
@@ -55,6 +62,11 @@ def inline(message):
 
 
 def inline_progress():
-    if _supports_inline_logging():
+    if progress_listener is None and _supports_inline_logging():
         sys.stdout.write(".")
         sys.stdout.flush()
+
+
+def progress(stage, done, total):
+    if progress_listener is not None:
+        progress_listener(stage, done, total)
@@ -0,0 +1,141 @@
+import hashlib
+import json
+import math
+import os
+
+from . import encoders
+from . import localfiles
+from . import logger
+from . import plans
+from . import profiler
+from . import version
+
+
+manifest_file = "compilation.json"
+
+
+def get_render_parameters(args):
+    # Everything besides the page plan itself that changes the bytes of a written page
+    return {
+        "version": version.full,
+        "backend": args.backend,
+        "resize_filter": args.resize_filter,
+        "encoder_options": encoders.get_options(args)
+    }
+
+
+def get_page_keys(pages, render_parameters):
+    # A page only needs writing again when one of its inputs, its crops or the way it is written has changed
+    page_keys = {}
+    for page in pages:
+        page_description = {
+            "parameters": render_parameters,
+            "images": list(map(lambda image: [get_content_hash(image), image.width, image.height], page.images)),
+            "crop_from_top": page.crop_from_top,
+            "crop_from_bottom": page.crop_from_bottom
+        }
+        page_keys[page.name] = hashlib.blake2b(json.dumps(page_description, sort_keys=True).encode("utf-8"),
+                                               digest_size=16).hexdigest()
+    return page_keys
+
+
+def get_content_hash(image):
+    if image.content_hash is None:
+        image.content_hash = localfiles.hash_file(image.source_path)
+    return image.content_hash
+
+
+def load(output_directory):
+    path = output_directory + manifest_file
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding="utf-8") as file:
+            return json.load(file)
+    except (OSError, ValueError) as error:
+        logger.warn("Could not read the previous compilation manifest, every page will be written: " + str(error))
+        return None
+
+
+def find_unchanged_pages(previous_manifest, output_directory, page_keys):
+    # Pages (by name) that were written by the previous compilation from the same inputs, and haven't been touched since
+    unchanged_pages = {}
+    if previous_manifest is None:
+        return unchanged_pages
+
+    for previous_page in previous_manifest.get("pages", []):
+        name = previous_page.get("name")
+        if name not in page_keys or previous_page.get("key") != page_keys[name]:
+            continue
+        page_path = output_directory + name
+        if os.path.exists(page_path) and localfiles.hash_file(page_path) == previous_page.get("checksum"):
+            unchanged_pages[name] = previous_page["checksum"]
+    return unchanged_pages
+
+
+def get_previous_encodings(previous_manifest, page_names):
+    # The encode time and size the previous compilation recorded for pages it is reusing
+    encodings = {}
+    if previous_manifest is None:
+        return encodings
+    for previous_page in previous_manifest.get("pages", []):
+        encoding = previous_page.get("encoding")
+        if previous_page.get("name") in page_names and encoding is not None:
+            encodings[previous_page["name"]] = (encoding["seconds"], encoding["bytes"])
+    return encodings
+
+
+def describe(args, images, pages, page_keys, checksums, encodings):
+    # The page plan, so a manifest can also be given to --load-plan, plus what's needed to compare against next time
+    description = plans.describe(pages)
+    unique_images = _get_unique_images(pages)
+    for (image_description, image) in zip(description["images"], unique_images):
+        image_description["hash"] = get_content_hash(image)
+    for page_description in description["pages"]:
+        page_description["key"] = page_keys[page_description["name"]]
+        page_description["checksum"] = checksums[page_description["name"]]
+        if page_description["name"] in encodings:
+            (seconds, size) = encodings[page_description["name"]]
+            page_description["encoding"] = {"seconds": seconds, "bytes": size}
+    description["seams"] = _describe_seams(unique_images)
+    description["input_count"] = len(images)
+    description["parameters"] = get_render_parameters(args)
+    description["arguments"] = vars(args)
+    if profiler.enabled:
+        # Up to the point the manifest is written, the full profile is saved next to it at the end of the run
+        description["profile"] = profiler.describe()
+    return description
+
+
+def save(output_directory, args, images, pages, page_keys, checksums, encodings):
+    description = describe(args, images, pages, page_keys, checksums, encodings)
+    with open(output_directory + manifest_file, 'w', encoding="utf-8") as file:
+        file.write(to_json(description))
+        file.close()
+
+
+def to_json(description):
+    return json.dumps(description, indent=2, default=str)
+
+
+def _describe_seams(images):
+    # Seam scores between neighbouring images (by their index in the images list), when the stitch check was run
+    seams = []
+    for index in range(1, len(images)):
+        if images[index].seam_score is not None:
+            # Images too different in width to compare score infinity, which JSON can't hold
+            score = images[index].seam_score if math.isfinite(images[index].seam_score) else None
+            seams.append({"images": [index - 1, index], "score": score})
+    return seams
+
+
+def _get_unique_images(pages):
+    # In the same order as plans.describe lists them
+    images = []
+    seen = set()
+    for page in pages:
+        for image in page.images:
+            if id(image) not in seen:
+                seen.add(id(image))
+                images.append(image)
+    return images
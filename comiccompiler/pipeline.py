@@ -0,0 +1,116 @@
+import queue
+import threading
+import time
+
+from . import logger
+
+
+# Handed down the queues once there's nothing left to process
+_end_of_input = object()
+
+
+class Stage:
+    # One step of the pipeline. The function is given each item in turn and returns whether the item should carry on
+    # to the next stage, several items can be worked on at once up to the stage's concurrency.
+    def __init__(self, name, function, concurrency=1):
+        self.name = name
+        self.function = function
+        self.concurrency = max(1, concurrency)
+        self.processed_count = 0
+        self.dropped_count = 0
+        self.busy_seconds = 0.0
+        # Waiting for the previous stage to hand over an item
+        self.idle_seconds = 0.0
+        # Waiting for room in the next stage's queue
+        self.blocked_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def work(self, input_queue, output_queue):
+        while True:
+            waiting_since = time.perf_counter()
+            item = input_queue.get()
+            started = time.perf_counter()
+            if item is _end_of_input:
+                self._record_idle(started - waiting_since)
+                return
+
+            logger.info("Starting {stage} for {item}".format(stage=self.name, item=item))
+            try:
+                carry_on = self.function(item)
+            except Exception as error:
+                logger.error("{stage} failed for {item}, skipping the rest of its stages: {error}"
+                             .format(stage=self.name, item=item, error=error))
+                carry_on = False
+            finished = time.perf_counter()
+
+            if carry_on is not False and output_queue is not None:
+                output_queue.put(item)
+            self._record(carry_on is not False, finished - started, started - waiting_since,
+                         time.perf_counter() - finished)
+
+    def _record(self, processed, busy_seconds, idle_seconds, blocked_seconds):
+        with self._lock:
+            if processed:
+                self.processed_count += 1
+            else:
+                self.dropped_count += 1
+            self.busy_seconds += busy_seconds
+            self.idle_seconds += idle_seconds
+            self.blocked_seconds += blocked_seconds
+
+    def _record_idle(self, idle_seconds):
+        with self._lock:
+            self.idle_seconds += idle_seconds
+
+    def __str__(self):
+        return "Stage{" \
+               "name = " + self.name + \
+               ", concurrency = " + str(self.concurrency) + \
+               "}"
+
+
+class Pipeline:
+    # Runs items through each stage in order, with a bounded queue in front of every stage so a fast stage can only
+    # get a few items ahead of a slow one
+    def __init__(self, stages, queue_size=1):
+        self.stages = stages
+        self.queue_size = max(1, queue_size)
+        self.elapsed_seconds = 0.0
+
+    def run(self, items):
+        start = time.perf_counter()
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages] + [None]
+        workers = []
+        for (index, stage) in enumerate(self.stages):
+            stage_workers = [threading.Thread(target=stage.work, args=(queues[index], queues[index + 1]),
+                                              name="pipeline-" + stage.name, daemon=True)
+                             for _ in range(stage.concurrency)]
+            for worker in stage_workers:
+                worker.start()
+            workers.append(stage_workers)
+
+        for item in items:
+            queues[0].put(item)
+
+        # Every item before the end marker is handed on before a worker stops, so once all of a stage's workers have
+        # stopped the next stage has everything it's going to get
+        for (index, stage) in enumerate(self.stages):
+            for _ in range(stage.concurrency):
+                queues[index].put(_end_of_input)
+            for worker in workers[index]:
+                worker.join()
+
+        self.elapsed_seconds = time.perf_counter() - start
+        pass
+
+    def get_summary(self):
+        lines = ["{name:<12}{workers:>8}{done:>8}{dropped:>9}{busy:>10}{idle:>10}{blocked:>10}"
+                 .format(name="Stage", workers="Workers", done="Done", dropped="Dropped", busy="Busy",
+                         idle="Idle", blocked="Blocked")]
+        for stage in self.stages:
+            lines.append("{name:<12}{workers:>8}{done:>8}{dropped:>9}{busy:>9.1f}s{idle:>9.1f}s{blocked:>9.1f}s"
+                         .format(name=stage.name, workers=stage.concurrency, done=stage.processed_count,
+                                 dropped=stage.dropped_count, busy=stage.busy_seconds, idle=stage.idle_seconds,
+                                 blocked=stage.blocked_seconds))
+        lines.append("Total time: {elapsed:.1f}s".format(elapsed=self.elapsed_seconds))
+        return "\n".join(lines)
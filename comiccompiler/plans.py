@@ -0,0 +1,62 @@
+import json
+
+from . import version
+
+
+def describe(pages):
+    # Images are listed once and referenced by index, since a page cut part way through an image shares it
+    # with the next page
+    images = []
+    image_indexes = {}
+    page_descriptions = []
+
+    for page in pages:
+        page_image_indexes = []
+        for image in page.images:
+            if id(image) not in image_indexes:
+                image_indexes[id(image)] = len(images)
+                images.append({
+                    "path": image.source_path,
+                    "batch_index": image.batch_index,
+                    "width": image.width,
+                    "height": image.height
+                })
+            page_image_indexes.append(image_indexes[id(image)])
+
+        page_descriptions.append({
+            "name": page.name,
+            "images": page_image_indexes,
+            "crop_from_top": page.crop_from_top,
+            "crop_from_bottom": page.crop_from_bottom,
+            "height": page.calculate_cropped_height()
+        })
+
+    return {
+        "version": version.full,
+        "images": images,
+        "pages": page_descriptions
+    }
+
+
+def to_json(pages):
+    return json.dumps(describe(pages), indent=2)
+
+
+def save(path, pages):
+    with open(path, 'w', encoding="utf-8") as file:
+        file.write(to_json(pages))
+        file.close()
+
+
+def load(path):
+    with open(path, 'r', encoding="utf-8") as file:
+        description = json.load(file)
+
+    image_count = len(description["images"])
+    for page in description["pages"]:
+        if len(page["images"]) == 0 or any(index < 0 or index >= image_count for index in page["images"]):
+            raise ValueError("Page '{name}' does not reference any known images".format(name=page["name"]))
+        if page["crop_from_top"] < 0 or page["crop_from_bottom"] < 0:
+            raise ValueError("Page '{name}' can not have a negative crop".format(name=page["name"]))
+
+    return description
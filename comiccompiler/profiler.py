@@ -0,0 +1,169 @@
+import collections
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+
+from . import version
+
+
+# Spans are only measured once profiling is enabled, otherwise they cost a single flag check
+enabled = False
+
+_lock = threading.Lock()
+_spans = collections.OrderedDict()
+_process_count = 0
+_started = None
+
+
+def enable():
+    global enabled
+    reset()
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def reset():
+    global _process_count, _started
+    with _lock:
+        _spans.clear()
+        _process_count = 0
+        _started = _sample()
+
+
+@contextlib.contextmanager
+def span(name):
+    # Times are inclusive, a span nested inside another one is counted in both
+    if not enabled:
+        yield
+        return
+
+    start = _sample()
+    try:
+        yield
+    finally:
+        _record(name, start, _sample())
+
+
+def count_process():
+    global _process_count
+    if enabled:
+        with _lock:
+            _process_count += 1
+
+
+def describe():
+    with _lock:
+        spans = collections.OrderedDict((name, dict(values)) for (name, values) in _spans.items())
+    total = _get_difference(_started, _sample()) if _started is not None else None
+    return {
+        "version": version.full,
+        "total": total,
+        "spans": spans
+    }
+
+
+def format_table(description=None):
+    if description is None:
+        description = describe()
+
+    lines = ["{name:<28}{calls:>7}{wall:>10}{cpu:>10}{child_cpu:>11}{processes:>11}{read:>10}{written:>10}{peak:>10}"
+             .format(name="Span", calls="Calls", wall="Wall", cpu="CPU", child_cpu="Child CPU", processes="Processes",
+                     read="Read", written="Written", peak="Peak")]
+    rows = list(description["spans"].items())
+    if description["total"] is not None:
+        rows.append(("total", description["total"]))
+    for (name, values) in rows:
+        lines.append("{name:<28}{calls:>7}{wall:>9.3f}s{cpu:>9.3f}s{child_cpu:>10.3f}s{processes:>11}{read:>10}"
+                     "{written:>10}{peak:>10}"
+                     .format(name=name, calls=values.get("calls", 1), wall=values["wall_seconds"],
+                             cpu=values["cpu_seconds"], child_cpu=values["child_cpu_seconds"],
+                             processes=values["processes"], read=_format_megabytes(values["bytes_read"]),
+                             written=_format_megabytes(values["bytes_written"]),
+                             peak=_format_megabytes(values["peak_memory_bytes"])))
+    return "\n".join(lines)
+
+
+def save(path, description=None):
+    if description is None:
+        description = describe()
+    with open(path, 'w', encoding="utf-8") as file:
+        file.write(json.dumps(description, indent=2))
+        file.close()
+
+
+def _record(name, start, end):
+    difference = _get_difference(start, end)
+    with _lock:
+        if name not in _spans:
+            _spans[name] = {"calls": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0, "child_cpu_seconds": 0.0,
+                            "processes": 0, "bytes_read": None, "bytes_written": None, "peak_memory_bytes": None}
+        values = _spans[name]
+        values["calls"] += 1
+        for key in ["wall_seconds", "cpu_seconds", "child_cpu_seconds", "processes"]:
+            values[key] += difference[key]
+        for key in ["bytes_read", "bytes_written"]:
+            if difference[key] is not None:
+                values[key] = (values[key] or 0) + difference[key]
+        if difference["peak_memory_bytes"] is not None:
+            values["peak_memory_bytes"] = max(values["peak_memory_bytes"] or 0, difference["peak_memory_bytes"])
+
+
+def _sample():
+    times = os.times()
+    (bytes_read, bytes_written) = _get_io_counters()
+    return {
+        "wall_seconds": time.perf_counter(),
+        # Every thread of this process, plus the external processes (like ImageMagick) that have finished
+        "cpu_seconds": times.user + times.system,
+        "child_cpu_seconds": times.children_user + times.children_system,
+        "processes": _process_count,
+        "bytes_read": bytes_read,
+        "bytes_written": bytes_written,
+        "peak_memory_bytes": _get_peak_memory_bytes()
+    }
+
+
+def _get_difference(start, end):
+    difference = {}
+    for key in ["wall_seconds", "cpu_seconds", "child_cpu_seconds", "processes", "bytes_read", "bytes_written"]:
+        if start[key] is None or end[key] is None:
+            difference[key] = None
+        else:
+            difference[key] = end[key] - start[key]
+    # The high water mark of the whole process by the end of the span, memory can't be split between spans
+    difference["peak_memory_bytes"] = end["peak_memory_bytes"]
+    return difference
+
+
+def _get_io_counters():
+    # Bytes passed through read/write calls (files and the pipes to ImageMagick), only available on Linux
+    try:
+        with open("/proc/self/io", 'r') as file:
+            counters = dict(line.split(": ") for line in file.read().splitlines())
+        return int(counters["rchar"]), int(counters["wchar"])
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+
+def _get_peak_memory_bytes():
+    try:
+        import resource
+    except ImportError:
+        # Not available on Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in kilobytes on Linux, but bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _format_megabytes(value):
+    if value is None:
+        return "-"
+    return "{:.1f}MB".format(value / (1024 * 1024))
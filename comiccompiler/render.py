@@ -0,0 +1,238 @@
+import io
+import os
+import struct
+import tempfile
+import time
+import zlib
+from concurrent import futures
+
+import numpy
+from PIL import Image
+
+from . import encoders
+from . import imagepool
+from . import imgmag
+from . import logger
+
+
+# A page only ever spans a handful of inputs, so each worker process keeps a small pool of its own
+worker_pool_max_pixels = 50 * 1000000
+
+# The tallest page each format can hold (libjpeg stops at 65500 rows, short of the 16 bit header limit), any other
+# extension has no practical limit
+max_page_heights = {".jpg": 65500, ".jpeg": 65500, ".webp": 16383}
+# PNG pages taller than this are encoded a band of rows at a time instead of being pasted together first, so memory
+# use depends on the tallest input rather than the height of the page
+streamed_page_height = 16384
+band_height = 1024
+
+
+def write_pages(pages, output_directory, backend, jobs, image_pool, encoder_options, archive=None):
+    # Returns the encode time (in seconds) and size (in bytes) of each written page, by name. Given an archive, pages
+    # are encoded in memory and added to it in order instead of being written to the output directory.
+    encodings = {}
+    in_memory = archive is not None
+    if jobs <= 1:
+        for page in pages:
+            logger.verbose("Writing page: " + str(page))
+            result = write_page(page, output_directory, backend, image_pool, encoder_options, in_memory)
+            encodings[page.name] = _store_page(page, result, archive)
+            logger.progress("Writing pages", len(encodings), len(pages))
+        _log_encoding_summary(encodings)
+        return encodings
+
+    logger.debug("Writing pages using {jobs} parallel jobs".format(jobs=jobs))
+    if backend == "magick":
+        # Each page is its own ImageMagick process already, so threads are enough to keep them all busy
+        executor = futures.ThreadPoolExecutor(max_workers=jobs)
+        results = executor.map(lambda page: write_page(page, output_directory, backend, image_pool, encoder_options,
+                                                       in_memory), pages)
+    else:
+        # Page jobs only carry file paths and rows, each worker decodes the few images its page needs and encodes it
+        executor = futures.ProcessPoolExecutor(max_workers=jobs)
+        results = executor.map(_write_page_job, map(
+            lambda page: _get_page_job(page, output_directory, image_pool.resample_filter, encoder_options,
+                                       in_memory), pages))
+
+    with executor:
+        for (page, result) in zip(pages, results):
+            encodings[page.name] = _store_page(page, result, archive)
+            logger.progress("Writing pages", len(encodings), len(pages))
+    _log_encoding_summary(encodings)
+    return encodings
+
+
+def write_page(page, output_directory, backend, image_pool, encoder_options, in_memory=False):
+    # Returns the encode time, the size and (when written in memory) the encoded bytes of the page
+    if backend == "magick":
+        return _write_with_magick(page, output_directory, encoder_options, in_memory)
+
+    (output_path, width, height, slices, resample_filter, encoder_options, in_memory) = _get_page_job(
+        page, output_directory, image_pool.resample_filter, encoder_options, in_memory)
+    return _write_slices(slices, width, height, output_path, in_memory, image_pool,
+                         encoders.get_settings(output_path, encoder_options))
+
+
+def _store_page(page, result, archive):
+    (seconds, size, data) = result
+    if archive is not None:
+        archive.write(page.name, data)
+    _log_written_page(page, (seconds, size))
+    return seconds, size
+
+
+def _log_written_page(page, encoding):
+    logger.inline("Combined {image_count} images into '{page_name}': {image_start} - {image_end}"
+                  .format(image_count=page.image_count(), page_name=page.name, image_start=page.get_first_image_index(),
+                          image_end=page.get_last_image_index()))
+    logger.info("")
+    logger.debug("Encoded '{page_name}' in {seconds:.3f}s, {kilobytes:.1f}KB"
+                 .format(page_name=page.name, seconds=encoding[0], kilobytes=encoding[1] / 1024))
+    pass
+
+
+def _log_encoding_summary(encodings):
+    if len(encodings) == 0:
+        return
+    total_seconds = sum(map(lambda encoding: encoding[0], encodings.values()))
+    total_bytes = sum(map(lambda encoding: encoding[1], encodings.values()))
+    logger.info("Encoded {page_count} pages into {megabytes:.2f}MB ({average:.1f}KB per page) using {seconds:.2f}s "
+                "of encoding time".format(page_count=len(encodings), megabytes=total_bytes / (1024 * 1024),
+                                          average=total_bytes / len(encodings) / 1024, seconds=total_seconds))
+
+
+def get_visible_slices(page):
+    # The (image, top row, bottom row) of each input image that is left on the page after cropping
+    page_top = page.crop_from_top
+    page_bottom = page.calculate_uncropped_height() - page.crop_from_bottom
+    slices = []
+    image_top = 0
+    for image in page.images:
+        top = max(page_top, image_top)
+        bottom = min(page_bottom, image_top + image.height)
+        if bottom > top:
+            slices.append((image, top - image_top, bottom - image_top))
+        image_top += image.height
+    return slices
+
+
+def get_page_width(page):
+    return max(map(lambda image: image.width, page.images))
+
+
+def _get_page_job(page, output_directory, resample_filter, encoder_options, in_memory):
+    # Images are referred to by path and (possibly resized) width, so each worker can decode them on its own
+    slices = list(map(lambda visible_slice: (visible_slice[0].path, visible_slice[0].width, visible_slice[1],
+                                             visible_slice[2]), get_visible_slices(page)))
+    output_path = page.name if in_memory else output_directory + page.name
+    return (output_path, get_page_width(page), page.calculate_cropped_height(), slices, resample_filter,
+            encoder_options, in_memory)
+
+
+def _write_page_job(page_job):
+    global _worker_pool
+    (output_path, width, height, slices, resample_filter, encoder_options, in_memory) = page_job
+    if _worker_pool is None or _worker_pool.resample_filter != resample_filter:
+        _worker_pool = imagepool.ImagePool(worker_pool_max_pixels, resample_filter)
+
+    return _write_slices(slices, width, height, output_path, in_memory, _worker_pool,
+                         encoders.get_settings(output_path, encoder_options))
+
+
+_worker_pool = None
+
+
+def get_max_page_height(name):
+    for (extension, max_height) in max_page_heights.items():
+        if name.lower().endswith(extension):
+            return max_height
+    return None
+
+
+def _write_slices(slices, width, height, output_path, in_memory, image_pool, encoder_settings):
+    if not in_memory:
+        return _write_slices_with_pillow(slices, width, height, output_path, image_pool, encoder_settings) + (None,)
+    output = io.BytesIO()
+    (seconds, size) = _write_slices_with_pillow(slices, width, height, output, image_pool, encoder_settings)
+    return seconds, size, output.getvalue()
+
+
+def _write_slices_with_pillow(slices, width, height, output, image_pool, encoder_settings):
+    # The output is either a path or a file object to encode the page into
+    if height > streamed_page_height and encoder_settings.get("format") == "png":
+        # Encoding is interleaved with pasting the bands, so it can't be timed on its own
+        start = time.perf_counter()
+        if isinstance(output, str):
+            with open(output, 'wb') as file:
+                _write_slices_as_png_bands(slices, width, height, file, image_pool, encoder_settings["effort"])
+        else:
+            _write_slices_as_png_bands(slices, width, height, output, image_pool, encoder_settings["effort"])
+        return time.perf_counter() - start, encoders.get_size(output)
+
+    # Images are pasted straight from the decoded inputs, so the page is only ever encoded once
+    canvas = Image.new("RGB", (width, height), "white")
+    y_offset = 0
+    for (path, image_width, top, bottom) in slices:
+        image = image_pool.get(path, image_width)
+        canvas.paste(image.crop((0, top, image.width, bottom)), (0, y_offset))
+        y_offset += bottom - top
+
+    encoding = encoders.encode(canvas, output, encoder_settings)
+    canvas.close()
+    return encoding
+
+
+def _write_slices_as_png_bands(slices, width, height, file, image_pool, compress_level):
+    # A plain 8 bit RGB PNG, every row using the 'Up' filter (the difference from the row above), which compresses
+    # about as well as Pillow's adaptive filtering does for scanned pages
+    compressor = zlib.compressobj(compress_level)
+    previous_row = numpy.zeros((1, width, 3), dtype=numpy.uint8)
+    file.write(b"\x89PNG\r\n\x1a\n")
+    _write_png_chunk(file, b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+    for (path, image_width, top, bottom) in slices:
+        image = image_pool.get(path, image_width)
+        for band_top in range(top, bottom, band_height):
+            band_bottom = min(bottom, band_top + band_height)
+            band = numpy.full((band_bottom - band_top, width, 3), 255, dtype=numpy.uint8)
+            band[:, :image.width] = numpy.asarray(image.crop((0, band_top, image.width, band_bottom)).convert("RGB"))
+            filtered = numpy.empty((band.shape[0], 1 + width * 3), dtype=numpy.uint8)
+            filtered[:, 0] = 2
+            filtered[:, 1:] = (band - numpy.concatenate((previous_row, band[:-1]))).reshape(band.shape[0], -1)
+            previous_row = band[-1:]
+            _write_png_chunk(file, b"IDAT", compressor.compress(filtered.tobytes()))
+    _write_png_chunk(file, b"IDAT", compressor.flush())
+    _write_png_chunk(file, b"IEND", b"")
+
+
+def _write_png_chunk(file, chunk_type, data):
+    if chunk_type == b"IDAT" and len(data) == 0:
+        # The compressor holds on to small bands until it has enough to emit
+        return
+    file.write(struct.pack(">I", len(data)))
+    file.write(chunk_type)
+    file.write(data)
+    file.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(chunk_type)) & 0xffffffff))
+
+
+def _write_with_magick(page, output_directory, encoder_options, in_memory):
+    # Stitching and encoding are one ImageMagick command, so the encode time includes decoding the inputs
+    if in_memory:
+        (handle, output_path) = tempfile.mkstemp(suffix=os.path.splitext(page.name)[1])
+        os.close(handle)
+    else:
+        output_path = output_directory + page.name
+
+    start = time.perf_counter()
+    image_paths = list(map(lambda image: image.path, page.images))
+    imgmag.combine_vertically(image_paths, output_path, crop_width=get_page_width(page),
+                              crop_height=page.calculate_cropped_height(), crop_top_offset=page.crop_from_top,
+                              output_options=encoders.get_magick_options(page.name, encoder_options))
+    seconds = time.perf_counter() - start
+    size = os.path.getsize(output_path) if os.path.exists(output_path) else 0
+    if not in_memory:
+        return seconds, size, None
+
+    with open(output_path, 'rb') as file:
+        data = file.read()
+    os.remove(output_path)
+    return seconds, size, data
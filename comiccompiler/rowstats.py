@@ -0,0 +1,113 @@
+import numpy
+
+from PIL import Image
+
+
+# ImageMagick (Q16) reports statistics on a 0-65535 scale, so 8 bit channel values are stretched to match
+quantum_range = 65535
+quantum_scale = quantum_range / 255
+
+
+class RowProfile:
+    def __init__(self, mean, standard_deviation, minimum, maximum, first_row, last_row):
+        self.mean = mean
+        self.standard_deviation = standard_deviation
+        self.minimum = minimum
+        self.maximum = maximum
+        # The full pixel rows at each end of the image, so neighbouring images can be compared without a re-decode
+        self.first_row = first_row
+        self.last_row = last_row
+        self._gutter_runs = {}
+
+    def height(self):
+        return len(self.mean)
+
+    def gutter_runs(self, split_on_colour, colour_error_tolerance, colour_standard_deviation):
+        key = (tuple(split_on_colour), colour_error_tolerance, colour_standard_deviation)
+        if key not in self._gutter_runs:
+            mask = colour_mask(self, split_on_colour, colour_error_tolerance, colour_standard_deviation)
+            self._gutter_runs[key] = find_runs(mask)
+        return self._gutter_runs[key]
+
+    def __str__(self):
+        return "RowProfile{" \
+               "height = " + str(self.height()) + \
+               "}"
+
+
+def load_pixels(image):
+    # Pillow will only decode the file the first time the pixels are requested
+    if image.mode not in ("L", "RGB"):
+        image = image.convert("RGB")
+    pixels = numpy.asarray(image)
+    if pixels.ndim == 2:
+        pixels = pixels[:, :, numpy.newaxis]
+    return pixels
+
+
+def sample_width(width):
+    # imgmag.get_file_sample_string crops one column short of the full width, so mirror that here
+    # to keep the same colour/deviation thresholds meaning the same thing for both backends
+    return max(1, width - 1)
+
+
+def calculate(pixels):
+    height, width, channels = pixels.shape
+    rows = pixels[:, :sample_width(width), :]
+
+    minimum = rows.min(axis=(1, 2)).astype(numpy.float64) * quantum_scale
+    maximum = rows.max(axis=(1, 2)).astype(numpy.float64) * quantum_scale
+    mean = rows.mean(axis=(1, 2), dtype=numpy.float64) * quantum_scale
+
+    # ImageMagick's composite standard deviation is the average of each channel's (sample) standard deviation
+    ddof = 1 if rows.shape[1] > 1 else 0
+    standard_deviation = rows.std(axis=1, dtype=numpy.float64, ddof=ddof).mean(axis=1) * quantum_scale
+
+    return RowProfile(numpy.rint(mean), numpy.rint(standard_deviation), numpy.rint(minimum), numpy.rint(maximum),
+                      pixels[0].copy(), pixels[-1].copy())
+
+
+def seam_scores(last_rows, first_rows):
+    # The normalised root mean squared error between each pair of rows, the same number ImageMagick's
+    # 'compare -metric rmse' reports in brackets. Rows of different widths can't be compared and score infinity.
+    scores = numpy.full(len(last_rows), numpy.inf)
+    pairs_by_width = {}
+    for (index, (last_row, first_row)) in enumerate(zip(last_rows, first_rows)):
+        if last_row.shape[0] == first_row.shape[0]:
+            pairs_by_width.setdefault(last_row.shape[0], []).append(index)
+
+    for (width, indexes) in pairs_by_width.items():
+        # Every pair of the same width is scored at once, trimmed to the sample width like the other statistics
+        last = numpy.stack([_as_colour_row(last_rows[index], width) for index in indexes])
+        first = numpy.stack([_as_colour_row(first_rows[index], width) for index in indexes])
+        squared_error = numpy.square(last - first).mean(axis=(1, 2))
+        scores[indexes] = numpy.sqrt(squared_error) / 255
+    return scores
+
+
+def _as_colour_row(row, width):
+    # Mirror ImageMagick's behaviour of comparing grayscale images against colour ones channel by channel
+    row = row[:sample_width(width)]
+    return numpy.broadcast_to(row, (row.shape[0], 3)).astype(numpy.float64)
+
+
+def colour_mask(profile, split_on_colour, colour_error_tolerance, colour_standard_deviation):
+    colours = numpy.asarray(split_on_colour, dtype=numpy.float64)
+    within_tolerance = numpy.abs(profile.mean[:, numpy.newaxis] - colours) <= colour_error_tolerance
+    return within_tolerance.any(axis=1) & (profile.standard_deviation <= colour_standard_deviation)
+
+
+def find_runs(mask):
+    # Run-length encode the mask, returning the first and last row (inclusive) of every run of True rows
+    padded = numpy.concatenate(([False], mask, [False]))
+    changes = numpy.flatnonzero(padded[1:] != padded[:-1])
+    return changes[0::2], changes[1::2] - 1
+
+
+def from_file(path):
+    with Image.open(path) as image:
+        return calculate(load_pixels(image))
+
+
+def from_image(image):
+    return calculate(load_pixels(image))
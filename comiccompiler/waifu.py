@@ -1,69 +1,328 @@
 #!/usr/bin/env python
 import asyncio
+import glob
+import io
+import json
+import math
 import os
-from concurrent.futures.thread import ThreadPoolExecutor
+import random
+import time
 
-import requests
-import glob
+import aiohttp
+import numpy
+from PIL import Image
 
 from . import logger
 
 
-def waifu(key, file_pattern, target_directory):
-    target_filepaths = []
+api_url = "https://api.deepai.org/api/waifu2x"
+default_concurrency = 10
+# Rate limiting and server errors are worth another try, anything else (like a bad key) will fail the same way again
+retry_statuses = [429, 500, 502, 503, 504]
+download_chunk_size = 64 * 1024
+scale = 2
+# Anything taller comes back at less than twice the size, so taller images are uploaded as overlapping tiles that are
+# blended back together over the overlap to hide the seams
+max_tile_height = 800
+tile_overlap = 32
 
-    loop = asyncio.get_event_loop()
-    future = asyncio.ensure_future(_waifu_asynchronously(target_filepaths, key, file_pattern, target_directory))
-    loop.run_until_complete(future)
 
-    return target_filepaths
+class WaifuError(Exception):
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
 
 
-async def _waifu_asynchronously(target_filepaths, key, file_pattern, target_directory):
-    source_filepaths = glob.glob(file_pattern)
+class RetryableError(WaifuError):
+    pass
+
+
+class Tile:
+    def __init__(self, top, height, data):
+        self.top = top
+        self.height = height
+        self.data = data
+
+
+class SourceImage:
+    def __init__(self, width, height, image_format, tiles):
+        self.width = width
+        self.height = height
+        self.image_format = image_format
+        self.tiles = tiles
+
+
+class WaifuClient:
+    # Uploads are limited to a number at a time over one pooled session, each one retried with jittered exponential
+    # backoff so a struggling server isn't hit by every waiting upload at the same moment
+    def __init__(self, key, concurrency=default_concurrency, url=api_url, max_attempts=5, backoff_seconds=1.0,
+                 max_backoff_seconds=30.0, timeout_seconds=120.0, cache=None):
+        self.key = key
+        self.cache = cache
+        self.concurrency = max(1, concurrency)
+        self.url = url
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.timeout_seconds = timeout_seconds
+
+    def upscale_files(self, source_filepaths, target_filepaths):
+        return asyncio.run(self._upscale_files(source_filepaths, target_filepaths))
+
+    async def _upscale_files(self, source_filepaths, target_filepaths):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+        timeout = aiohttp.ClientTimeout(total=self.timeout_seconds)
+        # Cache key -> a future that finishes once the upload of that content does
+        uploading = {}
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout,
+                                         headers={"api-key": self.key}) as session:
+            return await asyncio.gather(*[self._upscale_image(session, semaphore, uploading, source, target)
+                                          for (source, target) in zip(source_filepaths, target_filepaths)])
+
+    async def _upscale_image(self, session, semaphore, uploading, source, target):
+        # Decoding, cutting and reassembling happen on worker threads so they don't hold up the uploads of other images
+        loop = asyncio.get_running_loop()
+        result = {"source": source, "target": target, "succeeded": False, "tiles": []}
+        try:
+            source_image = await loop.run_in_executor(None, cut_tiles, source)
+        except OSError as error:
+            logger.debug("Not waifu'ing {file}: {error}".format(file=source, error=_describe_error(error)))
+            return result
+
+        name = os.path.basename(source)
+        result["tiles"] = await asyncio.gather(*[
+            self._upscale_tile(session, semaphore, uploading, "{name}#{number}".format(name=name, number=number), tile)
+            for (number, tile) in enumerate(source_image.tiles)])
+        if all(map(lambda tile_result: tile_result["succeeded"], result["tiles"])):
+            try:
+                upscaled_tiles = list(map(lambda tile_result: tile_result["data"], result["tiles"]))
+                await loop.run_in_executor(None, reassemble, source_image, upscaled_tiles, target)
+                result["succeeded"] = True
+            except OSError as error:
+                logger.error("Could not reassemble {file}: {error}".format(file=source, error=_describe_error(error)))
+        for tile_result in result["tiles"]:
+            tile_result["data"] = None
+        return result
+
+    async def _upscale_tile(self, session, semaphore, uploading, name, tile):
+        # The timing (and outcome) of one upload, for the run summary
+        result = {"name": name, "succeeded": False, "cached": False, "attempts": 0, "retries": 0,
+                  "upload_seconds": 0.0, "download_seconds": 0.0, "data": None}
+        cache_key = None
+        upload = None
+        try:
+            if self.cache is not None:
+                cache_key = self.cache.get_key(tile.data)
+                # The same content twice in one run (like a repeated title card) is only uploaded once
+                if cache_key in uploading:
+                    await uploading[cache_key]
+                result["data"] = self.cache.load(cache_key)
+                if result["data"] is not None:
+                    result["cached"] = True
+                    result["succeeded"] = True
+                    logger.debug("Waifu {name}: reused cached result".format(name=name))
+                    return result
+                upload = asyncio.get_running_loop().create_future()
+                uploading[cache_key] = upload
+
+            async with semaphore:
+                start = time.perf_counter()
+                output_url = await self._with_retries(result, lambda: self._post_image(session, name, tile.data))
+                result["upload_seconds"] = time.perf_counter() - start
+
+                start = time.perf_counter()
+                result["data"] = await self._with_retries(result, lambda: self._download(session, output_url))
+                result["download_seconds"] = time.perf_counter() - start
+                result["succeeded"] = True
+            if self.cache is not None:
+                self.cache.store(cache_key, result["data"])
+        except (aiohttp.ClientError, asyncio.TimeoutError, OSError, WaifuError) as error:
+            logger.error("Could not waifu {name}: {error}".format(name=name, error=_describe_error(error)))
+        finally:
+            if upload is not None:
+                upload.set_result(None)
+        logger.debug("Waifu {name}: {attempts} requests, upload {upload:.2f}s, download {download:.2f}s"
+                     .format(name=name, attempts=result["attempts"], upload=result["upload_seconds"],
+                             download=result["download_seconds"]))
+        return result
+
+    async def _with_retries(self, result, request):
+        for attempt in range(1, self.max_attempts + 1):
+            result["attempts"] += 1
+            try:
+                return await request()
+            except (RetryableError, aiohttp.ClientConnectionError, asyncio.TimeoutError) as error:
+                if attempt == self.max_attempts:
+                    raise
+                result["retries"] += 1
+                # Full jitter, unless the server said how long to wait
+                delay = random.uniform(0, min(self.max_backoff_seconds, self.backoff_seconds * 2 ** (attempt - 1)))
+                if isinstance(error, RetryableError) and error.retry_after is not None:
+                    delay = min(self.max_backoff_seconds, error.retry_after)
+                logger.debug("Waifu request failed ({error}), retrying in {delay:.2f}s"
+                             .format(error=_describe_error(error), delay=delay))
+                await asyncio.sleep(delay)
+
+    async def _post_image(self, session, name, data):
+        form = aiohttp.FormData()
+        form.add_field("image", data, filename=name.replace("#", "-"))
+        async with session.post(self.url, data=form) as response:
+            await _check_status(response)
+            body = await response.text()
+        # A successful status doesn't always mean an upscaled image, DeepAI reports some failures as {"err": ...}
+        try:
+            reply = json.loads(body)
+        except ValueError:
+            reply = None
+        if not isinstance(reply, dict) or "output_url" not in reply:
+            raise WaifuError("No output_url in the reply: " + body[:200])
+        return reply["output_url"]
+
+    async def _download(self, session, url):
+        async with session.get(url) as response:
+            await _check_status(response)
+            data = io.BytesIO()
+            async for chunk in response.content.iter_chunked(download_chunk_size):
+                data.write(chunk)
+            return data.getvalue()
+
+
+async def _check_status(response):
+    if response.status < 400:
+        return
+    message = "HTTP {status}: {body}".format(status=response.status, body=(await response.text())[:200])
+    if response.status in retry_statuses:
+        retry_after = response.headers.get("Retry-After")
+        raise RetryableError(message, float(retry_after) if retry_after and retry_after.isdigit() else None)
+    raise WaifuError(message)
+
 
+def _describe_error(error):
+    return str(error) or type(error).__name__
+
+
+def cut_tiles(path):
+    with Image.open(path) as image:
+        image_format = image.format
+        if image.height <= max_tile_height:
+            # Uploaded exactly as it is, there's nothing to gain from encoding it again
+            with open(path, 'rb') as file:
+                return SourceImage(image.width, image.height, image_format, [Tile(0, image.height, file.read())])
+
+        image = image.convert("RGB")
+        tiles = []
+        for top in get_tile_tops(image.height):
+            tile = image.crop((0, top, image.width, top + max_tile_height))
+            tiles.append(Tile(top, max_tile_height, _encode(tile, image_format)))
+        return SourceImage(image.width, image.height, image_format, tiles)
+
+
+def get_tile_tops(height):
+    # Spread evenly so every tile overlaps the next by at least the tile overlap, and the last one ends at the bottom
+    if height <= max_tile_height:
+        return [0]
+    count = math.ceil((height - tile_overlap) / (max_tile_height - tile_overlap))
+    return list(map(lambda number: round(number * (height - max_tile_height) / (count - 1)), range(count)))
+
+
+def reassemble(source_image, upscaled_tiles, target):
+    if len(source_image.tiles) == 1:
+        # Kept as it was downloaded, decoding and encoding it again would only lose quality
+        _write_file(target, upscaled_tiles[0])
+        return
+
+    width = source_image.width * scale
+    height = source_image.height * scale
+    tiles = source_image.tiles
+    # Rows only one tile covers are copied straight from it, just the overlaps are blended in floating point
+    coverage = numpy.zeros(height, dtype=numpy.int32)
+    for tile in tiles:
+        coverage[tile.top * scale:(tile.top + tile.height) * scale] += 1
+    overlap_rows = numpy.flatnonzero(coverage > 1)
+    pixels = numpy.zeros((height, width, 3), dtype=numpy.uint8)
+    overlap_pixels = numpy.zeros((len(overlap_rows), width, 3), dtype=numpy.float32)
+    overlap_weights = numpy.zeros((len(overlap_rows), 1, 1), dtype=numpy.float32)
+    for (number, (tile, data)) in enumerate(zip(tiles, upscaled_tiles)):
+        with Image.open(io.BytesIO(data)) as upscaled:
+            upscaled = upscaled.convert("RGB")
+            if upscaled.size != (width, tile.height * scale):
+                upscaled = upscaled.resize((width, tile.height * scale), Image.LANCZOS)
+            tile_pixels = numpy.asarray(upscaled)
+
+        # Each tile fades in over its overlap with the previous one and out over its overlap with the next one
+        tile_weights = numpy.ones(tile.height * scale, dtype=numpy.float32)
+        if number > 0:
+            overlap = (tiles[number - 1].top + tiles[number - 1].height - tile.top) * scale
+            tile_weights[:overlap] = (numpy.arange(overlap) + 0.5) / overlap
+        if number < len(tiles) - 1:
+            overlap = (tile.top + tile.height - tiles[number + 1].top) * scale
+            tile_weights[-overlap:] = numpy.minimum(tile_weights[-overlap:],
+                                                    (overlap - 0.5 - numpy.arange(overlap)) / overlap)
+        rows = numpy.arange(tile.top * scale, (tile.top + tile.height) * scale)
+        alone = coverage[rows] == 1
+        pixels[rows[alone]] = tile_pixels[alone]
+        shared = numpy.flatnonzero(~alone)
+        positions = numpy.searchsorted(overlap_rows, rows[shared])
+        overlap_pixels[positions] += tile_pixels[shared].astype(numpy.float32) * tile_weights[shared, None, None]
+        overlap_weights[positions, 0, 0] += tile_weights[shared]
+
+    pixels[overlap_rows] = numpy.clip(numpy.rint(overlap_pixels / overlap_weights), 0, 255).astype(numpy.uint8)
+    output = io.BytesIO()
+    Image.fromarray(pixels).save(output, format=source_image.image_format,
+                                 **_get_save_options(source_image.image_format))
+    _write_file(target, output.getvalue())
+
+
+def _write_file(target, data):
+    # Written under a temporary name so a failed write never looks like a finished one
+    with open(target + ".part", 'wb') as file:
+        file.write(data)
+    os.replace(target + ".part", target)
+
+
+def _encode(image, image_format):
+    output = io.BytesIO()
+    image.save(output, format=image_format if image_format == "JPEG" else "PNG", **_get_save_options(image_format))
+    return output.getvalue()
+
+
+def _get_save_options(image_format):
+    if image_format == "JPEG":
+        return {"quality": 95, "subsampling": "4:4:4"}
+    return {}
+
+
+def waifu(key, file_pattern, target_directory, concurrency=default_concurrency, url=api_url, cache=None):
+    source_filepaths = glob.glob(file_pattern)
+    target_filepaths = []
     for filepath in source_filepaths:
         path, filename = os.path.split(filepath)
-        filename_noext, extension = filename.split('.')
-        target_filepaths.append(''.join((target_directory, filename_noext, '-waifud.', extension)))
-
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        with requests.Session() as session:
-            loop = asyncio.get_event_loop()
-
-            tasks = [
-                loop.run_in_executor(
-                    executor,
-                    _waifu_single_file,
-                    *(session, key, source_filepaths[i], target_filepaths[i])
-                )
-                for i in range(len(source_filepaths))
-            ]
-
-            for response in await asyncio.gather(*tasks):
-                pass
-
-    return target_filepaths
-
-
-def _waifu_single_file(session, key, source, target):
-    try:
-        url = post_image(key, source)
-        img_dl = session.get(url, allow_redirects=True)
-    except requests.HTTPError:
-        logger.error('Something wrong with the Internet, please try again later.')
-    else:
-        with open(target, 'wb') as hand:
-            hand.write(img_dl.content)
-
-
-def post_image(key, filename):
-    res = requests.post(
-        "https://api.deepai.org/api/waifu2x",
-        files={
-            'image': open(filename, 'rb'),
-        },
-        headers={'api-key': key}
-    )
-    # logger.info(res.json())
-    return res.json()['output_url']
+        filename_noext, extension = os.path.splitext(filename)
+        target_filepaths.append(os.path.join(target_directory, filename_noext + '-waifud' + extension))
+
+    start = time.perf_counter()
+    results = WaifuClient(key, concurrency, url, cache=cache).upscale_files(source_filepaths, target_filepaths)
+    _log_summary(results, time.perf_counter() - start)
+    if cache is not None and cache.misses > 0:
+        cache.evict()
+    return list(map(lambda result: result["target"], filter(lambda result: result["succeeded"], results)))
+
+
+def _log_summary(results, elapsed):
+    # Files that aren't images (and so were never uploaded) don't count
+    results = list(filter(lambda result: len(result["tiles"]) > 0, results))
+    tiles = [tile for result in results for tile in result["tiles"]]
+    if len(tiles) == 0:
+        return
+    succeeded = list(filter(lambda result: result["succeeded"], results))
+    cached = list(filter(lambda tile: tile["cached"], tiles))
+    uploaded = list(filter(lambda tile: tile["succeeded"] and not tile["cached"], tiles))
+    logger.info("Waifu'd {succeeded}/{total} files ({tiles} tiles) in {elapsed:.2f}s ({cached} tiles from cache, "
+                "{hit_rate:.0%} hit rate, {retries} retried requests, average upload {upload:.2f}s, average download "
+                "{download:.2f}s)"
+                .format(succeeded=len(succeeded), total=len(results), tiles=len(tiles), elapsed=elapsed,
+                        cached=len(cached), hit_rate=len(cached) / len(tiles),
+                        retries=sum(map(lambda tile: tile["retries"], tiles)),
+                        upload=sum(map(lambda tile: tile["upload_seconds"], uploaded)) / max(1, len(uploaded)),
+                        download=sum(map(lambda tile: tile["download_seconds"], uploaded)) / max(1, len(uploaded))))
@@ -0,0 +1,27 @@
+import hashlib
+
+from . import diskcache
+
+
+entry_extension = ".waifu"
+
+
+class WaifuCache(diskcache.DiskCache):
+    # Upscaled results keyed by the SHA-256 of the tile that was uploaded, so re-running a chapter (or a chapter that
+    # repeats an earlier one's images) doesn't spend API quota on tiles that were already upscaled
+    def __init__(self, directory, max_bytes):
+        super().__init__(directory, max_bytes, entry_extension, "waifu")
+
+    def get_key(self, data):
+        return hashlib.sha256(data).hexdigest()
+
+    def load(self, key):
+        return self._read_entry(key, _read_file)
+
+    def store(self, key, data):
+        self._write_entry(key, lambda file: file.write(data))
+
+
+def _read_file(path):
+    with open(path, 'rb') as file:
+        return file.read()
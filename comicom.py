@@ -1,5 +1,6 @@
 #!/usr/bin/env python
 
+import multiprocessing
 import tkinter
 
 from comiccompiler import compiler
@@ -9,6 +10,8 @@ from comiccompiler import arguments
 
 # execute only if run as a script
 if __name__ == "__main__":
+    # Pages are written by worker processes with -j, which a frozen (PyInstaller) build starts as copies of itself
+    multiprocessing.freeze_support()
     args = arguments.parse()
 
     # Trigger the actual program....
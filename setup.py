@@ -15,13 +15,14 @@ setuptools.setup(
     long_description=long_description,
     long_description_content_type="text/markdown",
     url="https://github.com/bajuwa/ComicCompiler",
-    packages=setuptools.find_packages(exclude=['*.tests', '*.tests.*', 'tests.*', 'tests']),
+    packages=setuptools.find_packages(exclude=['*.tests', '*.tests.*', 'tests.*', 'tests', 'benchmarks']),
     package_data={'comiccompiler': ['resources/pow_icon.ico']},
     include_package_data=True,
     install_requires=[
-        'requests',
+        'aiohttp',
         'natsort',
-        'pillow'
+        'pillow',
+        'numpy'
     ],
     classifiers=[
         "Programming Language :: Python :: 3",
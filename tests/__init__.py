@@ -24,6 +24,10 @@ class ComicomTestCase(unittest.TestCase):
         self.args.breakpoint_detection_mode = 0
         self.args.breakpoint_buffer = "0px"
         self.args.clean = True
+        # Always analyse the inputs, a warm analysis cache would hide changes to the analysis itself
+        self.args.no_cache = True
+        # Always render every page, unchanged pages left over from an earlier run would otherwise be kept as they are
+        self.args.rebuild = True
         # self.args.logging_level = 5
 
     def compare_output(self):
@@ -0,0 +1,53 @@
+import glob
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from PIL import Image
+
+from comiccompiler import adindex
+
+
+class AdIndexTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="comicom-ad-index-test")
+        self.ads_folder = self.directory + os.sep + "ads" + os.sep
+        os.mkdir(self.ads_folder)
+        self.index_path = self.directory + os.sep + "index.json"
+        input_path = os.path.join(os.path.dirname(__file__), os.pardir, "default", "input")
+        self.inputs = sorted(glob.glob(os.path.abspath(input_path) + os.sep + "*.jpg"))[:4]
+        shutil.copy(self.inputs[0], self.ads_folder + "banner.jpg")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_matches_re_encoded_ad(self):
+        candidate = self.directory + os.sep + "candidate.jpg"
+        with Image.open(self.inputs[0]) as image:
+            image.save(candidate, quality=60)
+
+        ads = adindex.load(self.ads_folder, self.index_path)
+        self.assertEqual(ads.find_match(candidate), self.ads_folder + "banner.jpg")
+        self.assertIsNone(ads.find_match(self.inputs[1]))
+
+    def test_only_near_hits_are_confirmed(self):
+        ads = adindex.load(self.ads_folder, self.index_path)
+        for path in self.inputs[1:]:
+            ads.find_match(path)
+        self.assertEqual(ads.confirm_count, 0)
+
+    def test_index_is_rebuilt_only_when_folder_changes(self):
+        adindex.load(self.ads_folder, self.index_path)
+        with mock.patch.object(adindex, "difference_hash", wraps=adindex.difference_hash) as difference_hash:
+            self.assertEqual(len(adindex.load(self.ads_folder, self.index_path)), 1)
+            self.assertEqual(difference_hash.call_count, 0)
+
+            shutil.copy(self.inputs[1], self.ads_folder + "another-banner.jpg")
+            self.assertEqual(len(adindex.load(self.ads_folder, self.index_path)), 2)
+            self.assertEqual(difference_hash.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
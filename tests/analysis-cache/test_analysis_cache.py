@@ -0,0 +1,70 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy
+
+import tests
+from comiccompiler import analysiscache
+from comiccompiler import compiler
+from comiccompiler import rowstats
+
+
+class AnalysisCacheTests(tests.ComicomTestCase):
+    def setUp(self):
+        self.cache_directory = tempfile.mkdtemp(prefix="comicom-cache-test")
+        self.setup_test_vars("breakpoint-buffer", "Compiled-bb20")
+        self.args.min_height_per_page = 100
+        self.args.breakpoint_detection_mode = 1
+        self.args.breakpoint_buffer = "20px"
+        self.args.no_cache = False
+        self.args.cache_dir = self.cache_directory
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_directory)
+
+    def compile_and_count_analysis(self):
+        with mock.patch.object(rowstats, "calculate", wraps=rowstats.calculate) as calculate:
+            compiler.run(self.args)
+        pages = {}
+        for path in self.get_actual_files():
+            with open(path, 'rb') as file:
+                pages[os.path.basename(path)] = file.read()
+        return calculate.call_count, pages
+
+    def test_warm_run_skips_analysis(self):
+        (cold_analysis_count, cold_pages) = self.compile_and_count_analysis()
+        (warm_analysis_count, warm_pages) = self.compile_and_count_analysis()
+        self.assertGreater(cold_analysis_count, 0)
+        self.assertEqual(warm_analysis_count, 0)
+        self.assertEqual(warm_pages, cold_pages)
+
+    def test_changed_parameters_miss(self):
+        self.compile_and_count_analysis()
+        self.args.output_file_width = 300
+        (analysis_count, _) = self.compile_and_count_analysis()
+        self.assertGreater(analysis_count, 0)
+
+    def test_evicts_least_recently_used(self):
+        cache = analysiscache.AnalysisCache(self.cache_directory, 0)
+        profile = rowstats.calculate(numpy.zeros((4, 3, 3), dtype=numpy.uint8))
+        cache.store("older", profile)
+        cache.store("newer", profile)
+        os.utime(os.path.join(self.cache_directory, "older.npz"), (0, 0))
+        cache.max_bytes = os.path.getsize(os.path.join(self.cache_directory, "newer.npz"))
+        cache.evict()
+        self.assertIsNone(cache.load("older"))
+        self.assertEqual(cache.load("newer").height(), 4)
+
+    def test_unreadable_entry_is_a_miss(self):
+        cache = analysiscache.AnalysisCache(self.cache_directory, 1024 * 1024)
+        with open(os.path.join(self.cache_directory, "broken.npz"), 'wb') as file:
+            file.write(b"not a cache entry")
+        self.assertIsNone(cache.load("broken"))
+        self.assertFalse(os.path.exists(os.path.join(self.cache_directory, "broken.npz")))
+
+
+if __name__ == '__main__':
+    unittest.main()
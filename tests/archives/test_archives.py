@@ -0,0 +1,88 @@
+import glob
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+import tests
+from comiccompiler import archives
+from comiccompiler import compiler
+from comiccompiler import manifest
+from comiccompiler import profiler
+
+
+class ArchiveTests(tests.ComicomTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="comicom-archive-test")
+        self.setup_test_vars("default", "Compiled-defaults")
+        self.source_files = sorted(glob.glob(self.base_path + "input/*.jpg"))[:12]
+        self.archive_path = self.directory + os.sep + "chapter.cbz"
+        # Stored out of order and under a folder, with a file that isn't a page
+        with zipfile.ZipFile(self.archive_path, 'w') as archive:
+            for path in reversed(self.source_files):
+                archive.write(path, "chapter/" + os.path.basename(path).replace("image", "image-"))
+            archive.writestr("ComicInfo.xml", "<ComicInfo/>")
+        self.args.rebuild = True
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_members_are_globbed_in_natural_order(self):
+        paths = archives.glob_files(self.archive_path + "/*.jpg")
+        self.assertEqual(list(map(lambda path: path.split("-")[-1], paths)),
+                         list(map(lambda path: os.path.basename(path).replace("image", ""), self.source_files)))
+        self.assertEqual(len(archives.glob_files(self.archive_path)), len(self.source_files) + 1)
+        self.assertEqual(archives.split_member_path(paths[0]), (self.archive_path, "chapter/image-000.jpg"))
+
+    def test_compile_archive_to_archive(self):
+        self.args.input_files = self.source_files
+        self.args.output_directory = self.directory + os.sep + "Compiled" + os.sep
+        compiler.run(self.args)
+        expected_pages = sorted(glob.glob(self.args.output_directory + "page*.jpg"))
+
+        self.args.input_files = [self.archive_path + "/*.jpg"]
+        self.args.output_directory = self.directory + os.sep + "pages.cbz"
+        # Pages encoded by worker processes come back to be added to the archive in order
+        self.args.jobs = 2
+        compiler.run(self.args)
+
+        self.assertFalse(os.path.exists(self.directory + os.sep + "Compiled" + os.sep + "pages.cbz"))
+        with zipfile.ZipFile(self.args.output_directory) as archive:
+            names = archive.namelist()
+            self.assertEqual(names, list(map(os.path.basename, expected_pages)) + [manifest.manifest_file])
+            for (name, expected_page) in zip(names, expected_pages):
+                with open(expected_page, 'rb') as file:
+                    self.assertEqual(archive.read(name), file.read(), name)
+            description = json.loads(archive.read(manifest.manifest_file))
+        self.assertEqual(description["images"][0]["path"], self.archive_path + "/chapter/image-000.jpg")
+        # No temporary archive is left behind
+        self.assertEqual(sorted(os.listdir(self.directory)), ["Compiled", "chapter.cbz", "pages.cbz"])
+
+    @unittest.skipIf(os.name == "nt", "Windows only has a read-only flag")
+    def test_archive_permissions_follow_umask(self):
+        umask = os.umask(0)
+        os.umask(umask)
+        self.assertEqual(archives.file_mode, 0o666 & ~umask)
+
+        writer = archives.ArchiveWriter(self.directory + os.sep + "pages.cbz")
+        writer.write("page001.jpg", b"page")
+        writer.close()
+        self.assertEqual(os.stat(self.directory + os.sep + "pages.cbz").st_mode & 0o777, archives.file_mode)
+
+    def test_profile_saved_next_to_archive(self):
+        self.args.input_files = [self.archive_path + "/*.jpg"]
+        self.args.output_directory = self.directory + os.sep + "pages.cbz"
+        self.args.profile = True
+        try:
+            compiler.run(self.args)
+        finally:
+            profiler.disable()
+
+        with open(self.directory + os.sep + "pages-" + compiler.profile_file, 'r', encoding="utf-8") as file:
+            self.assertIn("write pages", json.load(file)["spans"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+from PIL import Image
+
+from benchmarks import strips
+from benchmarks import suite
+
+
+class BenchmarkTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="comicom-benchmark-test")
+        self.settings = strips.StripSettings(width=200, image_count=4, image_height=600, gutter_spacing=500,
+                                             gutter_height=40, noise=8)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_generated_strip(self):
+        paths = strips.generate(self.settings, self.directory)
+        self.assertEqual(len(paths), 4)
+        white_rows = 0
+        for path in paths:
+            with Image.open(path) as image:
+                self.assertEqual(image.size, (200, 600))
+                pixels = numpy.asarray(image.convert("L"))
+            white_rows += numpy.count_nonzero(pixels.min(axis=1) > 250)
+        # Roughly one gutter every gutter_spacing rows
+        self.assertGreater(white_rows, 40 * 2)
+        self.assertLess(white_rows, 4 * 600 / 2)
+
+    def test_run_case_times_each_stage(self):
+        strips.generate(self.settings, self.directory + os.sep + "input")
+        result = suite.run_case(self.directory + os.sep + "input", self.directory + os.sep + "output", "dynamic")
+        self.assertEqual(list(result["stages"].keys()), list(map(lambda stage: stage[0], suite.stages)))
+        self.assertGreater(result["page_count"], 0)
+        self.assertGreater(result["stages"]["analyse"], 0)
+        self.assertLessEqual(sum(result["stages"].values()), result["total_seconds"])
+
+    def test_compare_flags_regressions(self):
+        baseline = {"cases": {"static": {"total_seconds": 2.0, "stages": {"plan": 1.0, "render": 0.01},
+                                         "peak_rss_mb": 100, "subprocess_count": 0}}}
+        results = {"cases": {"static": {"total_seconds": 2.1, "stages": {"plan": 1.5, "render": 0.02},
+                                        "peak_rss_mb": 100, "subprocess_count": 3}}}
+        regressions = suite.compare(baseline, results, 0.15)
+        self.assertEqual(list(map(lambda regression: regression["metric"], regressions)),
+                         ["stages.plan", "subprocess_count"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import unittest
+
+import numpy
+from PIL import Image
+
+from comiccompiler import compiler
+from comiccompiler import entities
+from comiccompiler import gutters
+from comiccompiler import imgmag
+from comiccompiler import rowstats
+
+
+def _strip_with_gutter(gutter_start, gutter_end, height=400, width=120, gutters_after=(), batch_index=0):
+    pixels = numpy.random.default_rng(0).integers(20, 230, size=(height, width, 3), dtype=numpy.uint8)
+    for (start, end) in ((gutter_start, gutter_end),) + tuple(gutters_after):
+        pixels[start:end + 1] = 255
+    image = entities.InputImage("synthetic{index}.png".format(index=batch_index), width, height, batch_index)
+    image.row_profile = rowstats.from_image(Image.fromarray(pixels))
+    return image
+
+
+class BreakpointScanTests(unittest.TestCase):
+    def test_runs(self):
+        (starts, ends) = rowstats.find_runs(numpy.array([True, False, False, True, True, False, True]))
+        self.assertEqual(list(starts), [0, 3, 6])
+        self.assertEqual(list(ends), [0, 4, 6])
+
+    def test_exact_finds_thin_gutter(self):
+        image = _strip_with_gutter(203, 205)
+        self.assertEqual(imgmag.find_exact_rows_of_colour(image, 100, 400, [0, 65535], 0, 0), [203, 205])
+        self.assertEqual(imgmag.find_consecutive_rows_of_colour(image, 100, 200, 10, 400, [0, 65535], 0, 0),
+                         [-1, -1])
+
+    def test_exact_starts_at_offset_inside_gutter(self):
+        image = _strip_with_gutter(150, 260)
+        self.assertEqual(imgmag.find_exact_rows_of_colour(image, 170, 400, [0, 65535], 0, 0), [170, 260])
+
+    def test_exact_respects_max_range(self):
+        image = _strip_with_gutter(150, 260)
+        self.assertEqual(imgmag.find_exact_rows_of_colour(image, 0, 20, [0, 65535], 0, 0), [150, 170])
+
+    def test_exact_gutter_to_end_of_file(self):
+        image = _strip_with_gutter(350, 399)
+        self.assertEqual(imgmag.find_exact_rows_of_colour(image, 0, 400, [0, 65535], 0, 0), [350, 399])
+
+    def test_exact_without_gutter(self):
+        image = _strip_with_gutter(400, 400)
+        self.assertEqual(imgmag.find_exact_rows_of_colour(image, 0, 400, [0, 65535], 0, 0), [-1, -1])
+
+    def _chapter(self):
+        # The first gutter runs off the bottom of the first image and carries on at the top of the second
+        return [_strip_with_gutter(350, 399),
+                _strip_with_gutter(0, 30, gutters_after=[(200, 210)], batch_index=1),
+                _strip_with_gutter(150, 160, batch_index=2)]
+
+    def test_gutter_index_merges_across_images(self):
+        index = gutters.build(self._chapter(), [0, 65535], 0, 0)
+        self.assertEqual((index.starts, index.ends), ([350, 600, 950], [430, 610, 960]))
+        self.assertEqual(index.next_gutter(360), (360, 430))
+        self.assertEqual(index.next_gutter(431), (600, 610))
+        self.assertIsNone(index.next_gutter(961))
+        self.assertEqual((index.find_image(399), index.find_image(400)), (0, 1))
+
+    def test_pages_break_on_gutters_across_images(self):
+        pages = compiler._combine_images(self._chapter(), "page", 1, ".jpg", 200, 1, "50%", "exact", 10, 20,
+                                         [0, 65535], 0, 0)
+        described = list(map(lambda page: (page.name, [image.batch_index for image in page.images],
+                                           page.crop_from_top, page.crop_from_bottom), pages))
+        # The first break is the middle of the whole gutter rather than of the part in the first image, and the third
+        # image's gutter is left alone because it's in the last image
+        self.assertEqual(described, [("page001.jpg", [0], 0, 10), ("page002.jpg", [0, 1], 390, 195),
+                                     ("page003.jpg", [1, 2], 205, 0)])
+
+    def test_ratio_height_breaks_on_whole_rows(self):
+        # 1:3 of the 120px wide images is 360 rows as a float, which lands inside the first gutter
+        chapter = self._chapter()
+        min_height = compiler._recalculate_height_relative_to_images("1:3", chapter)
+        self.assertIsInstance(min_height, float)
+        pages = compiler._combine_images(chapter, "page", 1, ".jpg", min_height, 1, "20px", "exact", 10, 20,
+                                         [0, 65535], 0, 0)
+        self.assertGreater(len(pages), 1)
+        for page in pages:
+            self.assertIsInstance(page.crop_from_top, int)
+            self.assertIsInstance(page.crop_from_bottom, int)
+        self.assertEqual(sum(map(lambda page: page.calculate_cropped_height(), pages)), 1200)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import glob
+import os
+import unittest
+from unittest import mock
+
+from PIL import Image
+
+import tests
+from comiccompiler import compiler
+from comiccompiler import imagepool
+from comiccompiler import imgmag
+
+
+class ImagePoolTests(unittest.TestCase):
+    def setUp(self):
+        input_path = os.path.join(os.path.dirname(__file__), os.pardir, "breakpoint-buffer", "input")
+        self.paths = sorted(glob.glob(os.path.abspath(input_path) + os.sep + "*.jpg"))[:3]
+
+    def test_reuses_decoded_images(self):
+        pool = imagepool.ImagePool(100 * 1000000)
+        first = pool.get(self.paths[0])
+        self.assertIs(pool.get(self.paths[0]), first)
+        self.assertEqual(pool.decode_count, 1)
+
+    def test_evicts_least_recently_used(self):
+        pool = imagepool.ImagePool(1)
+        for path in self.paths:
+            pool.get(path)
+        # Over budget, only the most recent image is kept
+        self.assertEqual(pool.pixel_count, pool.get(self.paths[-1]).width * pool.get(self.paths[-1]).height)
+        pool.get(self.paths[0])
+        self.assertEqual(pool.decode_count, len(self.paths) + 1)
+
+    def test_resizes_to_width(self):
+        pool = imagepool.ImagePool(100 * 1000000)
+        image = pool.get(self.paths[0], 100)
+        self.assertEqual(image.width, 100)
+        self.assertEqual(image.height, imagepool.get_resized_height(pool.get(self.paths[0]).width,
+                                                                    pool.get(self.paths[0]).height, 100))
+        self.assertEqual(pool.decode_count, 2)
+
+
+class InMemoryResizeTests(tests.ComicomTestCase):
+    def test_resizes_without_temp_files(self):
+        self.setup_test_vars("width-resizing", "Compiled-300px")
+        self.args.output_file_width = 300
+        self.args.jobs = 2
+        with mock.patch.object(imgmag, "resize_width") as resize_width:
+            compiler.run(self.args)
+        resize_width.assert_not_called()
+        self.assertGreater(len(self.get_actual_files()), 0)
+        for path in self.get_actual_files():
+            with Image.open(path) as page:
+                self.assertEqual(page.width, 300)
+
+
+if __name__ == '__main__':
+    unittest.main()
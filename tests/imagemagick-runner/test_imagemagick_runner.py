@@ -0,0 +1,136 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from PIL import Image
+
+from comiccompiler import entities
+from comiccompiler import imgmag
+
+
+class ImageMagickRunnerTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="comicom-runner test")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def record_commands(self, function, *args, **kwargs):
+        commands = []
+
+        def record(arguments):
+            commands.append(arguments)
+            return ""
+
+        with mock.patch.object(imgmag, "_command", side_effect=record):
+            function(*args, **kwargs)
+        return commands
+
+    def test_paths_are_passed_without_quoting(self):
+        path = os.path.join(self.directory, 'a "quoted" name.jpg')
+        commands = self.record_commands(imgmag.combine_vertically, [path], path + ".out.jpg", 100, 50, 10)
+        self.assertEqual(commands, [["magick", "convert", "-append", path, "-colorspace", "sRGB",
+                                     "-crop", "100x50+0+10", "+repage", path + ".out.jpg"]])
+
+    def test_long_appends_are_chunked(self):
+        paths = [os.path.join(self.directory, "slice-{:05d}.png".format(index) * 4) for index in range(3000)]
+        commands = self.record_commands(imgmag.combine_vertically, paths, "page.jpg")
+
+        self.assertGreater(len(commands), 2)
+        for command in commands:
+            self.assertLessEqual(len(" ".join(command)), imgmag.max_command_length + 100)
+        # Every input is appended exactly once, in order, and the page is made from the partial pages
+        appended = [argument for command in commands[:-1] for argument in command[3:-1]]
+        self.assertEqual(list(filter(lambda argument: argument in paths, appended)), paths)
+        self.assertEqual(commands[-1][-1], "page.jpg")
+        self.assertTrue(all(argument.endswith("." + imgmag.intermediate_format) for argument in commands[-1][3:-3]))
+
+    def test_partial_appends_keep_colour(self):
+        paths = [os.path.join(self.directory, "slice-{:05d}.png".format(index) * 4) for index in range(3000)]
+        commands = self.record_commands(imgmag.combine_vertically, paths, "page.jpg")
+
+        self.assertGreater(len(commands), 2)
+        for command in commands:
+            self.assertEqual(command[-3:-1], ["-colorspace", "sRGB"])
+
+    def answer_identify(self, line):
+        # Stands in for 'magick identify', printing the same line for every file sample it was given
+        commands = []
+
+        def identify(arguments):
+            commands.append(arguments)
+            return "".join(line + "\n" for argument in arguments[4:])
+
+        return commands, mock.patch.object(imgmag, "_command", side_effect=identify)
+
+    def test_identify_batch_parses_every_sample(self):
+        (commands, identify) = self.answer_identify("1.4 65534.6")
+        batch = imgmag.IdentifyBatch(["mean", "max"])
+        self.assertEqual((batch.add("a.jpg[0x1+0+0]"), batch.add("b.jpg[0x1+0+5]")), (0, 1))
+        with identify:
+            self.assertEqual(batch.run(), [{"mean": 1, "max": 65535}, {"mean": 1, "max": 65535}])
+        self.assertEqual(commands, [["magick", "identify", "-format", "%[mean] %[max]\\n", "a.jpg[0x1+0+0]",
+                                     "b.jpg[0x1+0+5]"]])
+
+    def test_identify_batch_splits_into_commands(self):
+        (commands, identify) = self.answer_identify("1 2")
+        batch = imgmag.IdentifyBatch(["min", "max"])
+        for index in range(250):
+            batch.add("page.jpg[0x1+0+{index}]".format(index=index))
+        with identify:
+            self.assertEqual(len(batch.run()), 250)
+        self.assertEqual(list(map(lambda command: len(command) - 4, commands)), [100, 100, 50])
+
+    def test_identify_batch_rejects_missing_lines(self):
+        batch = imgmag.IdentifyBatch(["mean"])
+        batch.add("a.jpg")
+        batch.add("b.jpg")
+        with mock.patch.object(imgmag, "_command", return_value="1\n"):
+            self.assertRaises(ValueError, batch.run)
+
+    def test_image_statistics(self):
+        (commands, identify) = self.answer_identify("10 20.2 30")
+        with identify:
+            self.assertEqual(imgmag.get_image_statistics("a.jpg", ["min", "mean", "max"]),
+                             {"min": 10, "mean": 20, "max": 30})
+        self.assertEqual(len(commands), 1)
+
+    def test_sampled_scan_only_checks_the_first_row_of_batches_without_colour(self):
+        # No row is anywhere near black or white, so every batch is ruled out by its first row
+        (commands, identify) = self.answer_identify("30000 10 20000 40000")
+        image = entities.InputImage("page.jpg", 100, 1000, 0)
+        with identify:
+            self.assertEqual(imgmag.find_consecutive_rows_of_colour(image, 0, 200, 10, 20, [0, 65535], 0, 0),
+                             [-1, -1])
+        self.assertEqual(list(map(lambda command: len(command) - 4, commands)), [1] * 5)
+
+    def test_sampled_scan_checks_every_row_of_batches_with_colour(self):
+        (commands, identify) = self.answer_identify("65535 0 65535 65535")
+        image = entities.InputImage("page.jpg", 100, 1000, 0)
+        with identify:
+            self.assertEqual(imgmag.find_consecutive_rows_of_colour(image, 0, 200, 10, 20, [0, 65535], 0, 0),
+                             [0, 20])
+        self.assertEqual(list(map(lambda command: len(command) - 4, commands)), [1, 19])
+
+    @unittest.skipIf(shutil.which("magick") is None, "ImageMagick is required to append images")
+    def test_chunked_append_matches_single_append(self):
+        paths = []
+        for index in range(12):
+            path = os.path.join(self.directory, "slice {}.png".format(index))
+            Image.new("RGB", (20, 5), (index * 20, 0, 0)).save(path)
+            paths.append(path)
+
+        imgmag.combine_vertically(paths, os.path.join(self.directory, "single.png"))
+        with mock.patch.object(imgmag, "max_command_length", len(paths[0]) * 3):
+            imgmag.combine_vertically(paths, os.path.join(self.directory, "chunked.png"))
+
+        with Image.open(os.path.join(self.directory, "chunked.png")) as image:
+            self.assertEqual(image.size, (20, 60))
+        self.assertTrue(imgmag.matches(os.path.join(self.directory, "single.png"),
+                                       os.path.join(self.directory, "chunked.png")))
+
+
+if __name__ == '__main__':
+    unittest.main()
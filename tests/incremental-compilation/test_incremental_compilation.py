@@ -0,0 +1,89 @@
+import collections
+import glob
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from PIL import Image
+
+import tests
+from comiccompiler import compiler
+from comiccompiler import manifest
+
+
+class IncrementalCompilationTests(tests.ComicomTestCase):
+    def setUp(self):
+        self.input_directory = tempfile.mkdtemp(prefix="comicom-incremental-test")
+        self.setup_test_vars("default", "Compiled-defaults")
+        self.source_files = sorted(glob.glob(self.base_path + "input/*.jpg"))
+        self.args.input_files = [self.input_directory + os.sep + "*.jpg"]
+        self.args.output_directory = self.input_directory + os.sep + "Compiled" + os.sep
+        self.args.rebuild = False
+
+    def tearDown(self):
+        shutil.rmtree(self.input_directory)
+
+    def copy_inputs(self, count):
+        for path in self.source_files[:count]:
+            shutil.copy2(path, self.input_directory)
+
+    def compile_and_count_writes(self):
+        writes = collections.Counter()
+        save = Image.Image.save
+
+        def counting_save(image, fp, *args, **kwargs):
+            writes[os.path.basename(str(fp))] += 1
+            return save(image, fp, *args, **kwargs)
+
+        with mock.patch.object(Image.Image, "save", autospec=True, side_effect=counting_save):
+            compiler.run(self.args)
+        return writes
+
+    def read_manifest(self):
+        with open(self.args.output_directory + manifest.manifest_file, 'r', encoding="utf-8") as file:
+            return json.load(file)
+
+    def test_unchanged_compilation_writes_nothing(self):
+        self.copy_inputs(len(self.source_files))
+        first_writes = self.compile_and_count_writes()
+        self.assertEqual(len(first_writes), len(self.read_manifest()["pages"]))
+        self.assertEqual(len(self.compile_and_count_writes()), 0)
+
+    def test_appended_images_only_write_the_end(self):
+        self.copy_inputs(len(self.source_files) - 10)
+        first_writes = self.compile_and_count_writes()
+        first_manifest = self.read_manifest()
+
+        self.copy_inputs(len(self.source_files))
+        writes = self.compile_and_count_writes()
+        pages = self.read_manifest()["pages"]
+        self.assertLessEqual(len(writes), len(pages) - len(first_writes) + 2)
+        for (first_page, page) in zip(first_manifest["pages"], pages):
+            if page["name"] not in writes:
+                self.assertEqual(page["checksum"], first_page["checksum"])
+
+    def test_edited_page_is_written_again(self):
+        self.copy_inputs(10)
+        self.compile_and_count_writes()
+        edited_page = self.read_manifest()["pages"][0]["name"]
+        with open(self.args.output_directory + edited_page, 'ab') as file:
+            file.write(b"edited")
+        self.assertEqual(list(self.compile_and_count_writes().keys()), [edited_page])
+
+    def test_clean_keeps_unchanged_pages(self):
+        self.copy_inputs(10)
+        self.compile_and_count_writes()
+        stray_file = self.args.output_directory + "stray.txt"
+        with open(stray_file, 'w', encoding="utf-8") as file:
+            file.write("stray")
+        self.args.clean = True
+        self.assertEqual(len(self.compile_and_count_writes()), 0)
+        self.assertFalse(os.path.exists(stray_file))
+        self.assertEqual(len(glob.glob(self.args.output_directory + "*.jpg")), len(self.read_manifest()["pages"]))
+
+
+if __name__ == '__main__':
+    unittest.main()
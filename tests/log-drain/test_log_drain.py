@@ -0,0 +1,94 @@
+import queue
+import types
+import unittest
+
+from comiccompiler import comgui
+from comiccompiler import logger
+
+
+class StubText:
+    # Just enough of tk.Text for the log, without needing a display: the content is one string, and indexes are
+    # 'line.column' with lines counted from 1
+    def __init__(self):
+        self.content = ""
+        self.state = 'disabled'
+
+    def configure(self, state):
+        self.state = state
+
+    def insert(self, index, text):
+        assert index == 'end' and self.state == 'normal'
+        self.content += text
+
+    def delete(self, start, end):
+        assert self.state == 'normal'
+        self.content = self.content[:self._get_offset(start)] + self.content[self._get_offset(end):]
+
+    def index(self, index):
+        before = self.content[:self._get_offset(index)]
+        return "{line}.{column}".format(line=before.count("\n") + 1, column=len(before) - before.rfind("\n") - 1)
+
+    def see(self, index):
+        pass
+
+    def _get_offset(self, index):
+        if index in ['end', 'end-1c']:
+            return len(self.content)
+        if index == 'end-1c linestart':
+            return self.content.rfind("\n") + 1
+        (line, column) = map(int, index.split("."))
+        return len("".join(self.content.splitlines(True)[:line - 1])) + column
+
+
+class LogDrainTests(unittest.TestCase):
+    def setUp(self):
+        self.pending = queue.Queue()
+        self.redirector = comgui.StdoutRedirector(self.pending)
+
+    def test_text_is_batched_around_calls(self):
+        calls = []
+        for text in ["a", "b"]:
+            self.redirector.write(text)
+        self.pending.put(("progress", ("Loading", 1, 10)))
+        self.pending.put(("call", calls.append))
+        self.pending.put(("progress", ("Loading", 2, 10)))
+        self.redirector.write("c")
+
+        (steps, progress) = comgui.take_pending(self.pending)
+        self.assertEqual(steps, [("text", "ab"), ("call", calls.append), ("text", "c")])
+        self.assertEqual(progress, ("Loading", 2, 10))
+        self.assertTrue(self.pending.empty())
+
+    def test_drain_is_capped(self):
+        for number in range(5):
+            self.redirector.write(str(number))
+        self.assertEqual(comgui.take_pending(self.pending, 3), ([("text", "012")], None))
+        self.assertEqual(comgui.take_pending(self.pending, 3), ([("text", "34")], None))
+
+    def test_inline_messages_replace_last_line(self):
+        terminal = StubText()
+        comgui.write_log(terminal, "Starting\nLoaded 1 images.")
+        comgui.write_log(terminal, logger.delete_line_string + "Loaded 2 images."
+                         + logger.delete_line_string + "Loaded 3 images.\nDone\n")
+        self.assertEqual(terminal.content, "Starting\nLoaded 3 images.\nDone\n")
+        self.assertEqual(terminal.state, 'disabled')
+
+    def test_old_lines_are_dropped(self):
+        terminal = StubText()
+        comgui.write_log(terminal, "".join(map(lambda number: "{number}\n".format(number=number),
+                                               range(comgui.MAX_LOG_LINES + 1000))))
+        self.assertEqual(terminal.index('end-1c'), "{line}.0".format(line=comgui.MAX_LOG_LINES))
+        self.assertTrue(terminal.content.startswith("1001\n"))
+        self.assertTrue(terminal.content.endswith("{number}\n".format(number=comgui.MAX_LOG_LINES + 999)))
+
+    def test_drain_is_rescheduled_after_a_failed_call(self):
+        scheduled = []
+        frame = types.SimpleNamespace(pending=self.pending, output_terminal=StubText(),
+                                      after=lambda delay, function: scheduled.append(delay), drain=None)
+        self.pending.put(("call", lambda: 1 / 0))
+        self.assertRaises(ZeroDivisionError, comgui.LoggingFrame.drain, frame)
+        self.assertEqual(scheduled, [comgui.LOG_DRAIN_INTERVAL_MS])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import glob
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from PIL import Image
+
+import tests
+from comiccompiler import compiler
+from comiccompiler import encoders
+from comiccompiler import manifest
+
+
+class OutputEncodingTests(tests.ComicomTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="comicom-encoding-test")
+        self.setup_test_vars("default", "Compiled-defaults")
+        self.args.input_files = sorted(glob.glob(self.base_path + "input/*.jpg"))[:4]
+        self.args.output_directory = self.directory + os.sep + "Compiled" + os.sep
+        self.args.min_height_per_page = "2000px"
+        self.args.rebuild = True
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def compile_pages(self):
+        compiler.run(self.args)
+        with open(self.args.output_directory + manifest.manifest_file, 'r', encoding="utf-8") as file:
+            return json.load(file)["pages"]
+
+    def test_extensions_pick_encoder(self):
+        for (extension, pillow_format) in [(".png", "PNG"), (".webp", "WEBP"), (".avif", "AVIF")]:
+            if not encoders.is_available(extension):
+                continue
+            self.args.extension = extension
+            pages = self.compile_pages()
+            self.assertGreater(len(pages), 0)
+            for page in pages:
+                with Image.open(self.args.output_directory + page["name"]) as image:
+                    self.assertEqual(image.format, pillow_format)
+                self.assertEqual(page["encoding"]["bytes"],
+                                 os.path.getsize(self.args.output_directory + page["name"]))
+                self.assertGreater(page["encoding"]["seconds"], 0)
+
+    def test_quality_and_progressive_jpeg(self):
+        self.args.quality = 95
+        full_quality_bytes = sum(map(lambda page: page["encoding"]["bytes"], self.compile_pages()))
+
+        self.args.quality = 40
+        self.args.progressive = True
+        pages = self.compile_pages()
+        self.assertLess(sum(map(lambda page: page["encoding"]["bytes"], pages)), full_quality_bytes)
+        with Image.open(self.args.output_directory + pages[0]["name"]) as image:
+            self.assertTrue(image.info.get("progressive"))
+
+    def test_settings_fill_in_format_defaults(self):
+        options = {"quality": None, "effort": 9, "subsampling": "4:2:0", "progressive": True}
+        self.assertEqual(encoders.get_settings("page001.jpg", options),
+                         {"format": "jpeg", "quality": 92, "effort": 9, "subsampling": "4:2:0", "progressive": True})
+        # WebP can't change its subsampling, and PNG has no quality
+        self.assertEqual(encoders.get_save_options(encoders.get_settings("page001.webp", options)),
+                         {"quality": 90, "method": 6})
+        self.assertEqual(encoders.get_save_options(encoders.get_settings("page001.png", options)),
+                         {"compress_level": 9, "optimize": True})
+
+    def test_magick_options_are_only_explicit(self):
+        options = {"quality": None, "effort": None, "subsampling": None, "progressive": False}
+        self.assertEqual(encoders.get_magick_options("page001.jpg", options), [])
+        self.assertEqual(encoders.get_magick_options("page001.png", options), [])
+
+        options = {"quality": 80, "effort": 9, "subsampling": "4:2:0", "progressive": True}
+        self.assertEqual(encoders.get_magick_options("page001.jpg", options),
+                         ["-quality", "80", "-sampling-factor", "4:2:0", "-interlace", "JPEG"])
+        self.assertEqual(encoders.get_magick_options("page001.png", options), ["-quality", "95"])
+        self.assertEqual(encoders.get_magick_options("page001.webp", options),
+                         ["-quality", "80", "-define", "webp:method=6"])
+
+
+if __name__ == '__main__':
+    unittest.main()
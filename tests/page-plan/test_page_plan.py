@@ -0,0 +1,89 @@
+import json
+import os
+import unittest
+from unittest import mock
+
+from PIL import Image
+
+import tests
+from comiccompiler import compiler
+
+
+class PagePlanTests(tests.ComicomTestCase):
+    def setUp(self):
+        self.setup_test_vars("breakpoint-buffer", "Compiled-bb20")
+        self.args.min_height_per_page = 100
+        self.args.breakpoint_detection_mode = 1
+        self.args.breakpoint_buffer = "20px"
+        self.plan_file = self.args.output_directory + "plan.json"
+
+    def save_plan(self):
+        compiler.run(self.args)
+        self.args.dry_run = False
+        self.args.save_plan = None
+        self.args.clean = False
+        with open(self.plan_file, 'r', encoding="utf-8") as file:
+            return json.load(file)
+
+    def test_dry_run_writes_no_pages(self):
+        self.args.dry_run = True
+        os.makedirs(self.args.output_directory, exist_ok=True)
+        for file in self.get_actual_files():
+            os.remove(file)
+        self.args.save_plan = self.plan_file
+        plan = self.save_plan()
+        self.assertEqual(len(self.get_actual_files()), 0)
+        self.assertEqual(len(plan["pages"]), len(self.get_expected_files()))
+
+    def test_plan_matches_pages(self):
+        pages = compiler.plan(self.args)
+        self.assertEqual(len(pages), len(self.get_expected_files()))
+        for (page, expected_file) in zip(pages, sorted(self.get_expected_files())):
+            with Image.open(expected_file) as expected:
+                self.assertEqual(page.calculate_cropped_height(), expected.height)
+
+    def test_plan_without_image_magick(self):
+        self.args.backend = "magick"
+        with mock.patch.object(compiler, "_image_magick_available", return_value=False):
+            self.assertEqual(compiler.plan(self.args), [])
+
+    def test_rendering_saved_plan(self):
+        compiler.run(self.args)
+        original_pages = {}
+        for file in self.get_actual_files():
+            with open(file, 'rb') as page_file:
+                original_pages[file] = page_file.read()
+
+        self.args.dry_run = True
+        self.args.save_plan = self.plan_file
+        self.save_plan()
+        # Removed so the pages can only come from rendering the loaded plan
+        for file in original_pages:
+            os.remove(file)
+        self.args.load_plan = self.plan_file
+        self.args.clean = True
+        self.args.rebuild = True
+        compiler.run(self.args)
+
+        self.assertEqual(len(self.get_actual_files()), len(original_pages))
+        self.assertGreater(len(original_pages), 0)
+        for file in self.get_actual_files():
+            with open(file, 'rb') as page_file:
+                self.assertEqual(page_file.read(), original_pages[file], "Re-rendered page differs: " + file)
+
+    def test_rendering_edited_plan(self):
+        self.args.dry_run = True
+        self.args.save_plan = self.plan_file
+        plan = self.save_plan()
+        plan["pages"][0]["crop_from_top"] += 10
+        with open(self.plan_file, 'w', encoding="utf-8") as file:
+            json.dump(plan, file)
+
+        self.args.load_plan = self.plan_file
+        compiler.run(self.args)
+        with Image.open(self.args.output_directory + plan["pages"][0]["name"]) as page:
+            self.assertEqual(page.height, plan["pages"][0]["height"] - 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
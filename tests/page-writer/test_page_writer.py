@@ -0,0 +1,67 @@
+import collections
+import unittest
+from unittest import mock
+
+from PIL import Image
+
+import tests
+from comiccompiler import compiler
+
+
+class PageWriterTests(tests.ComicomTestCase):
+    def compile_and_count_writes(self):
+        writes = collections.Counter()
+        save = Image.Image.save
+
+        def counting_save(image, fp, *args, **kwargs):
+            writes[str(fp)] += 1
+            return save(image, fp, *args, **kwargs)
+
+        # Unchanged pages from an earlier test would otherwise be skipped
+        self.args.rebuild = True
+        with mock.patch.object(Image.Image, "save", autospec=True, side_effect=counting_save):
+            compiler.run(self.args)
+        return writes
+
+    def assert_written_once(self, writes):
+        self.assertEqual(len(writes), len(self.get_actual_files()))
+        for (path, count) in writes.items():
+            self.assertEqual(count, 1, "Output file was written more than once: " + path)
+
+    def test_each_page_written_once(self):
+        self.setup_test_vars("breakpoint-buffer", "Compiled-bb20")
+        self.args.min_height_per_page = 100
+        self.args.breakpoint_detection_mode = 1
+        self.args.breakpoint_buffer = "20px"
+        self.assert_written_once(self.compile_and_count_writes())
+
+    def test_orphan_page_written_once(self):
+        self.setup_test_vars("min-last-page-height", "Compiled-adopt-orphan")
+        self.args.min_height_per_page = 400
+        self.args.min_height_last_page = "400px"
+        writes = self.compile_and_count_writes()
+        self.assert_written_once(writes)
+        self.assertEqual(len(writes), 2)
+
+    def test_parallel_pages_match_serial(self):
+        self.setup_test_vars("breakpoint-detection-mode", "Compiled-b1")
+        self.args.min_height_per_page = 100
+        self.args.breakpoint_detection_mode = 1
+        compiler.run(self.args)
+        serial_pages = self.read_actual_files()
+
+        self.args.jobs = 3
+        self.args.rebuild = True
+        compiler.run(self.args)
+        self.assertEqual(self.read_actual_files(), serial_pages)
+
+    def read_actual_files(self):
+        pages = {}
+        for file in self.get_actual_files():
+            with open(file, 'rb') as page_file:
+                pages[file] = page_file.read()
+        return pages
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import threading
+import time
+import unittest
+
+from comiccompiler import logger
+from comiccompiler import pipeline
+
+
+class PipelineTests(unittest.TestCase):
+    def setUp(self):
+        self.logging_level = logger.logging_level
+        logger.logging_level = 0
+
+    def tearDown(self):
+        logger.logging_level = self.logging_level
+
+    def test_stages_overlap(self):
+        lock = threading.Lock()
+        running = set()
+        overlaps = []
+
+        def timed_stage(name):
+            def run(item):
+                with lock:
+                    running.add(name)
+                    if len(running) > 1:
+                        overlaps.append(item)
+                time.sleep(0.05)
+                with lock:
+                    running.discard(name)
+            return run
+
+        stages = [pipeline.Stage("first", timed_stage("first")), pipeline.Stage("second", timed_stage("second"))]
+        item_pipeline = pipeline.Pipeline(stages)
+        item_pipeline.run(range(4))
+
+        self.assertGreater(len(overlaps), 0)
+        self.assertLess(item_pipeline.elapsed_seconds, 8 * 0.05)
+        self.assertEqual(list(map(lambda stage: stage.processed_count, stages)), [4, 4])
+        self.assertGreater(stages[1].idle_seconds, 0)
+
+    def test_queues_are_bounded(self):
+        lock = threading.Lock()
+        started = []
+        finished = []
+        furthest_ahead = [0]
+
+        def fast(item):
+            with lock:
+                started.append(item)
+                furthest_ahead[0] = max(furthest_ahead[0], len(started) - len(finished))
+
+        def slow(item):
+            time.sleep(0.02)
+            with lock:
+                finished.append(item)
+
+        stages = [pipeline.Stage("fast", fast), pipeline.Stage("slow", slow)]
+        pipeline.Pipeline(stages, queue_size=2).run(range(10))
+
+        # One item being worked on by the slow stage, plus a full queue, plus the one the fast stage is holding
+        self.assertLessEqual(furthest_ahead[0], 4)
+        self.assertEqual(sorted(finished), list(range(10)))
+        self.assertGreater(stages[0].blocked_seconds, 0)
+
+    def test_dropped_items_skip_later_stages(self):
+        compiled = []
+
+        def download(item):
+            if item == 2:
+                raise IOError("download failed")
+            return item != 3
+
+        stages = [pipeline.Stage("download", download, concurrency=2),
+                  pipeline.Stage("compile", compiled.append)]
+        pipeline.Pipeline(stages).run(range(5))
+
+        self.assertEqual(sorted(compiled), [0, 1, 4])
+        self.assertEqual(stages[0].dropped_count, 2)
+        self.assertIn("download", pipeline.Pipeline(stages).get_summary())
+
+
+if __name__ == '__main__':
+    unittest.main()
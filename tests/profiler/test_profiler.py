@@ -0,0 +1,58 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import tests
+from comiccompiler import compiler
+from comiccompiler import manifest
+from comiccompiler import profiler
+
+
+class ProfilerTests(tests.ComicomTestCase):
+    def setUp(self):
+        self.output_directory = tempfile.mkdtemp(prefix="comicom-profiler-test")
+        self.setup_test_vars("default", "Compiled-defaults")
+        self.args.output_directory = self.output_directory + os.sep + "Compiled" + os.sep
+
+    def tearDown(self):
+        profiler.disable()
+        shutil.rmtree(self.output_directory)
+
+    def test_spans_are_not_recorded_unless_enabled(self):
+        profiler.reset()
+        with profiler.span("disabled"):
+            profiler.count_process()
+        self.assertEqual(profiler.describe()["spans"], {})
+        self.assertEqual(profiler.describe()["total"]["processes"], 0)
+
+    def test_nested_spans_are_inclusive(self):
+        profiler.enable()
+        with profiler.span("outer"):
+            for _ in range(3):
+                with profiler.span("inner"):
+                    profiler.count_process()
+        spans = profiler.describe()["spans"]
+        self.assertEqual(spans["inner"]["calls"], 3)
+        self.assertEqual(spans["inner"]["processes"], 3)
+        self.assertEqual(spans["outer"]["processes"], 3)
+        self.assertGreaterEqual(spans["outer"]["wall_seconds"], spans["inner"]["wall_seconds"])
+
+    def test_profile_saved_next_to_pages(self):
+        self.args.profile = True
+        compiler.run(self.args)
+        self.assertFalse(profiler.enabled)
+
+        with open(self.args.output_directory + compiler.profile_file, 'r', encoding="utf-8") as file:
+            profile = json.load(file)
+        for stage in ["load", "normalise", "analyse", "combine", "orphan", "write pages", "manifest"]:
+            self.assertEqual(profile["spans"][stage]["calls"], 1, stage)
+        self.assertGreaterEqual(profile["total"]["wall_seconds"], profile["spans"]["write pages"]["wall_seconds"])
+
+        with open(self.args.output_directory + manifest.manifest_file, 'r', encoding="utf-8") as file:
+            self.assertIn("write pages", json.load(file)["profile"]["spans"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+
+import tests
+from comiccompiler import compiler
+from comiccompiler import logger
+
+
+class ProgressEventTests(tests.ComicomTestCase):
+    def setUp(self):
+        self.output_directory = tempfile.mkdtemp(prefix="comicom-progress-test")
+        self.setup_test_vars("breakpoint-buffer", "Compiled-bb20")
+        self.args.output_directory = self.output_directory + os.sep + "Compiled" + os.sep
+        self.args.min_height_per_page = 100
+        self.args.breakpoint_detection_mode = 1
+        self.events = []
+
+    def tearDown(self):
+        logger.progress_listener = None
+        shutil.rmtree(self.output_directory)
+
+    def compile_with_listener(self):
+        logger.progress_listener = lambda stage, done, total: self.events.append((stage, done, total))
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            compiler.run(self.args)
+        return output.getvalue()
+
+    def test_every_stage_reports_its_way_to_the_end(self):
+        self.compile_with_listener()
+        stages = []
+        for (stage, done, total) in self.events:
+            if stage not in stages:
+                stages.append(stage)
+        self.assertEqual(stages, ["Loading images", "Analysing images", "Planning pages", "Writing pages"])
+        for stage in stages:
+            progress = list(map(lambda event: event[1:], filter(lambda event: event[0] == stage, self.events)))
+            self.assertEqual(progress, sorted(progress))
+            self.assertEqual(progress[-1][0], progress[-1][1])
+        pages = list(filter(lambda name: name.endswith(".jpg"), os.listdir(self.args.output_directory)))
+        self.assertEqual(self.events[-1][1:], (len(pages), len(pages)))
+
+    def test_events_replace_progress_dots(self):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            compiler.run(self.args)
+        self.assertIn("Analysing images.", output.getvalue())
+        self.assertNotIn("Analysing images.", self.compile_with_listener())
@@ -0,0 +1,96 @@
+import glob
+import math
+import os
+import shutil
+import unittest
+
+import numpy
+from PIL import Image
+from PIL import ImageStat
+
+from comiccompiler import imgmag
+from comiccompiler import rowstats
+
+
+# Both backends decode JPEGs with libjpeg, but builds can differ by a level per channel (257 on the 0-65535 scale)
+tolerance = 257
+
+
+@unittest.skipIf(shutil.which("magick") is None, "ImageMagick is required to compare against")
+class RowStatisticsConformanceTests(unittest.TestCase):
+    def assert_matches_identify(self, test_folder, row_step=7):
+        base_path = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, test_folder, "input"))
+        for path in sorted(glob.glob(base_path + os.sep + "*.jpg")):
+            with Image.open(path) as image:
+                width = image.width
+                height = image.height
+            statistics = rowstats.from_file(path)
+            self.assertEqual(statistics.height(), height)
+
+            for row in list(range(0, height, row_step)) + [height - 1]:
+                sample = imgmag.get_file_sample_string(path, width=width, y_offset=row)
+                message = "{path} row {row}".format(path=path, row=row)
+                self.assertAlmostEqual(statistics.mean[row], imgmag.get_image_gray_mean(sample),
+                                       delta=tolerance, msg=message)
+                self.assertAlmostEqual(statistics.standard_deviation[row],
+                                       imgmag.get_image_standard_deviation(sample), delta=tolerance, msg=message)
+                self.assertAlmostEqual(statistics.minimum[row], imgmag.get_image_gray_min(sample),
+                                       delta=tolerance, msg=message)
+                self.assertAlmostEqual(statistics.maximum[row], imgmag.get_image_gray_max(sample),
+                                       delta=tolerance, msg=message)
+                # Within tolerance isn't enough if the two backends disagree on where the breakpoints are
+                self.assertEqual(self.is_breakpoint(statistics.mean[row], statistics.standard_deviation[row]),
+                                 self.is_breakpoint(imgmag.get_image_gray_mean(sample),
+                                                    imgmag.get_image_standard_deviation(sample)), msg=message)
+
+    def is_breakpoint(self, mean, standard_deviation):
+        # The default split colours, error tolerance and standard deviation
+        return round(mean) in [0, 65535] and round(standard_deviation) <= 0
+
+    def test_rgb(self):
+        self.assert_matches_identify("colour-error")
+
+    def test_grayscale(self):
+        self.assert_matches_identify("colour-standard-deviation")
+
+    def test_breakpoint_rows(self):
+        self.assert_matches_identify("breakpoint-buffer", row_step=11)
+
+
+class RowProfileTests(unittest.TestCase):
+    def assert_matches_rows(self, test_folder, row_step=13):
+        # Every row worked out on its own (the way each row used to be sampled), rather than all at once
+        base_path = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, test_folder, "input"))
+        for path in sorted(glob.glob(base_path + os.sep + "*.jpg"))[:3]:
+            profile = rowstats.from_file(path)
+            with Image.open(path) as image:
+                self.assertEqual(profile.height(), image.height)
+                numpy.testing.assert_array_equal(profile.first_row, rowstats.load_pixels(image)[0])
+                numpy.testing.assert_array_equal(profile.last_row, rowstats.load_pixels(image)[-1])
+                for row in list(range(0, image.height, row_step)) + [image.height - 1]:
+                    sample = image.crop((0, row, rowstats.sample_width(image.width), row + 1))
+                    stat = ImageStat.Stat(sample)
+                    # ImageMagick's standard deviation is the sample one, ImageStat's is the population one
+                    correction = math.sqrt(sample.width / (sample.width - 1))
+                    message = "{path} row {row}".format(path=path, row=row)
+                    self.assertAlmostEqual(profile.mean[row], numpy.mean(stat.mean) * rowstats.quantum_scale,
+                                           delta=0.5, msg=message)
+                    self.assertAlmostEqual(profile.standard_deviation[row],
+                                           numpy.mean(stat.stddev) * correction * rowstats.quantum_scale,
+                                           delta=0.5, msg=message)
+                    self.assertEqual(profile.minimum[row],
+                                     min(map(lambda extrema: extrema[0], stat.extrema)) * rowstats.quantum_scale,
+                                     msg=message)
+                    self.assertEqual(profile.maximum[row],
+                                     max(map(lambda extrema: extrema[1], stat.extrema)) * rowstats.quantum_scale,
+                                     msg=message)
+
+    def test_rgb(self):
+        self.assert_matches_rows("colour-error")
+
+    def test_grayscale(self):
+        self.assert_matches_rows("colour-standard-deviation")
+
+
+if __name__ == '__main__':
+    unittest.main()
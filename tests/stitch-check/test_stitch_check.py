@@ -1,7 +1,12 @@
+import json
 import unittest
-import tests
 
+import numpy
+
+import tests
 from comiccompiler import compiler
+from comiccompiler import manifest
+from comiccompiler import rowstats
 
 
 class StitchCheckTests(tests.ComicomTestCase):
@@ -37,6 +42,37 @@ class StitchCheckTests(tests.ComicomTestCase):
         compiler.run(self.args)
         self.compare_output()
 
+    def test_seam_scores_in_manifest(self):
+        self.setup_test_vars("stitch-check", "Compiled-default")
+        self.args.enable_stitch_check = True
+        compiler.run(self.args)
+        with open(self.args.output_directory + manifest.manifest_file, 'r', encoding="utf-8") as file:
+            seams = json.load(file)["seams"]
+        self.assertEqual(list(map(lambda seam: seam["images"], seams)), [[0, 1], [1, 2]])
+        for seam in seams:
+            self.assertLess(seam["score"], self.args.stitch_threshold)
+
+    def test_stitch_threshold(self):
+        # A seam that passes at the default threshold (scoring about 0.03) fails once the threshold is below it
+        self.setup_test_vars("stitch-check", "Compiled-no-result")
+        self.args.enable_stitch_check = True
+        self.args.input_files = [self.base_path + "input/image000.jpg", self.base_path + "input/image001.jpg"]
+        self.assertGreater(len(compiler.plan(self.args)), 0)
+
+        self.args.stitch_threshold = 0.01
+        self.assertEqual(compiler.plan(self.args), [])
+
+    def test_seam_scores(self):
+        rows = numpy.random.default_rng(0).integers(0, 256, size=(3, 50, 3), dtype=numpy.uint8)
+        gray_row = rows[0, :, :1]
+        scores = rowstats.seam_scores([rows[0], rows[1], gray_row, rows[2][:40]],
+                                      [rows[0], rows[2], gray_row, rows[1]])
+        self.assertEqual(scores[0], 0)
+        expected = numpy.sqrt(numpy.mean(numpy.square(rows[1][:49].astype(float) - rows[2][:49]))) / 255
+        self.assertAlmostEqual(scores[1], expected)
+        self.assertEqual(scores[2], 0)
+        self.assertEqual(scores[3], numpy.inf)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,82 @@
+import glob
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+from PIL import Image
+
+import tests
+from comiccompiler import compiler
+from comiccompiler import render
+
+
+class TallPageTests(tests.ComicomTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="comicom-tall-pages-test")
+        self.setup_test_vars("default", "Compiled-defaults")
+        self.args.input_files = [self.directory + os.sep + "input" + os.sep + "*.jpg"]
+        self.args.output_directory = self.directory + os.sep + "Compiled" + os.sep
+        self.args.min_height_per_page = "100%"
+        self.args.rebuild = True
+
+        # Two halves of one 80000 row strip, grey noise with a single white gutter at rows 50000-50200
+        rng = numpy.random.default_rng(0)
+        strip = rng.integers(0, 200, size=(80000, 64), dtype=numpy.uint8)
+        strip[50000:50200] = 255
+        os.mkdir(self.directory + os.sep + "input")
+        for (index, rows) in enumerate([strip[:40000], strip[40000:]]):
+            Image.fromarray(rows).convert("RGB").save(self.directory + os.sep + "input" + os.sep
+                                                      + "image{:03d}.jpg".format(index), quality=95)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def get_page_heights(self):
+        heights = []
+        for path in sorted(glob.glob(self.args.output_directory + "page*")):
+            with Image.open(path) as page:
+                heights.append((os.path.basename(path), page.height))
+        return heights
+
+    def test_split_at_gutter(self):
+        compiler.run(self.args)
+        heights = self.get_page_heights()
+        self.assertEqual(list(map(lambda height: height[0], heights)), ["page001.jpg", "page002.jpg"])
+        self.assertLessEqual(heights[0][1], render.get_max_page_height(".jpg"))
+        self.assertGreaterEqual(heights[0][1], 50000)
+        self.assertLessEqual(heights[0][1], 50200)
+        self.assertEqual(heights[0][1] + heights[1][1], 80000)
+
+    def test_png_pages_are_streamed(self):
+        self.args.tall_pages = "png"
+        compiler.run(self.args)
+        self.assertEqual(self.get_page_heights(), [("page001.png", 80000)])
+
+        inputs = []
+        for path in sorted(glob.glob(self.args.input_files[0])):
+            with Image.open(path) as image:
+                inputs.append(numpy.asarray(image.convert("RGB")))
+        with Image.open(self.args.output_directory + "page001.png") as page:
+            numpy.testing.assert_array_equal(numpy.asarray(page), numpy.concatenate(inputs))
+
+    def test_loaded_plan_is_split(self):
+        # Planned as a single PNG page, then rendered from the plan as JPEG
+        self.args.tall_pages = "png"
+        self.args.dry_run = True
+        self.args.save_plan = self.directory + os.sep + "plan.json"
+        compiler.run(self.args)
+
+        self.args.tall_pages = "split"
+        self.args.dry_run = False
+        self.args.load_plan = self.args.save_plan
+        self.args.save_plan = None
+        compiler.run(self.args)
+        max_page_height = render.get_max_page_height(".jpg")
+        self.assertEqual(self.get_page_heights(), [("page001.jpg", max_page_height),
+                                                   ("page002.jpg", 80000 - max_page_height)])
+
+
+if __name__ == '__main__':
+    unittest.main()
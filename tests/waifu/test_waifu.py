@@ -0,0 +1,259 @@
+import asyncio
+import io
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import numpy
+from aiohttp import web
+from PIL import Image
+
+from comiccompiler import logger
+from comiccompiler import waifu
+from comiccompiler import waifucache
+
+
+class StubWaifuServer:
+    # Stands in for the Waifu2x API on localhost: every upload is slow, some are rejected with a retryable status, and
+    # the 'upscaled' image served back is just the upload at twice the size
+    def __init__(self, latency=0.05, failures=None, failure_status=503, failure_body=None):
+        self.latency = latency
+        # Upload number -> whether it fails, counted from 1
+        self.failures = failures or (lambda number: False)
+        self.failure_status = failure_status
+        self.failure_body = failure_body
+        self.uploads = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.outputs = {}
+        self._lock = threading.Lock()
+        self._started = threading.Event()
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        self._started.wait(5)
+        return "http://127.0.0.1:{port}/api/waifu2x".format(port=self.port)
+
+    def stop(self):
+        self._loop.call_soon_threadsafe(self._stopping.set)
+        self._thread.join(5)
+
+    def _serve(self):
+        self._loop = asyncio.new_event_loop()
+        self._loop.run_until_complete(self._run())
+
+    async def _run(self):
+        self._stopping = asyncio.Event()
+        app = web.Application()
+        app.router.add_post("/api/waifu2x", self._upload)
+        app.router.add_get("/output/{name}", self._output)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        self._started.set()
+        await self._stopping.wait()
+        await runner.cleanup()
+
+    async def _upload(self, request):
+        with self._lock:
+            self.uploads += 1
+            number = self.uploads
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if request.headers.get("api-key") != "test-key":
+                return web.json_response({"err": "bad key"}, status=401)
+            form = await request.post()
+            await asyncio.sleep(self.latency)
+            if self.failures(number) and self.failure_body is not None:
+                return web.Response(text=self.failure_body, status=self.failure_status)
+            if self.failures(number):
+                return web.json_response({"err": "busy"}, status=self.failure_status)
+
+            image = Image.open(io.BytesIO(form["image"].file.read()))
+            output = io.BytesIO()
+            image.resize((image.width * 2, image.height * 2)).save(output, format="PNG")
+            name = str(number) + ".png"
+            self.outputs[name] = output.getvalue()
+            return web.json_response({"output_url": str(request.url.with_path("/output/" + name))})
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    async def _output(self, request):
+        return web.Response(body=self.outputs[request.match_info["name"]], content_type="image/png")
+
+
+class WaifuTests(unittest.TestCase):
+    def setUp(self):
+        self.logging_level = logger.logging_level
+        logger.logging_level = 0
+        self.directory = tempfile.mkdtemp(prefix="waifu-test")
+        self.sources = []
+        for i in range(8):
+            path = os.path.join(self.directory, "image{i}.png".format(i=i))
+            Image.new("RGB", (20, 10), (i * 30, 0, 0)).save(path)
+            self.sources.append(path)
+        self.targets = list(map(lambda path: path.replace(".png", "-waifud.png"), self.sources))
+
+    def tearDown(self):
+        logger.logging_level = self.logging_level
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def get_cache(self, max_bytes=1024 * 1024):
+        return waifucache.WaifuCache(os.path.join(self.directory, "cache"), max_bytes)
+
+    def upscale(self, server, concurrency=10, max_attempts=5, cache=None):
+        url = server.start()
+        try:
+            client = waifu.WaifuClient("test-key", concurrency, url, max_attempts=max_attempts, backoff_seconds=0.01,
+                                       max_backoff_seconds=0.05, cache=cache)
+            return client.upscale_files(self.sources, self.targets)
+        finally:
+            server.stop()
+
+    def get_tiles(self, results):
+        return [tile for result in results for tile in result["tiles"]]
+
+    def read_file(self, path):
+        with open(path, 'rb') as file:
+            return file.read()
+
+    def test_retries_until_every_file_is_upscaled(self):
+        # Every third upload is rejected, including the retries of earlier ones
+        server = StubWaifuServer(failures=lambda number: number % 3 == 0)
+        results = self.upscale(server)
+
+        self.assertTrue(all(map(lambda result: result["succeeded"], results)))
+        self.assertGreater(sum(map(lambda tile: tile["attempts"], self.get_tiles(results))), 2 * len(self.sources))
+        for (source, target) in zip(self.sources, self.targets):
+            with Image.open(source) as original, Image.open(target) as upscaled:
+                self.assertEqual(upscaled.size, (original.width * 2, original.height * 2))
+        self.assertEqual(list(filter(lambda name: name.endswith(".part"), os.listdir(self.directory))), [])
+
+    def test_concurrency_is_bounded(self):
+        server = StubWaifuServer(latency=0.1)
+        results = self.upscale(server, concurrency=3)
+
+        self.assertTrue(all(map(lambda result: result["succeeded"], results)))
+        self.assertLessEqual(server.max_in_flight, 3)
+        self.assertGreater(server.max_in_flight, 1)
+
+    def test_rate_limiting_is_retried(self):
+        server = StubWaifuServer(failures=lambda number: number <= 4, failure_status=429)
+        results = self.upscale(server)
+
+        self.assertTrue(all(map(lambda result: result["succeeded"], results)))
+        self.assertEqual(server.uploads, len(self.sources) + 4)
+
+    def test_client_errors_are_not_retried(self):
+        server = StubWaifuServer(failures=lambda number: True, failure_status=400)
+        results = self.upscale(server)
+
+        self.assertFalse(any(map(lambda result: result["succeeded"], results)))
+        self.assertEqual(server.uploads, len(self.sources))
+        self.assertFalse(any(map(os.path.exists, self.targets)))
+
+    def test_replies_without_output_are_errors(self):
+        for failure_body in [None, "<html>Internal error</html>"]:
+            server = StubWaifuServer(failures=lambda number: True, failure_status=200, failure_body=failure_body)
+            results = self.upscale(server)
+
+            self.assertFalse(any(map(lambda result: result["succeeded"], results)))
+            self.assertEqual(server.uploads, len(self.sources))
+
+    def test_gives_up_after_max_attempts(self):
+        server = StubWaifuServer(failures=lambda number: True)
+        results = self.upscale(server, max_attempts=3)
+
+        self.assertFalse(any(map(lambda result: result["succeeded"], results)))
+        self.assertEqual(list(map(lambda tile: tile["attempts"], self.get_tiles(results))), [3] * len(self.sources))
+
+    def test_cached_results_skip_the_network(self):
+        cache = self.get_cache()
+        self.upscale(StubWaifuServer(), cache=cache)
+        upscaled = self.read_file(self.targets[0])
+        list(map(os.remove, self.targets))
+
+        server = StubWaifuServer()
+        results = self.upscale(server, cache=cache)
+
+        self.assertEqual(server.uploads, 0)
+        self.assertTrue(all(map(lambda result: result["succeeded"], results)))
+        self.assertTrue(all(map(lambda tile: tile["cached"], self.get_tiles(results))))
+        self.assertEqual((cache.hits, cache.misses), (len(self.sources), len(self.sources)))
+        self.assertEqual(self.read_file(self.targets[0]), upscaled)
+
+    def test_repeated_content_is_uploaded_once(self):
+        for source in self.sources[1:]:
+            shutil.copyfile(self.sources[0], source)
+        server = StubWaifuServer()
+        results = self.upscale(server, cache=self.get_cache())
+
+        self.assertEqual(server.uploads, 1)
+        self.assertTrue(all(map(lambda result: result["succeeded"], results)))
+        self.assertEqual(len(list(filter(lambda tile: tile["cached"], self.get_tiles(results)))), len(self.sources) - 1)
+
+    def test_failed_uploads_are_not_cached(self):
+        cache = self.get_cache()
+        self.upscale(StubWaifuServer(failures=lambda number: True, failure_status=400), cache=cache)
+        server = StubWaifuServer()
+        self.upscale(server, cache=cache)
+        self.assertEqual(server.uploads, len(self.sources))
+
+    def test_evicts_least_recently_used(self):
+        cache = self.get_cache()
+        self.upscale(StubWaifuServer(), cache=cache)
+        keys = list(map(lambda source: cache.get_key(self.read_file(source)), self.sources))
+        entries = list(map(lambda key: os.path.join(cache.directory, key + waifucache.entry_extension), keys))
+        os.utime(entries[0], (0, 0))
+        cache.max_bytes = sum(map(os.path.getsize, entries[1:]))
+        cache.evict()
+
+        self.assertIsNone(cache.load(keys[0]))
+        self.assertIsNotNone(cache.load(keys[1]))
+
+    def test_single_tiles_are_written_as_downloaded(self):
+        # JPEGs would lose quality if they were decoded and encoded again
+        for source in self.sources:
+            with Image.open(source) as image:
+                image.save(source.replace(".png", ".jpg"), quality=95)
+        self.sources = list(map(lambda path: path.replace(".png", ".jpg"), self.sources))
+        self.targets = list(map(lambda path: path.replace(".png", ".jpg"), self.targets))
+        server = StubWaifuServer()
+        results = self.upscale(server)
+
+        self.assertTrue(all(map(lambda result: result["succeeded"], results)))
+        self.assertEqual(sorted(map(self.read_file, self.targets)), sorted(server.outputs.values()))
+
+    def test_tall_images_are_tiled_and_reassembled(self):
+        # A smooth gradient, so any seam between the tiles would show up as a jump
+        rows = numpy.linspace(0, 255, 2000, dtype=numpy.float32)
+        gradient = numpy.stack([numpy.tile(rows[:, None], (1, 30))] * 3, axis=2).astype(numpy.uint8)
+        Image.fromarray(gradient).save(self.sources[0])
+        self.sources = self.sources[:1]
+        server = StubWaifuServer()
+        results = self.upscale(server)
+
+        self.assertTrue(results[0]["succeeded"])
+        self.assertEqual(server.uploads, len(waifu.get_tile_tops(2000)))
+        self.assertGreater(server.uploads, 1)
+        with Image.open(self.targets[0]) as upscaled:
+            self.assertEqual(upscaled.size, (60, 4000))
+            self.assertEqual(upscaled.format, "PNG")
+            column = numpy.asarray(upscaled.convert("L"), dtype=numpy.int32)[:, 30]
+        self.assertLessEqual(numpy.abs(numpy.diff(column)).max(), 2)
+
+    def test_tile_tops(self):
+        self.assertEqual(waifu.get_tile_tops(waifu.max_tile_height), [0])
+        for height in [801, 1568, 1569, 5000, 12345]:
+            tops = waifu.get_tile_tops(height)
+            self.assertEqual(tops[0], 0)
+            self.assertEqual(tops[-1] + waifu.max_tile_height, height)
+            for (top, next_top) in zip(tops, tops[1:]):
+                self.assertGreaterEqual(top + waifu.max_tile_height - next_top, waifu.tile_overlap)